@@ -21,9 +21,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import importlib
+import types
+
 # pylint: disable=unused-import
-from prettytensor import funcs
-from prettytensor import train
+from prettytensor import profiler
+from prettytensor import serialization
 from prettytensor.bookkeeper import apply_optimizer
 from prettytensor.bookkeeper import Bookkeeper
 from prettytensor.bookkeeper import create_composite_loss
@@ -41,6 +44,8 @@ from prettytensor.pretty_tensor_class import DIM_REST
 from prettytensor.pretty_tensor_class import DIM_SAME
 from prettytensor.pretty_tensor_class import join_pretty_tensors
 from prettytensor.pretty_tensor_class import Loss
+from prettytensor.pretty_tensor_class import merge_identical_templates
+from prettytensor.pretty_tensor_class import MergeReport
 from prettytensor.pretty_tensor_class import PAD_SAME
 from prettytensor.pretty_tensor_class import PAD_VALID
 from prettytensor.pretty_tensor_class import Phase
@@ -48,11 +53,33 @@ from prettytensor.pretty_tensor_class import PrettyTensor
 from prettytensor.pretty_tensor_class import PrettyTensorTupleMixin
 from prettytensor.pretty_tensor_class import PROVIDED
 from prettytensor.pretty_tensor_class import Register
+from prettytensor.pretty_tensor_class import runtime_phase
 from prettytensor.pretty_tensor_class import RegisterCompoundOp
 from prettytensor.pretty_tensor_class import template
+from prettytensor.pretty_tensor_class import TimeMajorSequence
 from prettytensor.pretty_tensor_class import UnboundVariable
 from prettytensor.pretty_tensor_class import VarStoreMethod
 from prettytensor.pretty_tensor_class import wrap
 from prettytensor.pretty_tensor_class import wrap_sequence
 
+from prettytensor.scopes import capture_stack_traces
 from prettytensor.scopes import make_template
+
+
+class _LazyModule(types.ModuleType):
+  """Stands in for a submodule and imports it when it is first used.
+
+  Importing the submodule replaces this attribute of the package with it.
+  """
+
+  def __getattr__(self, name):
+    return getattr(importlib.import_module(self.__name__), name)
+
+  def __dir__(self):
+    return dir(importlib.import_module(self.__name__))
+
+
+# funcs and train import all of the method modules, so they are only imported
+# when they are used.
+funcs = _LazyModule('prettytensor.funcs')
+train = _LazyModule('prettytensor.train')
@@ -14,6 +14,9 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import weakref
+
+import six
 
 
 class ChainDict(collections.MutableMapping):
@@ -51,3 +54,73 @@ class ChainDict(collections.MutableMapping):
 
   def __len__(self):
     return len(self._full_map())
+
+
+class FrozenChainDict(collections.Mapping):
+  """An immutable dict that is flattened from a parent and some updates.
+
+  Lookups and iteration only touch a single dict, and since it cannot change a
+  reference is a snapshot. Children are interned on their parent while they
+  are in use, so entering the same updates repeatedly returns the same object.
+
+  The root, a FrozenChainDict without a parent such as the global defaults,
+  also supports item assignment.  Its existing children are snapshots and keep
+  the values that they were created with.
+  """
+
+  def __init__(self, parent=None, updates=None):
+    self._map = dict(parent) if parent else {}
+    if updates:
+      self._map.update(updates)
+    self._is_root = parent is None and not updates
+    self._children = weakref.WeakValueDictionary()
+    # Cached by pretty_tensor_class for comparing the defaults of layers.
+    self._structural_key = None
+
+  def child(self, updates):
+    """Returns a FrozenChainDict with updates applied on top of this.
+
+    Args:
+      updates: A mapping of the values to override.
+    Returns:
+      This if updates is empty, otherwise the interned child.
+    """
+    if not updates or updates is self:
+      return self
+    elif not self._map and isinstance(updates, FrozenChainDict):
+      return updates
+    # Values are compared by identity. The child holds the values, so the ids
+    # are not reused while it is cached, and it is dropped when it is unused.
+    key = tuple(sorted((k, id(v)) for k, v in six.iteritems(updates)))
+    result = self._children.get(key)
+    if result is None:
+      result = FrozenChainDict(self, updates)
+      self._children[key] = result
+    return result
+
+  def __getitem__(self, key):
+    return self._map[key]
+
+  def __setitem__(self, key, value):
+    if not self._is_root:
+      raise TypeError('Only the root FrozenChainDict can be changed, use a '
+                      'child instead: %s' % key)
+    self._map[key] = value
+    # The children and the cached key were built from the old values.
+    self._children = weakref.WeakValueDictionary()
+    self._structural_key = None
+
+  def __contains__(self, key):
+    return key in self._map
+
+  def get(self, key, default=None):
+    return self._map.get(key, default)
+
+  def __iter__(self):
+    return iter(self._map)
+
+  def __len__(self):
+    return len(self._map)
+
+  def __repr__(self):
+    return 'FrozenChainDict(%r)' % self._map
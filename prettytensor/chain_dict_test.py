@@ -13,6 +13,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import gc
 import unittest
 
 from prettytensor import chain_dict
@@ -97,5 +98,42 @@ class ChainDictTest(unittest.TestCase):
     # In Python 3, items produces an iterator.
     self.assertEqual(list(d.items()), [('KEY', 'VALUE')])
 
+  def testFrozenChild(self):
+    parent = chain_dict.FrozenChainDict().child({'KEY': 'VALUE'})
+    d = parent.child({'KEY': 'OTHER_VALUE', 'OTHER_KEY': 'YAV'})
+    self.assertEqual([('KEY', 'OTHER_VALUE'), ('OTHER_KEY', 'YAV')],
+                     sorted(d.items()))
+    self.assertEqual([('KEY', 'VALUE')], sorted(parent.items()))
+    self.assertEqual(2, len(d))
+    self.assertNotIn('OTHER_KEY', parent)
+    with self.assertRaises(TypeError):
+      d['KEY'] = 'VALUE'  # pylint: disable=unsupported-assignment-operation
+
+  def testFrozenChildIsInterned(self):
+    value = ['VALUE']
+    parent = chain_dict.FrozenChainDict()
+    d = parent.child({'KEY': value})
+    self.assertIs(d, parent.child({'KEY': value}))
+    self.assertIsNot(d, parent.child({'KEY': ['VALUE']}))
+    self.assertIs(d, d.child({}))
+    self.assertIs(d, parent.child(d))
+
+  def testFrozenChildIsReleased(self):
+    parent = chain_dict.FrozenChainDict()
+    d = parent.child({'KEY': ['VALUE']})
+    self.assertEqual(1, len(parent._children))
+    del d
+    gc.collect()
+    self.assertEqual(0, len(parent._children))
+
+  def testFrozenRootSetItem(self):
+    root = chain_dict.FrozenChainDict()
+    d = root.child({'KEY': 'VALUE'})
+    root['OTHER_KEY'] = 'YAV'
+    self.assertEqual('YAV', root['OTHER_KEY'])
+    # Existing children are snapshots, new ones see the value.
+    self.assertNotIn('OTHER_KEY', d)
+    self.assertEqual('YAV', root.child({'KEY': 'VALUE'})['OTHER_KEY'])
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,238 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Exports lean inference graphs.
+
+A model graph also has summaries, moving average updates, regularization
+losses, the global step and the other parts of training.
+`export_inference_graph` keeps only the ops that the outputs depend on and
+replaces the variables with constants holding their current values:
+
+    with pt.defaults_scope(phase=pt.Phase.infer):
+      output = model_template.construct(input=images)
+    ...
+    output_names = export.export_inference_graph([output], sess,
+                                                 '/tmp/model.pb')
+
+    # In the server:
+    output, = export.load_inference_graph('/tmp/model.pb', sess, output_names)
+
+The file is a plain binary GraphDef, so other tools that read frozen graphs can
+load it too. With `memmapped=True` the weights are instead stored as aligned raw
+arrays after the graph in the same file, with a header that lists them and the
+outputs. They are memory-mapped when loading, so the file is paged in instead
+of parsed, and copied once into variables in the session.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import struct
+
+import numpy
+import tensorflow as tf
+
+from tensorflow.python.framework import tensor_shape
+from tensorflow.python.framework import tensor_util
+
+_VARIABLE_OPS = frozenset(['Variable', 'VariableV2'])
+
+_MEMMAPPED_MAGIC = b'PTMMAP01'
+_HEADER_SIZE = struct.Struct('<Q')
+# The alignment of each array in a memory-mapped file.
+_ALIGNMENT = 64
+# Smaller constants stay in the graph.
+_MIN_MAPPED_BYTES = 1024
+
+
+def _node_name(input_name):
+  """Returns the node of an input, e.g. 'x' for '^x' or 'x:1'."""
+  return input_name.lstrip('^').split(':')[0]
+
+
+def _output_names(outputs):
+  return [tf.convert_to_tensor(x).name for x in outputs]
+
+
+def inference_graph_def(outputs, sess):
+  """Returns a GraphDef with only what outputs need and frozen variables.
+
+  Args:
+    outputs: A list of Tensors or PrettyTensors.
+    sess: The session that holds the values of the variables.
+  Returns:
+    A GraphDef without devices in which every variable is a constant.
+  """
+  output_names = _output_names(outputs)
+  graph_def = sess.graph.as_graph_def()
+  nodes = {node.name: node for node in graph_def.node}
+
+  needed = set()
+  stack = [_node_name(x) for x in output_names]
+  while stack:
+    name = stack.pop()
+    if name not in needed:
+      needed.add(name)
+      stack.extend(_node_name(x) for x in nodes[name].input)
+
+  result = tf.GraphDef()
+  result.versions.CopyFrom(graph_def.versions)
+  # Keep the original order so that inputs come before their uses.
+  kept = [node for node in graph_def.node if node.name in needed]
+  variables = [node.name for node in kept if node.op in _VARIABLE_OPS]
+  values = dict(zip(variables,
+                    sess.run([name + ':0' for name in variables])))
+  for node in kept:
+    new_node = result.node.add()
+    if node.name in values:
+      new_node.op = 'Const'
+      new_node.name = node.name
+      new_node.attr['dtype'].CopyFrom(node.attr['dtype'])
+      new_node.attr['value'].tensor.CopyFrom(
+          tensor_util.make_tensor_proto(values[node.name]))
+    else:
+      new_node.CopyFrom(node)
+      new_node.device = ''
+  return result
+
+
+def _aligned(offset):
+  return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _write_memmapped(graph_def, output_names, filename):
+  """Moves the large constants out of graph_def and writes the file."""
+  arrays = []
+  for node in graph_def.node:
+    if node.op != 'Const':
+      continue
+    value = tensor_util.MakeNdarray(node.attr['value'].tensor)
+    if value.nbytes < _MIN_MAPPED_BYTES:
+      continue
+    arrays.append((node.name, value))
+    # The loader maps a variable onto this placeholder.
+    node.op = 'Placeholder'
+    del node.attr['value']
+    node.attr['shape'].shape.CopyFrom(
+        tensor_shape.TensorShape(value.shape).as_proto())
+
+  graph_bytes = graph_def.SerializeToString()
+  tensors = []
+  offset = _aligned(len(graph_bytes))
+  for name, value in arrays:
+    tensors.append({'name': name,
+                    'dtype': value.dtype.str,
+                    'shape': list(value.shape),
+                    'offset': offset})
+    offset = _aligned(offset + value.nbytes)
+  header = json.dumps({'graph_size': len(graph_bytes),
+                       'outputs': output_names,
+                       'tensors': tensors}).encode('utf-8')
+
+  with open(filename, 'wb') as f:
+    f.write(_MEMMAPPED_MAGIC)
+    f.write(_HEADER_SIZE.pack(len(header)))
+    f.write(header)
+    data_start = _aligned(f.tell())
+    f.write(b'\0' * (data_start - f.tell()))
+    f.write(graph_bytes)
+    for (_, value), tensor in zip(arrays, tensors):
+      f.write(b'\0' * (data_start + tensor['offset'] - f.tell()))
+      f.write(numpy.ascontiguousarray(value).tobytes())
+
+
+def export_inference_graph(outputs, sess, filename, memmapped=False):
+  """Writes the inference graph of outputs to filename.
+
+  Args:
+    outputs: A list of Tensors or PrettyTensors.
+    sess: The session that holds the values of the variables.
+    filename: The file to write.
+    memmapped: If True, the weights are stored so that they can be
+      memory-mapped, otherwise a plain binary GraphDef is written.
+  Returns:
+    The names of the outputs in the exported graph, which are needed to load a
+    plain GraphDef.
+  """
+  output_names = _output_names(outputs)
+  graph_def = inference_graph_def(outputs, sess)
+  if memmapped:
+    _write_memmapped(graph_def, output_names, filename)
+  else:
+    with open(filename, 'wb') as f:
+      f.write(graph_def.SerializeToString())
+  return output_names
+
+
+def _read_graph(filename):
+  """Returns the header, the GraphDef and the offset of the memory-mapped data.
+
+  Args:
+    filename: A file from export_inference_graph.
+  Returns:
+    A tuple of the header dict, the GraphDef and the offset that the tensor
+    offsets are relative to. The header is None and the offset is None if the
+    file is a plain GraphDef.
+  """
+  graph_def = tf.GraphDef()
+  with open(filename, 'rb') as f:
+    if f.read(len(_MEMMAPPED_MAGIC)) != _MEMMAPPED_MAGIC:
+      f.seek(0)
+      graph_def.ParseFromString(f.read())
+      return None, graph_def, None
+    header_size, = _HEADER_SIZE.unpack(f.read(_HEADER_SIZE.size))
+    header = json.loads(f.read(header_size).decode('utf-8'))
+    data_start = _aligned(f.tell())
+    f.seek(data_start)
+    graph_def.ParseFromString(f.read(header['graph_size']))
+  return header, graph_def, data_start
+
+
+def load_inference_graph(filename, sess, output_names=None, name='inference'):
+  """Imports an exported inference graph into the session's graph.
+
+  Args:
+    filename: A file from export_inference_graph.
+    sess: The session to use, memory-mapped weights are loaded into it.
+    output_names: The names returned by export_inference_graph. A memory-mapped
+      file lists its outputs, so they are optional for it.
+    name: The name scope of the imported graph.
+  Returns:
+    The output Tensors in the order of output_names or, if it is not given, in
+    the order they were exported.
+  Raises:
+    ValueError: If output_names is not given for a plain GraphDef.
+  """
+  header, graph_def, data_start = _read_graph(filename)
+  if header is None:
+    if output_names is None:
+      raise ValueError('output_names is required to load a plain GraphDef.')
+    header = {}
+  elif output_names is None:
+    output_names = header['outputs']
+  with sess.graph.as_default():
+    input_map = {}
+    initial_values = []
+    for tensor in header.get('tensors', ()):
+      value = numpy.memmap(filename, dtype=numpy.dtype(tensor['dtype']),
+                           mode='r', offset=data_start + tensor['offset'],
+                           shape=tuple(tensor['shape']))
+      initial_value = tf.placeholder(tf.as_dtype(value.dtype), value.shape)
+      variable = tf.Variable(initial_value, trainable=False, collections=[],
+                             name='%s_memmapped/%s' % (name, tensor['name']))
+      initial_values.append((variable, initial_value, value))
+      input_map[tensor['name'] + ':0'] = variable
+    outputs = tf.import_graph_def(graph_def, input_map=input_map,
+                                  return_elements=output_names,
+                                  name=name)
+    for variable, initial_value, value in initial_values:
+      sess.run(variable.initializer, {initial_value: value})
+  return outputs
@@ -0,0 +1,118 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for exporting inference graphs."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+
+
+import numpy
+from numpy import testing
+import tensorflow as tf
+
+from tensorflow.python.framework import tensor_util
+import prettytensor
+from prettytensor import export
+from prettytensor import pretty_tensor_testing
+
+TOLERANCE = 0.000001
+
+
+class ExportTest(pretty_tensor_testing.PtTestCase):
+
+  def setUp(self):
+    super(self.__class__, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    self.input_data = numpy.random.rand(4, 30).astype(numpy.float32)
+    self.input = tf.placeholder(tf.float32, [None, 30], name='input')
+    with prettytensor.defaults_scope(activation_fn=tf.nn.relu, l2loss=0.01):
+      result = (prettytensor.wrap(self.input).fully_connected(20)
+                .dropout(0.5, phase=prettytensor.Phase.infer)
+                .fully_connected(10))
+    self.output = result.softmax_classifier(
+        10, tf.zeros([4, 10])).softmax
+    self.bookkeeper.add_histogram_summary(self.output, 'output')
+    self.sess.run(tf.initialize_all_variables())
+    self.expected = self.sess.run(self.output, {self.input: self.input_data})
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(self.__class__, self).tearDown()
+
+  def testInferenceGraphDef(self):
+    graph_def = export.inference_graph_def([self.output], self.sess)
+    op_types = {node.op for node in graph_def.node}
+    self.assertNotIn('Variable', op_types)
+    self.assertNotIn('HistogramSummary', op_types)
+    self.assertNotIn('L2Loss', op_types)
+    self.assertFalse([node for node in graph_def.node
+                      if node.name.startswith('global_step')])
+
+  def _CheckRoundTrip(self, memmapped):
+    filename = os.path.join(self.tmp_dir, 'model')
+    output_names = export.export_inference_graph(
+        [self.output], self.sess, filename, memmapped=memmapped)
+    self.assertEqual([self.output.name], output_names)
+    with tf.Graph().as_default(), tf.Session() as sess:
+      # A memory-mapped file lists its outputs.
+      output, = export.load_inference_graph(
+          filename, sess, None if memmapped else output_names)
+      result = sess.run(output, {'inference/input:0': self.input_data})
+    testing.assert_allclose(self.expected, result, rtol=TOLERANCE)
+    return filename
+
+  def testRoundTrip(self):
+    self._CheckRoundTrip(memmapped=False)
+
+  def testPlainGraphDef(self):
+    filename = os.path.join(self.tmp_dir, 'model.pb')
+    output_names = export.export_inference_graph([self.output], self.sess,
+                                                 filename)
+    # Tools that read frozen graphs parse the file as is.
+    graph_def = tf.GraphDef()
+    with open(filename, 'rb') as f:
+      graph_def.ParseFromString(f.read())
+    with tf.Graph().as_default(), tf.Session() as sess:
+      output, = tf.import_graph_def(graph_def, return_elements=output_names,
+                                    name='served')
+      result = sess.run(output, {'served/input:0': self.input_data})
+      testing.assert_allclose(self.expected, result, rtol=TOLERANCE)
+      with self.assertRaises(ValueError):
+        export.load_inference_graph(filename, sess)
+
+  def testMemmappedRoundTrip(self):
+    filename = self._CheckRoundTrip(memmapped=True)
+    with open(filename, 'rb') as f:
+      self.assertEqual(export._MEMMAPPED_MAGIC,
+                       f.read(len(export._MEMMAPPED_MAGIC)))
+    header, graph_def, _ = export._read_graph(filename)
+    # The weights of the first layer are stored after the graph instead of in
+    # a constant.
+    self.assertIn([30, 20], [x['shape'] for x in header['tensors']])
+    placeholders = {node.name for node in graph_def.node
+                    if node.op == 'Placeholder'}
+    self.assertTrue(placeholders.issuperset(
+        x['name'] for x in header['tensors']))
+    for node in graph_def.node:
+      if node.op == 'Const':
+        value = tensor_util.MakeNdarray(node.attr['value'].tensor)
+        self.assertLess(value.nbytes, export._MIN_MAPPED_BYTES)
+    self.assertGreater(os.path.getsize(filename), 30 * 20 * 4)
+
+
+if __name__ == '__main__':
+  unittest.main()
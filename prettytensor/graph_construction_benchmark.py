@@ -0,0 +1,116 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmarks the time it takes to build common networks.
+
+This measures the Python overhead of Pretty Tensor and not the speed of the
+resulting graph, so it only constructs the graphs and reports the wall time and
+the number of ops for each network. The wall time is also reported without
+capturing the stack traces that templates use for error messages:
+
+  python -m prettytensor.graph_construction_benchmark --repeats=5
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+from six.moves import xrange  # pylint: disable=redefined-builtin
+import tensorflow as tf
+
+import prettytensor as pt
+
+tf.app.flags.DEFINE_integer('repeats', 5,
+                            'The number of times to build each network.')
+tf.app.flags.DEFINE_integer('timesteps', 100,
+                            'The number of timesteps of the LSTM.')
+tf.app.flags.DEFINE_integer('nesting', 20,
+                            'The depth of the nested defaults scopes.')
+FLAGS = tf.app.flags.FLAGS
+
+
+def lenet5():
+  """Builds LeNet-5 as in the MNIST tutorial."""
+  images = tf.placeholder(tf.float32, [32, 28, 28, 1])
+  labels = tf.placeholder(tf.float32, [32, 10])
+  with pt.defaults_scope(activation_fn=tf.nn.relu, l2loss=0.00001):
+    pt.wrap(images).conv2d(5, 20).max_pool(2, 2).conv2d(5, 50).max_pool(
+        2, 2).flatten().fully_connected(500).softmax_classifier(10, labels)
+
+
+def stacked_lstm():
+  """Builds a 2 layer LSTM over FLAGS.timesteps timesteps."""
+  inputs = [tf.placeholder(tf.float32, [32, 64])
+            for _ in xrange(FLAGS.timesteps)]
+  pt.wrap_sequence(inputs).sequence_lstm(128).sequence_lstm(128)
+
+
+def inception():
+  """Builds a small inception style network with subdivide."""
+  images = tf.placeholder(tf.float32, [32, 32, 32, 3])
+  seq = pt.wrap(images).sequential()
+  with pt.defaults_scope(activation_fn=tf.nn.relu):
+    seq.conv2d(3, 32)
+    for _ in xrange(4):
+      with seq.subdivide(4) as towers:
+        towers[0].conv2d(1, 16)
+        towers[1].conv2d(1, 16).conv2d(3, 16)
+        towers[2].conv2d(1, 16).conv2d(5, 16)
+        towers[3].max_pool(3, 1).conv2d(1, 16)
+    seq.average_pool(8, 8).flatten().fully_connected(10)
+
+
+def _nested_layers(layer, depth):
+  """Adds 2 layers under each of depth nested defaults scopes."""
+  if not depth:
+    return layer
+  with pt.defaults_scope(l2loss=0.00001 * depth, stddev=0.01):
+    layer = layer.fully_connected(32).fully_connected(32)
+    return _nested_layers(layer, depth - 1)
+
+
+def nested_defaults():
+  """Builds a template with FLAGS.nesting nested scopes and constructs it."""
+  with pt.defaults_scope(activation_fn=tf.nn.relu):
+    template = _nested_layers(pt.template('input'), FLAGS.nesting)
+  template.construct(input=tf.placeholder(tf.float32, [32, 32]))
+
+
+NETWORKS = (('lenet5', lenet5),
+            ('stacked_lstm', stacked_lstm),
+            ('inception', inception),
+            ('nested_defaults', nested_defaults))
+
+
+def benchmark(build, repeats):
+  """Returns the fastest build time in seconds and the number of ops."""
+  times = []
+  for _ in xrange(repeats):
+    with tf.Graph().as_default():
+      start = time.time()
+      build()
+      times.append(time.time() - start)
+      ops = len(tf.get_default_graph().get_operations())
+  return min(times), ops
+
+
+def main(_=None):
+  print('%-16s %10s %14s %8s' % ('network', 'build (s)', 'no trace (s)',
+                                 'ops'))
+  for name, build in NETWORKS:
+    build_time, ops = benchmark(build, FLAGS.repeats)
+    with pt.capture_stack_traces(False):
+      no_trace_time, _ = benchmark(build, FLAGS.repeats)
+    print('%-16s %10.3f %14.3f %8d' % (name, build_time, no_trace_time, ops))
+
+
+if __name__ == '__main__':
+  tf.app.run()
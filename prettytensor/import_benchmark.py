@@ -0,0 +1,108 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmarks the time it takes to import prettytensor.
+
+Each measurement runs in a fresh interpreter after TensorFlow is imported, so
+that only the cost of prettytensor itself is reported:
+
+  python -m prettytensor.import_benchmark --repeats=5
+
+The time of each import statement that loads new modules is also reported,
+including the modules that it imports in turn, so that a submodule or a
+dependency that is imported eagerly shows up.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import subprocess
+import sys
+
+from six.moves import xrange  # pylint: disable=redefined-builtin
+import tensorflow as tf
+
+tf.app.flags.DEFINE_integer('repeats', 5,
+                            'The number of interpreters to time each step in.')
+tf.app.flags.DEFINE_integer('modules', 10,
+                            'The number of slowest module imports to report.')
+FLAGS = tf.app.flags.FLAGS
+
+_SCRIPT = """
+import json
+import sys
+import time
+import tensorflow
+from six.moves import builtins
+
+module_times = {}
+original_import = builtins.__import__
+
+
+def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+  before = set(sys.modules)
+  start = time.time()
+  try:
+    return original_import(name, globals, locals, fromlist, level)
+  finally:
+    elapsed = time.time() - start
+    loaded = set(sys.modules) - before
+    names = [n for n in [name] + ['%s.%s' % (name, x) for x in fromlist or ()]
+             if n in loaded]
+    if loaded:
+      module_times[', '.join(names) or min(loaded, key=len)] = elapsed
+
+builtins.__import__ = timed_import
+start = time.time()
+import prettytensor
+imported = time.time()
+builtins.__import__ = original_import
+prettytensor.PrettyTensor.fully_connected
+print(json.dumps([imported - start, time.time() - imported, module_times]))
+"""
+
+
+def benchmark(repeats):
+  """Returns the fastest times to import, to load the methods and by module.
+
+  Args:
+    repeats: The number of interpreters to time the import in.
+  Returns:
+    A tuple of the import time, the time of the first method lookup and a dict
+    with the time of each import statement that loaded modules, keyed by the
+    modules that it names.
+  """
+  import_times = []
+  method_times = []
+  module_times = {}
+  for _ in xrange(repeats):
+    output = subprocess.check_output([sys.executable, '-c', _SCRIPT])
+    import_time, method_time, times = json.loads(
+        output.decode('utf-8').splitlines()[-1])
+    import_times.append(import_time)
+    method_times.append(method_time)
+    for name, seconds in times.items():
+      module_times[name] = min(seconds, module_times.get(name, seconds))
+  return min(import_times), min(method_times), module_times
+
+
+def main(_=None):
+  import_time, method_time, module_times = benchmark(FLAGS.repeats)
+  print('import prettytensor: %.3fs' % import_time)
+  print('first method lookup: %.3fs' % method_time)
+  print('slowest imports, including the modules they import:')
+  slowest = sorted(module_times.items(), key=lambda x: x[1], reverse=True)
+  for name, seconds in slowest[:FLAGS.modules]:
+    print('  %-50s %.3fs' % (name, seconds))
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -22,10 +22,10 @@ from __future__ import print_function
 import collections
 import contextlib
 import functools
+import importlib
 import inspect
 import itertools
 import operator
-import traceback
 
 import enum
 import six
@@ -33,6 +33,8 @@ from six.moves import xrange  # pylint: disable=redefined-builtin
 from six.moves import zip  # pylint: disable=redefined-builtin
 import tensorflow as tf
 
+from tensorflow.python.client import session as session_lib
+
 from prettytensor import chain_dict
 from prettytensor import bookkeeper
 from prettytensor import scopes
@@ -53,7 +55,7 @@ PROVIDED = None
 _valid_defaults = {'summary_collections',
                    'trainable_variables',
                    'variable_collections'}
-_defaults = {}
+_defaults = chain_dict.FrozenChainDict()
 
 # A constant used to disambiguate None from unspecified in a couple of optional
 # keyword arguments.
@@ -70,6 +72,39 @@ class Phase(enum.Enum):
   infer = 3
 
 
+def runtime_phase(training=True, name='training'):
+  """Returns a boolean Tensor that chooses the phase when the graph is run.
+
+  Methods that take a phase also accept this Tensor, e.g. through
+  `defaults_scope(phase=...)`. They build both behaviors and pick the
+  training one when it is True. This means one graph can be used for training
+  and evaluation instead of building the model once for each phase:
+
+      training = pt.runtime_phase()
+      with pt.defaults_scope(phase=training):
+        result = model(images)
+      ...
+      sess.run(accuracy, {training: False})
+
+  Args:
+    training: The value used when it is not fed.
+    name: The name of the placeholder.
+  Returns:
+    A scalar boolean Tensor that defaults to training and can be fed.
+  """
+  try:
+    return tf.placeholder_with_default(training, [], name=name)
+  except AttributeError:
+    # Older releases do not have placeholder_with_default, but a constant can
+    # also be fed.
+    return tf.constant(training, name=name)
+
+
+def is_runtime_phase(phase):
+  """Returns True if phase is a Tensor from runtime_phase, not a Phase."""
+  return isinstance(phase, (tf.Tensor, tf.Variable))
+
+
 def _set_shape_on_tensor(tensor, shape):
   """Convenience to set a shape or check it."""
   if shape is not None:
@@ -157,14 +192,81 @@ def template(key, books=None, optional=False):
     data = UnboundVariable(key=key, default=None)
   else:
     data = UnboundVariable(key=key)
-  return _DeferredLayer(books, set_input_from_unbound_var, [data], {})
+  return _DeferredLayer(books, set_input_from_unbound_var, [data], {},
+                        description=('template',))
+
+
+class TimeMajorSequence(collections.Sequence):
+  """A sequence of timesteps backed by a single `[time, batch, ...]` Tensor.
+
+  The individual timesteps are only materialized (with a single unpack) when
+  they are first accessed, so operations that work on the whole sequence, e.g.
+  `squash_sequence`, are reshapes instead of a concat of the timesteps.
+  """
+
+  def __init__(self, tensor):
+    """Creates a sequence for the given Tensor.
+
+    Args:
+      tensor: A Tensor with time as the first dimension.
+    Raises:
+      ValueError: If the number of timesteps is not known.
+    """
+    self._tensor = tf.convert_to_tensor(tensor)
+    shape = self._tensor.get_shape()
+    if shape.ndims is None or shape.ndims < 2 or shape[0].value is None:
+      raise ValueError('A time major sequence must have rank >= 2 and a known '
+                       'number of timesteps: %s' % shape)
+    self._length = shape[0].value
+    self._steps = None
+
+  @property
+  def tensor(self):
+    """The `[time, batch, ...]` Tensor."""
+    return self._tensor
+
+  @property
+  def dtype(self):
+    return self._tensor.dtype
+
+  @property
+  def name(self):
+    return self._tensor.name
+
+  def get_shape(self):
+    """Returns the shape of a single timestep."""
+    return self._tensor.get_shape()[1:]
+
+  def _as_graph_element(self):
+    return self._tensor
+
+  def __len__(self):
+    return self._length
+
+  def __getitem__(self, key):
+    if self._steps is None:
+      with self._tensor.graph.as_default():
+        self._steps = tf.unpack(self._tensor, num=self._length)
+    return self._steps[key]
+
+
+def _fetch_time_major_sequence(sequence):
+  """Fetches a TimeMajorSequence as a list of timesteps, like a list."""
+  return [sequence.tensor], lambda values: list(values[0])
+
+
+# Older releases fetch the `[time, batch, ...]` array through
+# `_as_graph_element`, which indexes and iterates the same way.
+if hasattr(session_lib, 'register_session_run_conversion_functions'):
+  session_lib.register_session_run_conversion_functions(
+      TimeMajorSequence, _fetch_time_major_sequence)
 
 
 def wrap_sequence(sequence, books=None, tensor_shape=None):
   """Creates an input layer representing the given sequence of tensors.
 
   Args:
-    sequence: A sequence of tensors.
+    sequence: A sequence of tensors or a TimeMajorSequence.
     books: The bookkeeper.
     tensor_shape: An optional shape that will be set on the Tensor or verified
       to match the tensor.
@@ -173,11 +275,22 @@ def wrap_sequence(sequence, books=None, tensor_shape=None):
   """
   if books is None:
     books = bookkeeper.for_default_graph()
+  if isinstance(sequence, TimeMajorSequence):
+    if tensor_shape is not None:
+      _set_shape_on_tensor(sequence.tensor,
+                           [len(sequence)] + list(tensor_shape))
+    return Layer(books, sequence=sequence, name=sequence.name)
   for t in sequence:
     _set_shape_on_tensor(t, tensor_shape)
   return Layer(books, sequence=sequence, name=sequence[0].name)
 
 
+def _is_tensor_list(arg):
+  """Returns True if arg is a sequence of arguments and not a single value."""
+  return (isinstance(arg, collections.Sequence) and
+          not isinstance(arg, (six.string_types, TimeMajorSequence)))
+
+
 def _assert_value_not_string(name, kwargs):
   if isinstance(kwargs.get(name, None), six.string_types):
     raise ValueError('%s cannot be a string, must be a tuple or list.' % name)
@@ -207,10 +320,16 @@ def defaults_scope(**kwargs):
   _assert_value_not_string('variable_collections', kwargs)
 
   _check_defaults(kwargs)
+  with _scoped_defaults(_defaults.child(kwargs)) as defaults:
+    yield defaults
+
+
+@contextlib.contextmanager
+def _scoped_defaults(new_defaults):
+  """Makes new_defaults, a FrozenChainDict, the defaults in a `with` block."""
   global _defaults
   old_defaults = _defaults
-  _defaults = chain_dict.ChainDict(_defaults)
-  _defaults.update(kwargs)
+  _defaults = new_defaults
 
   # Special logic to support summary_collections.
   # This is added here because introducing more scopes would add more confusion
@@ -228,11 +347,15 @@ def defaults_scope(**kwargs):
 
 def supported_defaults():
   """Returns a set of supported defaults."""
+  _load_method_modules()
   return frozenset(_valid_defaults)
 
 
 def _check_defaults(defaults):
   unused_defaults = set(defaults.keys()) - _valid_defaults
+  # The defaults may belong to methods that are not loaded yet.
+  if unused_defaults and _load_method_modules():
+    unused_defaults = set(defaults.keys()) - _valid_defaults
   if unused_defaults:
     raise ValueError('Unused arguments: %s' % unused_defaults)
 
@@ -277,12 +400,13 @@ def join_pretty_tensors(tensors, output, join_function=None, name='join'):
 
 def _merge_unbound_var_dicts(src, dst):
   """Merges src into dst and throws an exception if a value is incompatible."""
+  # pylint: disable=protected-access
   for k, v in six.iteritems(src):
     if dst.get(k, v) != v:
-      trace1 = ''.join(scopes.skip_common_stack_elements(v.stacktrace, dst[
-          k].stacktrace))
-      trace2 = ''.join(
-          scopes.skip_common_stack_elements(dst[k].stacktrace, v.stacktrace))
+      trace1 = ''.join(scopes.format_stack(
+          scopes.skip_common_stack_elements(v._stack, dst[k]._stack)))
+      trace2 = ''.join(scopes.format_stack(
+          scopes.skip_common_stack_elements(dst[k]._stack, v._stack)))
       raise ValueError('Key conflict: %s\nDefined At:\n%s\nand\n%s' %
                        (k, trace1, trace2))
     else:
@@ -354,6 +478,130 @@ def construct_all(templates, **unbound_var_values):
   return result
 
 
+class MergeReport(object):
+  """Tracks the layers that were merged by merge_identical_templates."""
+
+  def __init__(self):
+    self.merged_layers = 0
+    self.ops_saved = 0
+    self._built = {}
+
+  def _build(self, graph, key, referents, build_fn):
+    """Returns the result for key and only calls build_fn if it is new.
+
+    A result is only reused if building it did not add to any collection, so
+    layers with variables, losses or summaries are never merged.
+
+    Args:
+      graph: The graph that is being built.
+      key: The structural key of the layer.
+      referents: The objects whose ids are in key.
+      build_fn: A function that builds the layer.
+    Returns:
+      The result of build_fn for the first layer with this key.
+    """
+    if key in self._built:
+      result, ops, _ = self._built[key]
+      self.merged_layers += 1
+      self.ops_saved += ops
+      return result
+    collection_sizes = {k: len(graph.get_collection(k))
+                        for k in graph.get_all_collection_keys()}
+    ops = len(graph.get_operations())
+    result = build_fn()
+    ops = len(graph.get_operations()) - ops
+    if all(len(graph.get_collection(k)) == collection_sizes.get(k, 0)
+           for k in graph.get_all_collection_keys()):
+      # The objects are kept alive so that the ids in key are not reused.
+      self._built[key] = (result, ops, referents)
+    return result
+
+
+# The MergeReport of the innermost merge_identical_templates or None.
+_merge_report = None
+
+# The ModelProfile of the innermost profiler.profile or None.
+_model_profile = None
+
+
+def _call_method(method, func, input_layer, args, kwargs):
+  """Calls a registered method's func and profiles it if requested."""
+  if _model_profile is None:
+    return func(input_layer, *args, **kwargs)
+  return _model_profile._call(method, func, input_layer, args, kwargs)
+
+
+@contextlib.contextmanager
+def merge_identical_templates():
+  """Merges identical layers of templates that are constructed in this scope.
+
+  `construct_all` only shares layers that are the same object.  Within this
+  scope, `construct` and `construct_all` also reuse the result of any earlier
+  layer that called the same registered method with the same arguments,
+  defaults and scope, e.g. when the same model code built separate templates.
+  This happens bottom up, so a layer is only merged if its inputs were.
+
+  Layers that create variables, losses, summaries or anything else in a
+  collection are never merged, because that would change the model.
+
+      with pt.merge_identical_templates() as report:
+        a, b = pt.construct_all([template_a, template_b], input=images)
+      print('Saved %d ops' % report.ops_saved)
+
+  Yields:
+    A MergeReport with the number of merged layers and the ops saved.
+  """
+  global _merge_report
+  old_report = _merge_report
+  _merge_report = MergeReport()
+  try:
+    yield _merge_report
+  finally:
+    _merge_report = old_report
+
+
+def _structural_key(value, referents):
+  """Returns a key that is equal for equal values and otherwise uses identity.
+
+  Layers are compared by the tensors that they hold and their defaults.
+
+  Args:
+    value: The value.
+    referents: A list that the objects whose ids are used in the key are
+      appended to; the key is only valid while they are alive.
+  Returns:
+    A hashable key.
+  """
+  if value is None or isinstance(
+      value, (bool, float) + six.integer_types + six.string_types):
+    return (type(value), value)
+  elif isinstance(value, (list, tuple)):
+    return (type(value), tuple(_structural_key(x, referents) for x in value))
+  elif isinstance(value, chain_dict.FrozenChainDict):
+    # Frozen defaults are shared by every layer in a scope, so cache the key.
+    # The values that it refers to live as long as the defaults.
+    if value._structural_key is None:
+      value._structural_key = _structural_key(dict(value), [])
+    referents.append(value)
+    return value._structural_key
+  elif isinstance(value, collections.Mapping):
+    return (dict, tuple(sorted(
+        ((_structural_key(k, referents), _structural_key(v, referents))
+         for k, v in six.iteritems(value)), key=repr)))
+  elif isinstance(value, Layer):
+    if value.is_sequence():
+      contents = value.sequence
+      if not isinstance(contents, TimeMajorSequence):
+        contents = list(contents)
+    else:
+      contents = value.tensor
+    return (Layer, _structural_key(contents, referents),
+            _structural_key(value.defaults, referents))
+  else:
+    referents.append(value)
+    return (object, id(value))
+
+
 class PrettyTensorTupleMixin(object):
   """Adds methods to any sequence type so that it can be used with binding.
 
@@ -509,6 +757,46 @@ class Loss(object):
     return self._name
 
 
+# The modules that register the standard methods. They are imported the first
+# time that a missing public attribute is looked up on a PrettyTensor, so that
+# importing prettytensor does not build every method and its docs.
+_METHOD_MODULES = ('prettytensor.pretty_tensor_image_methods',
+                   'prettytensor.pretty_tensor_loss_methods',
+                   'prettytensor.pretty_tensor_methods',
+                   'prettytensor.pretty_tensor_sparse_methods',
+                   'prettytensor.recurrent_networks')
+_method_modules_loaded = False
+_loading_method_modules = False
+
+
+def _load_method_modules():
+  """Imports the method modules and returns True if this is the first call."""
+  global _method_modules_loaded, _loading_method_modules
+  if _method_modules_loaded:
+    return False
+  # Set first so that lookups while registering do not recurse.
+  _method_modules_loaded = True
+  _loading_method_modules = True
+  try:
+    for module in _METHOD_MODULES:
+      importlib.import_module(module)
+  finally:
+    _loading_method_modules = False
+  _set_defaults_docs()
+  return True
+
+
+class _LazyMethods(type):
+  """Metaclass that loads the method modules for PrettyTensor.<method>."""
+
+  def __getattr__(cls, name):
+    if not name.startswith('_') and _load_method_modules():
+      return getattr(cls, name)
+    raise AttributeError("type object '%s' has no attribute '%s'" %
+                         (cls.__name__, name))
+
+
+@six.add_metaclass(_LazyMethods)
 class PrettyTensor(object):
   """A PrettyTensor is a Tensor with a builder interface facade.
 
@@ -639,6 +927,13 @@ class PrettyTensor(object):
   def __init__(self, books):
     self._bookkeeper = books
 
+  def __getattr__(self, name):
+    # Only called for missing attributes, i.e. methods that are not loaded yet.
+    if not name.startswith('_') and _load_method_modules():
+      return getattr(self, name)
+    raise AttributeError("'%s' object has no attribute '%s'" %
+                         (type(self).__name__, name))
+
   @property
   def layer_parameters(self):
     """Returns a dict of short-parameter name to model parameter.
@@ -657,6 +952,8 @@ class PrettyTensor(object):
 
   def get_shape(self):
     if self.is_sequence():
+      if isinstance(self.sequence, TimeMajorSequence):
+        return self.sequence.get_shape()
       return self.sequence[0].get_shape()
     else:
       return self.tensor.get_shape()
@@ -664,6 +961,8 @@ class PrettyTensor(object):
   @property
   def dtype(self):
     if self.is_sequence():
+      if isinstance(self.sequence, TimeMajorSequence):
+        return self.sequence.dtype
       return self.sequence[0].dtype
     else:
       return self.tensor.dtype
@@ -811,6 +1110,8 @@ class PrettyTensor(object):
     if self.is_sequence():
       if session is None:
         session = tf.get_default_session()
+      if isinstance(self.sequence, TimeMajorSequence):
+        return list(session.run(self.sequence.tensor, feed_dict=feed_dict))
       return session.run(self.sequence, feed_dict=feed_dict)
     else:
       return self.tensor.eval(feed_dict=feed_dict, session=session)
@@ -983,6 +1284,8 @@ class Layer(PrettyTensor):
     if name is None:
       if tensor is not None:
         self._name = self._tensor.op.name
+      elif isinstance(self._sequence, TimeMajorSequence):
+        self._name = self._sequence.tensor.op.name
       else:
         self._name = self._sequence[0].op.name
     else:
@@ -1076,7 +1379,12 @@ class UnboundVariable(object):
     """Inits this with the given key and if specified, a default."""
     self.key = key
     self.default = default
-    self.stacktrace = traceback.format_stack()[:-1]
+    self._stack = scopes.capture_stack(skip=1)
+
+  @property
+  def stacktrace(self):
+    """The formatted stack where this was defined."""
+    return scopes.format_stack(self._stack)
 
   def has_default(self):
     return self.default is not _unspecified
@@ -1093,7 +1401,9 @@ class _DeferredLayer(PrettyTensor):
                defaults=None,
                scope=None,
                pass_through=None,
-               partial_context=None):
+               partial_context=None,
+               method_key=None,
+               description=None):
     """Creates a _DeferredLayer.
 
     This searches all of method_args and method_kwargs (and any sublists or
@@ -1113,6 +1423,12 @@ class _DeferredLayer(PrettyTensor):
       pass_through: Optionally instead of giving method a callable object,
         pass_through can be set in order to construct another layer instead.
       partial_context: A mapping of UnboundVariables to values.
+      method_key: An optional tuple that is structurally the same for layers
+        that call the same method with the same captured state, this allows
+        the layer to be merged by merge_identical_templates.
+      description: An optional tuple that describes how this layer was created
+        for serialization, either `('template',)` for the start of a template
+        or `('method', name, defaults)` for a registered method.
     Raises:
       ValueError: if both method and pass_through are set or neither is set.
     """
@@ -1139,14 +1455,16 @@ class _DeferredLayer(PrettyTensor):
     for k in six.iterkeys(self._partial_context):
       if k.key in self._unbound_vars:
         del self._unbound_vars[k.key]
+    self._construction_cache = None
+    self._method_key = method_key
+    self._description = description
 
   def _merge_all_unbound_vars(self, arg):
     if isinstance(arg, UnboundVariable):
       _merge_unbound_var_dicts({arg.key: arg}, self._unbound_vars)
     elif isinstance(arg, _DeferredLayer):
       _merge_unbound_var_dicts(arg.unbound_vars, self._unbound_vars)
-    elif (isinstance(arg, collections.Sequence) and
-          not isinstance(arg, six.string_types)):
+    elif _is_tensor_list(arg):
       for x in arg:
         self._merge_all_unbound_vars(x)
     elif isinstance(arg, collections.Mapping):
@@ -1180,8 +1498,7 @@ class _DeferredLayer(PrettyTensor):
       return arg._construct(context)
     elif isinstance(arg, tuple):
       return tuple((self._replace_deferred(x, context) for x in arg))
-    elif (isinstance(arg, collections.Sequence) and
-          not isinstance(arg, six.string_types)):
+    elif _is_tensor_list(arg):
       return [self._replace_deferred(x, context) for x in arg]
     elif isinstance(arg, collections.Mapping):
       return {k: self._replace_deferred(v, context)
@@ -1201,6 +1518,18 @@ class _DeferredLayer(PrettyTensor):
     Returns:
       The result of calling the given method on this layer.
     """
+    if self._construction_cache is None:
+      return self._construct_uncached(context)
+    values = tuple(context.get(var) for var in self._construction_vars)
+    key = tuple(id(value) for value in values)
+    if key not in self._construction_cache:
+      # The values are kept so that their ids are not reused.
+      self._construction_cache[key] = (values,
+                                       self._construct_uncached(context))
+    return self._construction_cache[key][1]
+
+  def _construct_uncached(self, context):
+    """Constructs this without the construction cache, see _construct."""
     with self.g.as_default():
       if self._pass_through:
         # pylint: disable=protected-access
@@ -1212,7 +1541,20 @@ class _DeferredLayer(PrettyTensor):
       context[self] = _unspecified
       method_args = self._replace_deferred(self._method_args, context)
       method_kwargs = self._replace_deferred(self._method_kwargs, context)
-      result = self._method(*method_args, **method_kwargs)
+      if _merge_report is not None and self._method_key is not None:
+        # The key is only computed when merging, it is not free.
+        referents = []
+        key = (_structural_key(self._method_key, referents),
+               _structural_key(self._scope, referents),
+               _structural_key(self._defaults, referents),
+               _structural_key(method_args, referents),
+               _structural_key(method_kwargs, referents))
+        # pylint: disable=protected-access
+        result = _merge_report._build(
+            self.g, key, referents,
+            lambda: self._method(*method_args, **method_kwargs))
+      else:
+        result = self._method(*method_args, **method_kwargs)
       _strip_unnecessary_contents_from_stack(result, set())
 
       context[self] = result
@@ -1287,6 +1629,35 @@ class _DeferredLayer(PrettyTensor):
     context.update(self._partial_context)
     return self._construct(context)
 
+  def enable_construction_cache(self):
+    """Reuses the constructed graph when this is built with the same values.
+
+    By default every call to `construct` (or to a function from `as_fn`) builds
+    a new copy of the graph.  With the cache enabled, constructing this
+    template again with the identical values for its unbound variables returns
+    the existing result, also when this is part of a larger template. For
+    example, a tower can be attached to several heads that are built
+    separately without being copied.
+
+    Values are compared by identity and the cache keeps them alive, use
+    `clear_construction_cache` to release them or to force a rebuild.
+
+    Returns:
+      self
+    """
+    if self._construction_cache is None:
+      self._construction_vars = sorted(
+          itertools.chain(six.itervalues(self._unbound_vars),
+                          self._partial_context),
+          key=lambda var: var.key)
+      self._construction_cache = {}
+    return self
+
+  def clear_construction_cache(self):
+    """Drops all of the constructions cached by enable_construction_cache."""
+    if self._construction_cache is not None:
+      self._construction_cache.clear()
+
   def sequential(self):
     """Creates a SequentialLayerBuilder that tracks the most recent tensor."""
     return SequentialLayerBuilder(head=self)
@@ -1359,6 +1730,10 @@ def _strip_unnecessary_contents_from_stack(result, processed):
   # pylint: disable=protected-access
   if isinstance(result, (PrettyTensor, Loss)):
     if result.is_sequence():
+      if isinstance(result.sequence, TimeMajorSequence):
+        _strip_unnecessary_contents_from_stack(result.sequence.tensor,
+                                               processed)
+        return
       for tensor in result.sequence:
         _strip_unnecessary_contents_from_stack(tensor, processed)
         return
@@ -1750,18 +2125,55 @@ def _remove_first_arg_from_doc(func):
       func.__doc__ = func.__doc__[:start] + func.__doc__[end:]
 
 
+# The kinds of arguments for _should_defer.
+_IMMEDIATE_ARG = 0
+_DEFERRED_ARG = 1
+_SEQUENCE_ARG = 2
+_MAPPING_ARG = 3
+
+# The kind of each argument type that has been seen, so that the isinstance
+# checks against the abstract base classes only run once per type.
+_arg_kinds = {type(None): _IMMEDIATE_ARG,
+              bool: _IMMEDIATE_ARG,
+              float: _IMMEDIATE_ARG,
+              tf.Tensor: _IMMEDIATE_ARG,
+              tf.Variable: _IMMEDIATE_ARG}
+for _int_type in six.integer_types:
+  _arg_kinds[_int_type] = _IMMEDIATE_ARG
+for _string_type in six.string_types:
+  _arg_kinds[_string_type] = _IMMEDIATE_ARG
+
+
+def _arg_kind(arg):
+  """Returns whether arg is deferred, may contain deferred values or neither."""
+  arg_type = type(arg)
+  kind = _arg_kinds.get(arg_type)
+  if kind is None:
+    if issubclass(arg_type, (_DeferredLayer, UnboundVariable)):
+      kind = _DEFERRED_ARG
+    elif _is_tensor_list(arg):
+      kind = _SEQUENCE_ARG
+    elif issubclass(arg_type, collections.Mapping):
+      kind = _MAPPING_ARG
+    else:
+      kind = _IMMEDIATE_ARG
+    _arg_kinds[arg_type] = kind
+  return kind
+
+
 def _should_defer(input_layer, args, kwargs):
   """Checks to see if any of the args are templates."""
   for arg in itertools.chain([input_layer], args, six.itervalues(kwargs)):
-    if isinstance(arg, (_DeferredLayer, UnboundVariable)):
+    kind = _arg_kind(arg)
+    if kind == _IMMEDIATE_ARG:
+      continue
+    elif kind == _DEFERRED_ARG:
       return True
-    elif (isinstance(arg, collections.Sequence) and
-          not isinstance(arg, six.string_types)):
+    elif kind == _SEQUENCE_ARG:
       if _should_defer(None, arg, {}):
         return True
-    elif isinstance(arg, collections.Mapping):
-      if _should_defer(None, (), arg):
-        return True
+    elif _should_defer(None, (), arg):
+      return True
   return False
 
 # Remember the original doc so that we can create magic ipython strings.
@@ -1769,6 +2181,22 @@ _original_set_defaults_doc = PrettyTensor.with_defaults.__doc__
 _original_defaults_scope_doc = defaults_scope.__doc__
 _defaults_to_methods = collections.defaultdict(list)
 
+
+def _set_defaults_docs():
+  """Lists the supported defaults in with_defaults and defaults_scope."""
+  default_args = sorted(_valid_defaults)
+  default_values = [None] * len(_valid_defaults)
+  if six.PY2:
+    default_func = PrettyTensor.with_defaults.__func__
+  else:
+    default_func = PrettyTensor.with_defaults
+  _set_ipython_string(default_func, default_args, default_values,
+                      _original_set_defaults_doc)
+  _set_ipython_string(defaults_scope, default_args, default_values,
+                      _original_defaults_scope_doc)
+
+_set_defaults_docs()
+
 # If we are in a method scope, then we don't want to add the full id.
 _in_method_scope = False
 
@@ -1811,17 +2239,11 @@ class _RegisterBase(object):
       self._assign_defaults = assign_defaults
     self._method_name = method_name
     self._overwrite = overwrite
-    _valid_defaults.update(self._assign_defaults)
-    default_args = sorted(_valid_defaults)
-    default_values = [None] * len(_valid_defaults)
-    if six.PY2:
-      default_func = PrettyTensor.with_defaults.__func__
-    else:
-      default_func = PrettyTensor.with_defaults
-    _set_ipython_string(default_func, default_args, default_values,
-                        _original_set_defaults_doc)
-    _set_ipython_string(defaults_scope, default_args, default_values,
-                        _original_defaults_scope_doc)
+    if not _valid_defaults.issuperset(self._assign_defaults):
+      _valid_defaults.update(self._assign_defaults)
+      # The method modules update the docs once after they are all loaded.
+      if not _loading_method_modules:
+        _set_defaults_docs()
 
   def __new__(cls, *args, **kwargs):
     """Supports not including the parens."""
@@ -1835,6 +2257,8 @@ class _RegisterBase(object):
 
   def fill_kwargs(self, input_layer, kwargs):
     """Applies name_suffix and defaults to kwargs and returns the result."""
+    if not self._assign_defaults:
+      return kwargs
     return input_layer._replace_args_with_defaults(_args=self._assign_defaults,
                                                    **kwargs)
 
@@ -1854,6 +2278,7 @@ class _RegisterBase(object):
       argspec = inspect.getargspec(func)
       args = argspec.args[1:]
     name = self._method_name if self._method_name else self._name
+    self._registered_name = name
     method.__module__ = obj.__module__
     method.__name__ = name
     _set_ipython_string(method, args, argspec.defaults, doc)
@@ -1927,9 +2352,11 @@ class Register(_RegisterBase):
 
     def _with_method_complete(*args, **kwargs):
       input_layer = args[0]
-      with input_layer.g.as_default(), defaults_scope(**my_defaults), \
-          tf.name_scope(name):
-        return input_layer._method_complete(func(*args, **kwargs))
+      # my_defaults is immutable, so it is reused instead of copied.
+      with input_layer.g.as_default(), \
+          _scoped_defaults(_defaults.child(my_defaults)), tf.name_scope(name):
+        return input_layer._method_complete(_call_method(
+            self._registered_name, func, input_layer, args[1:], kwargs))
     # The deferred layer passes on the scope of the source layer so that the
     # construction scope matches that of the immediate version.
     full_args = [input_layer]
@@ -1943,7 +2370,10 @@ class Register(_RegisterBase):
                           deferred_kwargs,
                           scope=input_layer._scope,
                           defaults=input_layer.defaults,
-                          partial_context=partial_context)
+                          partial_context=partial_context,
+                          method_key=(self, name, my_defaults),
+                          description=('method', self._registered_name,
+                                       my_defaults))
 
   def create_method(self, obj):
 
@@ -1977,7 +2407,8 @@ class Register(_RegisterBase):
         if _should_defer(non_seq_layer, args, kwargs):
           result = self.create_deferred(func, non_seq_layer, args, kwargs, name)
         else:
-          result = func(non_seq_layer, *args, **kwargs)
+          result = _call_method(self._registered_name, func, non_seq_layer,
+                                args, kwargs)
         return input_layer._method_complete(result)
       # Exit with because Template handles that.
 
@@ -2016,7 +2447,8 @@ class RegisterCompoundOp(_RegisterBase):
     # pylint: disable=missing-docstring
     @functools.wraps(func)
     def method(input_layer, *args, **kwargs):
-      return func(input_layer, *args, **self.fill_kwargs(input_layer, kwargs))
+      return _call_method(self._registered_name, func, input_layer, args,
+                          self.fill_kwargs(input_layer, kwargs))
 
     return method
 
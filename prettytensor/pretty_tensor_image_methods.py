@@ -27,7 +27,8 @@ from prettytensor.pretty_tensor_class import PROVIDED
 # pylint: disable=invalid-name
 @prettytensor.Register(
     assign_defaults=('learned_moments_update_rate', 'variance_epsilon',
-                     'scale_after_normalization', 'phase'))
+                     'scale_after_normalization', 'phase',
+                     'fold_batch_normalize'))
 class batch_normalize(prettytensor.VarStoreMethod):
 
   def __call__(self,
@@ -36,7 +37,8 @@ class batch_normalize(prettytensor.VarStoreMethod):
                learned_moments_update_rate=None,
                variance_epsilon=None,
                scale_after_normalization=None,
-               phase=Phase.train):
+               phase=Phase.train,
+               fold_batch_normalize=False):
     """Batch normalize this layer.
 
     This only supports global batch normalization and it can be enabled for all
@@ -44,6 +46,15 @@ class batch_normalize(prettytensor.VarStoreMethod):
     learned_moments_update_rate, variance_epsilon and scale_after_normalization
     need to either be set here or be set in defaults as well.
 
+    The moments are taken over every dimension but the last, so this works
+    after `conv2d` and `fully_connected`.
+
+    In the test and infer phases the normalization is an affine transform
+    that can be folded into the weights and bias of the preceding `conv2d` or
+    `fully_connected` (without an activation_fn). With fold_batch_normalize the
+    layer is rebuilt with the scaled weights so that the result is a single
+    convolution or matrix multiply and a bias.
+
     Args:
       input_layer: The chainable object, supplied.
       name: The name for this operation is also used to create/find the
@@ -52,7 +63,11 @@ class batch_normalize(prettytensor.VarStoreMethod):
       variance_epsilon: A float. A small float number to avoid dividing by 0.
       scale_after_normalization: A bool indicating whether the resulted tensor
         needs to be multiplied with gamma.
-      phase: The phase of construction.
+      phase: The phase of construction or a boolean Tensor from
+        `pt.runtime_phase` that is True when training.
+      fold_batch_normalize: Whether to fold the normalization into the weights
+        of the input layer outside of training.  Inputs that cannot be folded
+        are normalized as usual.
     Returns:
       Handle to the generated layer.
     """
@@ -75,9 +90,11 @@ class batch_normalize(prettytensor.VarStoreMethod):
                                     tf.constant_initializer(1.0),
                                     train=False)
 
-    if phase == Phase.train:
+    runtime_phase = prettytensor.is_runtime_phase(phase)
+    if runtime_phase or phase == Phase.train:
       # Calculate the moments based on the individual batch.
-      mean, variance = tf.nn.moments(input_layer.tensor, [0, 1, 2])
+      mean, variance = tf.nn.moments(
+          input_layer.tensor, list(range(len(input_layer.shape) - 1)))
       input_layer.bookkeeper.add_histogram_summary(mean)
       input_layer.bookkeeper.add_histogram_summary(variance)
 
@@ -85,27 +102,84 @@ class batch_normalize(prettytensor.VarStoreMethod):
           mean, moving_mean, 1.0 - learned_moments_update_rate)
       input_layer.bookkeeper.exponential_moving_average(
           variance, moving_variance, 1.0 - learned_moments_update_rate)
+      if runtime_phase:
+        batch_mean, batch_variance = mean, variance
+        mean, variance = tf.cond(
+            phase,
+            lambda: (tf.identity(batch_mean), tf.identity(batch_variance)),
+            lambda: (tf.identity(moving_mean), tf.identity(moving_variance)))
     else:
       # Load the mean and variance as the 'moving average' moments
       # from the checkpoint.
       mean = moving_mean
       variance = moving_variance
+      if fold_batch_normalize:
+        scale = tf.rsqrt(variance + variance_epsilon)
+        if scale_after_normalization:
+          scale *= gamma
+        y = _fold_into_weights(input_layer, scale, beta - mean * scale)
+        if y is not None:
+          return input_layer.with_tensor(tf.identity(y, name=name))
 
     # Normalize the activations.
-    y = tf.nn.batch_norm_with_global_normalization(
-        input_layer.tensor,
-        mean,
-        variance,
-        beta,
-        gamma,
-        name=name,
-        scale_after_normalization=scale_after_normalization,
-        variance_epsilon=variance_epsilon)
+    if len(input_layer.shape) == 4:
+      y = tf.nn.batch_norm_with_global_normalization(
+          input_layer.tensor,
+          mean,
+          variance,
+          beta,
+          gamma,
+          name=name,
+          scale_after_normalization=scale_after_normalization,
+          variance_epsilon=variance_epsilon)
+    else:
+      y = (input_layer.tensor - mean) * tf.rsqrt(variance + variance_epsilon)
+      if scale_after_normalization:
+        y *= gamma
+      y = tf.add(y, beta, name=name)
 
     return input_layer.with_tensor(y)
 # pylint: enable=invalid-name
 
 
+def _fold_into_weights(input_layer, scale, shift):
+  """Rebuilds a conv2d or fully_connected layer as scale * layer + shift.
+
+  Args:
+    input_layer: The output of conv2d or fully_connected, with layer_parameters.
+    scale: The scale of each output channel.
+    shift: The shift of each output channel.
+  Returns:
+    The Tensor with scaled weights and bias or None if input_layer is not a
+    convolution or matrix multiply of its weights plus an optional bias.
+  """
+  params = input_layer.layer_parameters
+  if 'weights' not in params:
+    return None
+  op = input_layer.tensor.op
+  bias = params.get('bias')
+  if bias is not None:
+    if op.type != 'Add':
+      return None
+    op = op.inputs[0].op
+  if op.type == 'Conv2D':
+    # The output channels are the last dimension of the filter.
+    y = tf.nn.conv2d(op.inputs[0], params['weights'] * scale,
+                     op.get_attr('strides'), op.get_attr('padding'))
+  elif op.type == 'MatMul':
+    transpose_b = op.get_attr('transpose_b')
+    weights = params['weights'] * (
+        tf.expand_dims(scale, 1) if transpose_b else scale)
+    y = tf.matmul(op.inputs[0], weights,
+                  transpose_a=op.get_attr('transpose_a'),
+                  transpose_b=transpose_b)
+  else:
+    return None
+  if bias is not None:
+    shift += bias * scale
+  return y + shift
+
+
 def _pool(input_layer, pool_fn, kernel, stride, edges, name):
   """Applies a pooling function."""
   input_layer.get_shape().assert_has_rank(4)
@@ -243,7 +317,8 @@ class conv2d(prettytensor.VarStoreMethod):
         tf.reduce_mean(
             layers.spatial_slice_zeros(y)), '%s/zeros_spatial' % y.op.name)
     if batch_normalize:
-      y = input_layer.with_tensor(y).batch_normalize()
+      # The parameters allow batch_normalize to fold into the weights.
+      y = input_layer.with_tensor(y, parameters=self.vars).batch_normalize()
     if activation_fn is not None:
       if not isinstance(activation_fn, collections.Sequence):
         activation_fn = (activation_fn,)
@@ -470,7 +470,8 @@ def evaluate_precision_recall(input_layer,
     per_example_weights: A Tensor with a weight per example.
     name: An optional name.
     phase: The phase of this model; non training phases compute a total across
-      all examples.
+      all examples. A boolean Tensor from `pt.runtime_phase` chooses at run
+      time and only adds to the totals when it is False.
   Returns:
     Precision and Recall.
   """
@@ -478,7 +479,8 @@ def evaluate_precision_recall(input_layer,
   selected, sum_retrieved, sum_relevant = _compute_precision_recall(
       input_layer, labels, threshold, per_example_weights)
 
-  if phase != Phase.train:
+  runtime_phase = prettytensor.is_runtime_phase(phase)
+  if runtime_phase or phase != Phase.train:
     dtype = tf.float32
     # Create the variables in all cases so that the load logic is easier.
     relevant_count = tf.get_variable(
@@ -503,12 +505,17 @@ def evaluate_precision_recall(input_layer,
         collections=[bookkeeper.GraphKeys.TEST_VARIABLES],
         trainable=False)
 
-    with input_layer.g.device(selected_count.device):
-      selected = tf.assign_add(selected_count, selected)
-    with input_layer.g.device(retrieved_count.device):
-      sum_retrieved = tf.assign_add(retrieved_count, sum_retrieved)
-    with input_layer.g.device(relevant_count.device):
-      sum_relevant = tf.assign_add(relevant_count, sum_relevant)
+    def _accumulate():
+      with input_layer.g.device(selected_count.device):
+        total_selected = tf.assign_add(selected_count, selected)
+      with input_layer.g.device(retrieved_count.device):
+        total_retrieved = tf.assign_add(retrieved_count, sum_retrieved)
+      with input_layer.g.device(relevant_count.device):
+        total_relevant = tf.assign_add(relevant_count, sum_relevant)
+      return total_selected, total_retrieved, total_relevant
+
+    selected, sum_retrieved, sum_relevant = _select_phase(
+        phase, _accumulate, (selected, sum_retrieved, sum_relevant))
 
   return (tf.select(tf.equal(sum_retrieved, 0),
                     tf.zeros_like(selected),
@@ -539,14 +546,16 @@ def evaluate_classifier(input_layer, labels, per_example_weights=None,
     topk: Integer k for 'accuracy at top k' metric.
     name: The name of this layer.
     phase: In training mode the batch accuracy is returned and in eval/infer
-      modes a total average is calculated.
+      modes a total average is calculated. A boolean Tensor from
+      `pt.runtime_phase` chooses at run time and only adds to the total when
+      it is False.
   Returns:
     A Pretty Tensor with the ratio of correct to total examples seen.
   """
   correct_predictions, examples = _compute_average_correct(
       input_layer, labels, per_example_weights, topk=topk)
   parameters = {}
-  if phase != Phase.train:
+  if prettytensor.is_runtime_phase(phase) or phase != Phase.train:
     dtype = tf.float32
     # Create the variables using tf.Variable because we don't want to share.
     count = tf.Variable(tf.constant(0, dtype=dtype),
@@ -559,14 +568,38 @@ def evaluate_classifier(input_layer, labels, per_example_weights=None,
                           trainable=False)
     parameters['count'] = count
     parameters['correct'] = correct
-    with input_layer.g.device(count.device):
-      examples = tf.assign_add(count, examples)
-    with input_layer.g.device(correct.device):
-      correct_predictions = tf.assign_add(correct, correct_predictions)
+    def _accumulate():
+      with input_layer.g.device(count.device):
+        total_examples = tf.assign_add(count, examples)
+      with input_layer.g.device(correct.device):
+        total_correct = tf.assign_add(correct, correct_predictions)
+      return total_examples, total_correct
+
+    examples, correct_predictions = _select_phase(
+        phase, _accumulate, (examples, correct_predictions))
   return input_layer.with_tensor(
       tf.div(correct_predictions, examples, name=name), parameters)
 
 
+def _select_phase(phase, accumulate, batch_values):
+  """Returns the totals from accumulate unless phase is training.
+
+  Args:
+    phase: A Phase or a boolean Tensor from `pt.runtime_phase`.
+    accumulate: A function that adds the batch to the totals and returns them.
+    batch_values: The values for the batch, returned while training.
+  Returns:
+    A tuple with the totals or batch_values.
+  """
+  if not prettytensor.is_runtime_phase(phase):
+    return accumulate()
+  # The totals are only updated when the accumulate branch is taken.
+  return tuple(tf.cond(
+      phase,
+      lambda: [tf.identity(x) for x in batch_values],
+      lambda: [tf.identity(x) for x in accumulate()]))
+
+
 def _compute_precision_recall(input_layer, labels, threshold,
                               per_example_weights):
   """Returns the numerator of both, the denominator of precision and recall."""
@@ -15,6 +15,8 @@ from __future__ import print_function
 
 import collections
 import itertools
+import numbers
+import operator
 
 import tensorflow as tf
 
@@ -217,7 +219,13 @@ def stop_gradient(input_layer):
 @prettytensor.Register(assign_defaults='phase')
 def dropout(input_layer, keep_prob, phase=Phase.train, name=PROVIDED):
   """Aplies dropout if this is in the train phase."""
-  if phase == Phase.train:
+  if prettytensor.is_runtime_phase(phase):
+    # Dropout with a keep_prob of 1 keeps every value unchanged.
+    dtype = input_layer.dtype
+    keep_prob = tf.select(phase, tf.convert_to_tensor(keep_prob, dtype=dtype),
+                          tf.constant(1.0, dtype=dtype))
+    return tf.nn.dropout(input_layer, keep_prob, name=name)
+  elif phase == Phase.train:
     return tf.nn.dropout(input_layer, keep_prob, name=name)
   else:
     return input_layer
@@ -595,16 +603,133 @@ def _zip_with_scalars(args):
   return zip(*zipped)
 
 
+# Element-wise functions, which give the same result when they are applied to a
+# `[time, batch, ...]` Tensor as when they are applied to each timestep.
+_ELEMENTWISE_FNS = frozenset(
+    [getattr(operator, name) for name in (
+        'abs', 'add', 'and_', 'div', 'ge', 'gt', 'invert', 'le', 'lt', 'mod',
+        'mul', 'neg', 'or_', 'pow', 'sub', 'truediv', 'xor')
+     if hasattr(operator, name)] +
+    [tf.abs, tf.exp, tf.log, tf.neg, tf.sigmoid, tf.sqrt, tf.square, tf.tanh,
+     tf.nn.elu, tf.nn.relu, tf.nn.relu6, tf.nn.softplus])
+
+
+def _step_rank(value):
+  """Returns the static rank of a non-sequence value or None if unknown."""
+  if isinstance(value, prettytensor.PrettyTensor):
+    if value.is_sequence():
+      return None
+    value = value.tensor
+  if isinstance(value, numbers.Number):
+    return 0
+  elif hasattr(value, 'get_shape'):
+    return value.get_shape().ndims
+  else:
+    return getattr(value, 'ndim', None)
+
+
+def _stackable(steps):
+  """Returns True if the static shapes of the timesteps are compatible."""
+  shape = tf.TensorShape(None)
+  for step in steps:
+    if isinstance(step, prettytensor.PrettyTensor):
+      step = step.tensor
+    if isinstance(step, numbers.Number):
+      step_shape = tf.TensorShape([])
+    elif hasattr(step, 'get_shape'):
+      step_shape = step.get_shape()
+    else:
+      step_shape = tf.TensorShape(getattr(step, 'shape', None))
+    if not shape.is_compatible_with(step_shape):
+      return False
+    shape = shape.merge_with(step_shape)
+  return True
+
+
+def _vectorized_map(input_layer, op, args, kwargs):
+  """Applies an element-wise op once to the stacked timesteps.
+
+  Sequence arguments are stacked into `[time, ...]` Tensors with size 1 dims
+  inserted after time so that they broadcast like their timesteps would, and
+  the other arguments broadcast against the timesteps as they are.
+
+  Args:
+    input_layer: The sequence that is mapped.
+    op: An element-wise op.
+    args: The arguments for op, including input_layer.
+    kwargs: Keyword arguments for op.
+  Returns:
+    A TimeMajorSequence or None if the arguments cannot be stacked, in which
+    case op should be applied to each timestep.
+  """
+  timesteps = len(input_layer)
+  rank = input_layer.get_shape().ndims
+  if timesteps < 2 or not rank:
+    return None
+  # Check every argument before creating any ops.
+  plan = []
+  for arg in args:
+    if isinstance(arg, prettytensor.PrettyTensor) and arg.is_sequence():
+      steps = arg.sequence
+    elif (isinstance(arg, collections.Sequence) and
+          not isinstance(arg, tf.compat.bytes_or_text_types)):
+      steps = arg
+    else:
+      arg_rank = _step_rank(arg)
+      if arg_rank is None or arg_rank > rank:
+        return None
+      plan.append((arg, None, 0))
+      continue
+    if len(steps) != timesteps:
+      return None
+    if isinstance(steps, prettytensor.TimeMajorSequence):
+      arg_rank = steps.get_shape().ndims
+    else:
+      ranks = set(_step_rank(x) for x in steps)
+      numeric = set(isinstance(x, numbers.Number) for x in steps)
+      if len(ranks) != 1 or len(numeric) != 1 or not _stackable(steps):
+        return None
+      arg_rank = ranks.pop()
+    if arg_rank is None or arg_rank > rank:
+      return None
+    plan.append((arg, steps, rank - arg_rank))
+
+  stacked_args = []
+  for arg, steps, missing_dims in plan:
+    if steps is None:
+      stacked_args.append(arg)
+      continue
+    if isinstance(steps, prettytensor.TimeMajorSequence):
+      stacked = steps.tensor
+    elif isinstance(steps[0], numbers.Number):
+      stacked = tf.constant(list(steps), dtype=input_layer.dtype.base_dtype)
+    else:
+      stacked = tf.pack(list(steps))
+    for _ in range(missing_dims):
+      stacked = tf.expand_dims(stacked, 1)
+    stacked_args.append(stacked)
+  return prettytensor.TimeMajorSequence(op(*stacked_args, **kwargs))
+
+
 @prettytensor.Register(method_name='map')
-def map_(input_layer, fn):
+def map_(input_layer, fn, per_example=False):
   """Maps the given function across this sequence.
 
   To map an entire template across the sequence, use the `as_fn` method on the
   template.
 
+  Element-wise functions, e.g. `tf.nn.relu` or `operator.neg`, are applied once
+  to all of the timesteps.  If `per_example` is True, then fn is applied once
+  to the squashed `[time * batch, ...]` sequence and the result is cleaved
+  into a TimeMajorSequence, so that its ops are created once instead of once
+  per timestep.  This is only correct for functions that treat each row
+  independently, e.g. `fully_connected` but not `batch_normalize` in the
+  training phase.
+
   Args:
     input_layer: The input tensor.
     fn: A function of 1 argument that is applied to each item in the sequence.
+    per_example: Whether fn can be applied to all of the timesteps at once.
   Returns:
     A new sequence Pretty Tensor.
   Raises:
@@ -612,6 +737,16 @@ def map_(input_layer, fn):
   """
   if not input_layer.is_sequence():
     raise ValueError('Can only map a sequence.')
+  if fn in _ELEMENTWISE_FNS:
+    result = _vectorized_map(input_layer, fn, (input_layer,), {})
+    if result is not None:
+      return result
+  elif per_example and len(input_layer) > 1:
+    squashed = input_layer.squash_sequence()
+    result = fn(squashed)
+    if not isinstance(result, prettytensor.PrettyTensor):
+      result = squashed.with_tensor(result)
+    return result.cleave_sequence(len(input_layer), time_major=True)
   return [fn(x) for x in input_layer]
 
 
@@ -620,6 +755,9 @@ def map_(input_layer, fn):
 def _map_or_apply(input_layer, op, *args, **kwargs):
   """Map op across the input if it is a sequence; otherwise apply it.
 
+  Element-wise ops, e.g. the arithmetic operators, are applied once to the
+  stacked timesteps when the arguments allow it.
+
   Note: This takes a keyword argument `right_` to right apply the op to this
   input. The name is chosen to limit conflicts with other keyword arguments.
 
@@ -645,6 +783,10 @@ def _map_or_apply(input_layer, op, *args, **kwargs):
       args += (input_layer,)
     else:
       args = ((input_layer,) + args)
+    if op in _ELEMENTWISE_FNS:
+      result = _vectorized_map(input_layer, op, args, kwargs)
+      if result is not None:
+        return result
     result = [op(*x, **kwargs) for x in _zip_with_scalars(args)]
     if len(result) != len(input_layer):
       raise ValueError('Not all arguments were the same length.')
@@ -15,6 +15,8 @@ from __future__ import print_function
 
 import math
 import operator
+import subprocess
+import sys
 import unittest
 
 
@@ -261,6 +263,64 @@ class PrettyTensorTest(pretty_tensor_testing.PtTestCase):
     self.assertEqual(2,
                      len(tf.get_collection(prettytensor.GraphKeys.UPDATE_OPS)))
 
+  def testConvBatchNormRuntimePhase(self):
+    training = prettytensor.runtime_phase()
+    with prettytensor.defaults_scope(learned_moments_update_rate=0.0003,
+                                     variance_epsilon=0.001,
+                                     scale_after_normalization=False,
+                                     phase=training):
+      result = self.input_layer.reshape(
+          [DIM_SAME, DIM_SAME, DIM_SAME, 1]).batch_normalize()
+    self.sess.run(tf.initialize_all_variables())
+
+    # The moving moments start at a mean of 0 and a variance of 1.
+    testing.assert_allclose(
+        self.input_data.reshape([2, 3, 5, 1]) / numpy.sqrt(1.001),
+        self.sess.run(result, {training: False}),
+        rtol=0.0001)
+    normalized = self.sess.run(result)
+    testing.assert_allclose(0.0, normalized.mean(), atol=0.0001)
+
+  def _CheckFoldedBatchNorm(self, build):
+    with prettytensor.defaults_scope(learned_moments_update_rate=0.0003,
+                                     variance_epsilon=0.001,
+                                     scale_after_normalization=True,
+                                     phase=Phase.test):
+      with tf.variable_scope('bn'):
+        expected = build(self.input_layer)
+      with tf.variable_scope('bn', reuse=True), prettytensor.defaults_scope(
+          fold_batch_normalize=True):
+        folded = build(self.input_layer)
+
+    ops = set()
+    stack = [folded.tensor.op]
+    while stack:
+      op = stack.pop()
+      if op not in ops:
+        ops.add(op)
+        stack.extend(x.op for x in op.inputs)
+    self.assertNotIn('BatchNormWithGlobalNormalization',
+                     [op.type for op in ops])
+
+    self.sess.run(tf.initialize_all_variables())
+    for v in tf.all_variables():
+      if v.name.startswith('bn/'):
+        self.sess.run(v.assign(
+            numpy.random.uniform(0.5, 2.0, v.get_shape().as_list())))
+    testing.assert_allclose(self.RunTensor(expected, init=False),
+                            self.RunTensor(folded, init=False),
+                            rtol=0.0001)
+
+  def testFoldedConvBatchNorm(self):
+    self._CheckFoldedBatchNorm(
+        lambda x: x.reshape([DIM_SAME, DIM_SAME, DIM_SAME, 1]).conv2d(
+            3, 2, batch_normalize=True, activation_fn=tf.nn.relu))
+
+  def testFoldedFullBatchNorm(self):
+    self._CheckFoldedBatchNorm(
+        lambda x: x.flatten().fully_connected(
+            4, activation_fn=None).batch_normalize())
+
   def testConvBadShape(self):
     with self.assertRaises(ValueError):
       self.input_layer.conv2d(3, 2)
@@ -372,6 +432,17 @@ class PrettyTensorTest(pretty_tensor_testing.PtTestCase):
 
     testing.assert_allclose(self.input_data, result, rtol=TOLERANCE)
 
+  def testDropoutRuntimePhase(self):
+    training = prettytensor.runtime_phase()
+    with prettytensor.defaults_scope(phase=training):
+      dropout = self.input_layer.dropout(0.0001)
+    result = self.sess.run(dropout, {training: False})
+    testing.assert_allclose(self.input_data, result, rtol=TOLERANCE)
+
+    result = self.sess.run(dropout)
+    zero_count = numpy.sum(numpy.abs(result) < TOLERANCE)
+    self.assertGreater(zero_count, result.size * 0.95)
+
   def testL2Regression(self):
     label = numpy.zeros_like(self.input_data)
     label[0, 1, 1] = 100
@@ -570,6 +641,18 @@ class PrettyTensorTest(pretty_tensor_testing.PtTestCase):
     result = self.RunTensor(evaluation)
     testing.assert_allclose(numpy.array([2. / 3.]), result, rtol=TOLERANCE)
 
+    # A runtime phase only adds to the totals when it is not training.
+    training = prettytensor.runtime_phase()
+    evaluation = prediction.evaluate_classifier(tf.constant(actual),
+                                                phase=training)
+    totals = tf.get_collection(prettytensor.GraphKeys.TEST_VARIABLES)
+    self.sess.run(tf.initialize_variables(totals))
+    testing.assert_allclose(0.6, self.sess.run(evaluation), rtol=TOLERANCE)
+    self.assertEqual([0.0, 0.0], self.sess.run(totals))
+    testing.assert_allclose(0.6, self.sess.run(evaluation, {training: False}),
+                            rtol=TOLERANCE)
+    self.assertEqual([3.0, 5.0], sorted(self.sess.run(totals)))
+
   def testEvaluatorCreatesUniqueVariables(self):
     actual = numpy.array([[0, 1, 0], [1, 0, 0],], dtype=numpy.float)
     with tf.variable_scope('scope') as vs:
@@ -870,6 +953,66 @@ class PrettyTensorTest(pretty_tensor_testing.PtTestCase):
                               rtol=TOLERANCE,
                               err_msg='Op: %s' % op.__name__)
 
+  def testSequenceOperatorsAreVectorized(self):
+    input2 = self.input * 4
+    sequence_input = prettytensor.wrap_sequence([self.input, input2])
+    graph = tf.get_default_graph()
+    adds = len([op for op in graph.get_operations() if op.type == 'Add'])
+
+    result = sequence_input + [2., 1.]
+    self.assertTrue(
+        isinstance(result.sequence, pretty_tensor_class.TimeMajorSequence))
+    self.assertEqual(
+        adds + 1,
+        len([op for op in graph.get_operations() if op.type == 'Add']))
+    self.assertEqual([2, 3, 5], result.shape)
+    values = self.sess.run(result.sequence.tensor)
+    testing.assert_allclose(self.input_data + 2., values[0], rtol=TOLERANCE)
+    testing.assert_allclose(self.input_data * 4 + 1., values[1],
+                            rtol=TOLERANCE)
+
+    # A nested list cannot be stacked, so each timestep is added.
+    result = sequence_input + [[2.], [1.]]
+    self.assertFalse(
+        isinstance(result.sequence, pretty_tensor_class.TimeMajorSequence))
+    self.assertEqual(2, len(result.sequence))
+
+    # Timesteps with different shapes cannot be stacked, but each of them
+    # broadcasts against its scalar.
+    ragged_input = prettytensor.wrap_sequence(
+        [self.input, tf.constant(self.input_data[:1], dtype=tf.float32)])
+    result = ragged_input + [2., 1.]
+    self.assertFalse(
+        isinstance(result.sequence, pretty_tensor_class.TimeMajorSequence))
+    values = self.sess.run(list(result.sequence))
+    testing.assert_allclose(self.input_data[:1] + 1., values[1],
+                            rtol=TOLERANCE)
+
+  def testMapPerExample(self):
+    input_data = self.input_data.reshape([2, 15])
+    steps = tf.constant(input_data, dtype=tf.float32)
+    sequence_input = prettytensor.wrap_sequence([steps, steps * 2])
+
+    result = sequence_input.map(
+        lambda x: x.fully_connected(3, activation_fn=None), per_example=True)
+    self.assertTrue(
+        isinstance(result.sequence, pretty_tensor_class.TimeMajorSequence))
+    self.assertEqual([2, 3], result.shape)
+    graph = tf.get_default_graph()
+    self.assertEqual(
+        1, len([op for op in graph.get_operations() if op.type == 'MatMul']))
+
+    self.sess.run(tf.initialize_all_variables())
+    weights, bias = self.sess.run(tf.trainable_variables())
+    values = self.sess.run(result.sequence.tensor)
+    for i, step in enumerate([input_data, input_data * 2]):
+      testing.assert_allclose(numpy.dot(step, weights) + bias, values[i],
+                              rtol=TOLERANCE)
+
+    relu = sequence_input.map(tf.nn.relu)
+    self.assertTrue(
+        isinstance(relu.sequence, pretty_tensor_class.TimeMajorSequence))
+
   def testMathOperatorSideEffects(self):
     seq = self.input_layer.sequential()
 
@@ -883,6 +1026,23 @@ class PrettyTensorTest(pretty_tensor_testing.PtTestCase):
     r2 = self.RunTensor(seq)
     testing.assert_allclose(r1, r2, rtol=TOLERANCE)
 
+  def testLazyMethodModules(self):
+    # A fresh interpreter shows whether importing prettytensor loads them.
+    script = ('import sys\n'
+              'import tensorflow\n'
+              'preloaded = set(sys.modules)\n'
+              'import prettytensor\n'
+              'assert "prettytensor.recurrent_networks" not in sys.modules\n'
+              # Only needed for the construct_cached key.
+              'assert ("pkg_resources" in preloaded or\n'
+              '        "pkg_resources" not in sys.modules)\n'
+              'assert prettytensor.PrettyTensor.sequence_lstm\n'
+              'assert "activation_fn" in prettytensor.defaults_scope.__doc__\n'
+              'assert "prettytensor.train" not in sys.modules\n'
+              'assert prettytensor.train.Runner\n'
+              'assert "prettytensor.train" in sys.modules\n')
+    subprocess.check_call([sys.executable, '-c', script])
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,322 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Estimates the size and cost of each layer in a model from static shapes.
+
+Every registered method that is called, or constructed from a template, inside
+`profile` is recorded with the parameters that it uses, the FLOPs of the ops
+that compute its output and the bytes of that output:
+
+    with pt.profiler.profile(batch_size=32) as model_profile:
+      result = model_template.construct(input=images)
+    print(model_profile.table())
+
+Only the ops that the output of a layer depends on are counted, so variable
+initializers, summaries and regularization losses are not. Methods called from
+inside another method are included in the outer layer. Unknown dimensions are
+assumed to be batch_size.
+
+The ops in the body of a `tf.while_loop` or of a `function.Defun` run an unknown
+number of times, so the FLOPs of a layer that uses them, e.g. `sequence_lstm`
+with `dynamic=True`, `checkpoint_every` or `cell_function`, are None and print
+as `?`.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import contextlib
+
+import tensorflow as tf
+
+from prettytensor import pretty_tensor_class as prettytensor
+from prettytensor import scopes
+
+# pylint: disable=protected-access
+
+_VARIABLE_OPS = frozenset(['Variable', 'VariableV2'])
+
+# Ops that cost one FLOP per output element.
+_ELEMENTWISE_OPS = frozenset([
+    'Add', 'AddN', 'BiasAdd', 'Div', 'Elu', 'Exp', 'Log', 'Maximum', 'Minimum',
+    'Mul', 'Neg', 'Relu', 'Relu6', 'Rsqrt', 'Select', 'Sigmoid', 'Softmax',
+    'Softplus', 'Sqrt', 'Square', 'Sub', 'Tanh'])
+
+# Ops that cost one FLOP per input element.
+_REDUCTION_OPS = frozenset(['Max', 'Mean', 'Min', 'Prod', 'Sum'])
+
+# Ops that only appear in a tf.while_loop, whose body runs an unknown number of
+# times.
+_LOOP_OPS = frozenset(['Enter', 'Exit', 'LoopCond', 'NextIteration'])
+
+
+class LayerProfile(collections.namedtuple(
+    'LayerProfile', ['name', 'method', 'parameters', 'forward_flops',
+                     'backward_flops', 'activation_bytes'])):
+  """The estimated size and cost of a layer.
+
+  Attributes:
+    name: The name scope of the layer.
+    method: The registered method that created it.
+    parameters: The number of trainable parameters that it uses.
+    forward_flops: The FLOPs to compute the output or None if the layer uses a
+      loop or a function call, whose cost is not known statically.
+    backward_flops: The estimated FLOPs of the gradient, twice the forward
+      FLOPs since the gradients of the inputs and of the weights are computed,
+      or None.
+    activation_bytes: The size of the output.
+  """
+
+
+def _num_elements(shape, batch_size):
+  """Returns the number of elements of a TensorShape or None if unknown."""
+  if shape.ndims is None:
+    return None
+  result = 1
+  for dim in shape.as_list():
+    result *= batch_size if dim is None else dim
+  return result
+
+
+def _dim(shape, index, batch_size):
+  dim = shape.as_list()[index]
+  return batch_size if dim is None else dim
+
+
+def op_flops(op, batch_size=1):
+  """Returns the estimated forward FLOPs of an op from its static shapes.
+
+  Args:
+    op: The op.
+    batch_size: The size to use for unknown dimensions.
+  Returns:
+    The number of FLOPs, 0 for ops that only move data or have unknown shapes.
+  """
+  if not op.outputs:
+    return 0
+  out_shape = op.outputs[0].get_shape()
+  out_elements = _num_elements(out_shape, batch_size)
+  if out_elements is None:
+    return 0
+  if op.type == 'MatMul':
+    a_shape = op.inputs[0].get_shape()
+    k = _dim(a_shape, 0 if op.get_attr('transpose_a') else 1, batch_size)
+    return 2 * out_elements * k
+  elif op.type == 'BatchMatMul':
+    x_shape = op.inputs[0].get_shape()
+    k = _dim(x_shape, -2 if op.get_attr('adj_x') else -1, batch_size)
+    return 2 * out_elements * k
+  elif op.type == 'Conv2D':
+    kh, kw, in_depth, _ = op.inputs[1].get_shape().as_list()
+    return 2 * out_elements * kh * kw * in_depth
+  elif op.type == 'DepthwiseConv2dNative':
+    kh, kw, _, _ = op.inputs[1].get_shape().as_list()
+    return 2 * out_elements * kh * kw
+  elif op.type == 'Conv2DBackpropInput':
+    # Each element of the input to the deconvolution is spread over the
+    # filter.
+    kh, kw, out_depth, _ = op.inputs[1].get_shape().as_list()
+    in_elements = _num_elements(op.inputs[2].get_shape(), batch_size) or 0
+    return 2 * in_elements * kh * kw * out_depth
+  elif op.type in ('AvgPool', 'MaxPool'):
+    _, kh, kw, _ = op.get_attr('ksize')
+    return out_elements * kh * kw
+  elif op.type in _REDUCTION_OPS:
+    return _num_elements(op.inputs[0].get_shape(), batch_size) or 0
+  elif op.type in _ELEMENTWISE_OPS:
+    return out_elements
+  else:
+    return 0
+
+
+def _runs_unknown_times(op):
+  """Returns True if op is part of a loop or calls a function."""
+  return op.type in _LOOP_OPS or op.type in op.graph._functions
+
+
+def _variable_op(tensor):
+  """Returns the variable op if tensor is a variable or its read, else None."""
+  op = tensor.op
+  if op.type in _VARIABLE_OPS:
+    return op
+  elif op.type == 'Identity' and op.inputs[0].op.type in _VARIABLE_OPS:
+    return op.inputs[0].op
+  else:
+    return None
+
+
+def _output_tensors(result):
+  """Returns the Tensors that a registered method returned."""
+  if isinstance(result, prettytensor._DeferredLayer):
+    # The methods are recorded when the template is constructed.
+    return []
+  elif isinstance(result, prettytensor.PrettyTensor):
+    if not result.is_sequence():
+      return [result.tensor]
+    elif isinstance(result.sequence, prettytensor.TimeMajorSequence):
+      return [result.sequence.tensor]
+    else:
+      return list(result.sequence)
+  elif isinstance(result, prettytensor.Loss):
+    return [result.tensor]
+  elif isinstance(result, tf.Tensor):
+    return [result]
+  elif isinstance(result, (list, tuple)):
+    outputs = []
+    for x in result:
+      outputs.extend(_output_tensors(x))
+    return outputs
+  else:
+    return []
+
+
+class ModelProfile(object):
+  """Records a LayerProfile for each layer built inside `profile`."""
+
+  def __init__(self, batch_size=1):
+    self.batch_size = batch_size
+    self._layers = []
+    self._depth = 0
+    self._graph = None
+    # The shape of each variable used by a layer, by name.
+    self._variable_shapes = {}
+    # The variable names of each layer in self._layers.
+    self._layer_variables = []
+
+  def _call(self, method, func, input_layer, args, kwargs):
+    """Calls func and records the layer if this is not a nested call."""
+    if self._depth:
+      return func(input_layer, *args, **kwargs)
+    graph = input_layer.g
+    # Compound ops do not open a name scope of their own.
+    name = scopes.get_current_name_scope().rstrip('/') or method
+    start = graph._next_id_counter
+    self._depth += 1
+    try:
+      result = func(input_layer, *args, **kwargs)
+    finally:
+      self._depth -= 1
+    self._record(graph, start, method, name, result)
+    return result
+
+  def _record(self, graph, start, method, name, result):
+    """Walks the new ops that the outputs of result depend on."""
+    self._graph = graph
+    outputs = [x for x in _output_tensors(result)
+               if x.graph is graph and x.op._id > start]
+    if not outputs:
+      # E.g. a deferred layer or dropout in the test phase.
+      return
+    flops = 0
+    variables = set()
+    visited = set()
+    stack = [x.op for x in outputs]
+    while stack:
+      op = stack.pop()
+      if op in visited:
+        continue
+      visited.add(op)
+      if _runs_unknown_times(op):
+        # Keep walking to find the variables.
+        flops = None
+      elif flops is not None:
+        flops += op_flops(op, self.batch_size)
+      for tensor in op.inputs:
+        variable = _variable_op(tensor)
+        if variable is not None:
+          variables.add(variable.name)
+          self._variable_shapes[variable.name] = (
+              variable.outputs[0].get_shape())
+        elif tensor.op._id > start:
+          stack.append(tensor.op)
+    activation_bytes = sum(
+        (_num_elements(x.get_shape(), self.batch_size) or 0) *
+        x.dtype.base_dtype.size for x in outputs)
+    self._layer_variables.append(variables)
+    self._layers.append(LayerProfile(name, method, 0, flops,
+                                    None if flops is None else 2 * flops,
+                                    activation_bytes))
+
+  def _trainable(self):
+    if self._graph is None:
+      return set()
+    return {v.op.name for v in self._graph.get_collection(
+        tf.GraphKeys.TRAINABLE_VARIABLES)}
+
+  def _parameters(self, variables, trainable):
+    return sum(self._variable_shapes[v].num_elements() or 0
+               for v in variables if v in trainable)
+
+  def profiles(self):
+    """Returns the LayerProfiles with the trainable parameter counts."""
+    trainable = self._trainable()
+    return [layer._replace(parameters=self._parameters(variables, trainable))
+            for layer, variables in zip(self._layers, self._layer_variables)]
+
+  def totals(self):
+    """Returns a LayerProfile with the totals, shared variables count once."""
+    all_variables = set()
+    for variables in self._layer_variables:
+      all_variables.update(variables)
+    return LayerProfile(
+        'total', None, self._parameters(all_variables, self._trainable()),
+        _sum_known(x.forward_flops for x in self._layers),
+        _sum_known(x.backward_flops for x in self._layers),
+        sum(x.activation_bytes for x in self._layers))
+
+  def table(self):
+    """Returns a table with a row for each layer and the totals."""
+    row = '%-40s %-20s %12s %14s %14s %14s'
+    lines = [row % ('layer', 'method', 'parameters', 'forward FLOPs',
+                    'backward FLOPs', 'activations')]
+    for layer in self.profiles() + [self.totals()]:
+      lines.append(row % (layer.name, layer.method or '', layer.parameters,
+                          _format_flops(layer.forward_flops),
+                          _format_flops(layer.backward_flops),
+                          _format_bytes(layer.activation_bytes)))
+    return '\n'.join(lines)
+
+
+def _sum_known(values):
+  """Returns the sum of values or None if any of them is None."""
+  values = list(values)
+  if any(x is None for x in values):
+    return None
+  return sum(values)
+
+
+def _format_flops(flops):
+  return '?' if flops is None else flops
+
+
+def _format_bytes(num_bytes):
+  for unit in ('B', 'KiB', 'MiB'):
+    if num_bytes < 1024:
+      return '%d%s' % (num_bytes, unit)
+    num_bytes //= 1024
+  return '%dGiB' % num_bytes
+
+
+@contextlib.contextmanager
+def profile(batch_size=1):
+  """Records a profile of each layer that is built in a `with` block.
+
+  Args:
+    batch_size: The size to use for dimensions that are not statically known.
+  Yields:
+    A ModelProfile, which is complete after the block.
+  """
+  old_profile = prettytensor._model_profile
+  prettytensor._model_profile = ModelProfile(batch_size)
+  try:
+    yield prettytensor._model_profile
+  finally:
+    prettytensor._model_profile = old_profile
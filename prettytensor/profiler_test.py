@@ -0,0 +1,96 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the layer profiler."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+
+
+import numpy
+import tensorflow as tf
+
+import prettytensor
+from prettytensor import pretty_tensor_testing
+from prettytensor import profiler
+
+
+class ProfilerTest(pretty_tensor_testing.PtTestCase):
+
+  def setUp(self):
+    super(self.__class__, self).setUp()
+    self.input_data = numpy.zeros([2, 3], dtype=numpy.float32)
+    self.input = prettytensor.wrap(tf.constant(self.input_data))
+
+  def testFullyConnected(self):
+    with profiler.profile() as model_profile:
+      self.input.fully_connected(4, activation_fn=tf.nn.relu, l2loss=0.1)
+
+    layer, = model_profile.profiles()
+    self.assertEqual('fully_connected', layer.name)
+    self.assertEqual('fully_connected', layer.method)
+    self.assertEqual(3 * 4 + 4, layer.parameters)
+    # The matmul, the bias and the relu; not the initializers or the loss.
+    self.assertEqual(2 * 2 * 3 * 4 + 8 + 8, layer.forward_flops)
+    self.assertEqual(2 * layer.forward_flops, layer.backward_flops)
+    self.assertEqual(2 * 4 * 4, layer.activation_bytes)
+
+  def testConv2dWithUnknownBatch(self):
+    images = prettytensor.wrap(tf.placeholder(tf.float32, [None, 5, 5, 2]))
+    with profiler.profile(batch_size=10) as model_profile:
+      images.conv2d(3, 4).max_pool(2, 2)
+
+    conv, pool = model_profile.profiles()
+    self.assertEqual(3 * 3 * 2 * 4 + 4, conv.parameters)
+    self.assertEqual(2 * 10 * 5 * 5 * 4 * 3 * 3 * 2 + 10 * 5 * 5 * 4,
+                     conv.forward_flops)
+    self.assertEqual(0, pool.parameters)
+    self.assertEqual(10 * 3 * 3 * 4 * 4, pool.activation_bytes)
+
+  def testTemplateTotals(self):
+    template = prettytensor.template('input').fully_connected(
+        4, activation_fn=None).fully_connected(5, activation_fn=None)
+    with profiler.profile() as model_profile:
+      template.construct(input=self.input)
+      with tf.variable_scope(tf.get_variable_scope(), reuse=True):
+        template.construct(input=self.input)
+
+    profiles = model_profile.profiles()
+    self.assertEqual(['fully_connected', 'fully_connected'] * 2,
+                     [x.method for x in profiles])
+    self.assertEqual([16, 25] * 2, [x.parameters for x in profiles])
+    totals = model_profile.totals()
+    # The second tower shares the variables.
+    self.assertEqual(16 + 25, totals.parameters)
+    self.assertEqual(sum(x.forward_flops for x in profiles),
+                     totals.forward_flops)
+    self.assertIn('total', model_profile.table())
+
+  def testLoopFlopsAreUnknown(self):
+    sequence = prettytensor.wrap_sequence([tf.constant(self.input_data)] * 3)
+    with profiler.profile() as model_profile:
+      sequence.sequence_lstm(4, dynamic=True)
+      self.input.fully_connected(4)
+
+    lstm, fc = model_profile.profiles()
+    self.assertIsNone(lstm.forward_flops)
+    self.assertIsNone(lstm.backward_flops)
+    # The variables inside the loop are still found.
+    self.assertGreater(lstm.parameters, (3 + 4) * 4 * 4)
+    self.assertIsNotNone(fc.forward_flops)
+    self.assertIsNone(model_profile.totals().forward_flops)
+    self.assertIn('?', model_profile.table())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -14,6 +14,7 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import contextlib
 import math
 import numpy
 
@@ -22,10 +23,14 @@ from six.moves import xrange  # pylint: disable=redefined-builtin
 from six.moves import zip  # pylint: disable=redefined-builtin
 import tensorflow as tf
 
+from tensorflow.python.framework import function
 from tensorflow.python.ops import control_flow_ops
+from tensorflow.python.ops import tensor_array_ops
 
 from prettytensor import bookkeeper
+from prettytensor import layers
 from prettytensor import pretty_tensor_class as prettytensor
+from prettytensor import scopes
 from prettytensor.pretty_tensor_class import PROVIDED
 
 # TODO(eiderman): Figure out the best dimensionality for this.
@@ -73,7 +78,8 @@ def lstm_cell(input_layer,
               bias=True,
               peephole=True,
               stddev=None,
-              init=None):
+              init=None,
+              fused=False):
   """Long short-term memory cell (LSTM).
 
   Args:
@@ -86,6 +92,9 @@ def lstm_cell(input_layer,
         http://www.jmlr.org/papers/volume3/gers02a/gers02a.pdf
     stddev: Standard deviation for Gaussian initialization of parameters.
     init: A tf.*Initializer that is used to initialize the variables.
+    fused: If True, compute all gates with a single matmul over `[x, h]` and
+      apply the nonlinearities directly to the fused activation. This uses a
+      different variable layout, see `convert_lstm_variables_to_fused`.
   Returns:
     A RecurrentResult.
   """
@@ -95,6 +104,21 @@ def lstm_cell(input_layer,
     layer = input_layer.as_layer()
   else:
     layer = input_layer
+  if fused:
+    # The fused cell returns a sequence of (c, h), so indexing it does not add
+    # any ops to the graph.
+    cell = layer._fused_lstm_cell(  # pylint: disable=protected-access
+        states,
+        num_units,
+        bias=bias,
+        peephole=peephole,
+        stddev=stddev,
+        init=init)
+    new_c = cell[0]
+    new_h = cell[1]
+    if input_layer.is_sequential_builder():
+      new_h = input_layer.set_head(input_layer)
+    return RecurrentResult(new_h, [new_c, new_h])
   c, h = [prettytensor.wrap(state, layer.bookkeeper) for state in states]
   activation_input = layer.fully_connected(4 * num_units,
                                            bias=bias,
@@ -137,6 +161,213 @@ def lstm_cell(input_layer,
   return RecurrentResult(new_h, [new_c, new_h])
 
 
+# The fused LSTM keeps its gates in (i, f, o, j) order so that the three sigmoid
+# gates are contiguous and can share a single nonlinearity.  lstm_cell uses
+# (i, j, f, o), this maps the unfused order to the fused one.
+_FUSED_GATE_ORDER = (0, 2, 3, 1)
+
+
+def _fused_lstm_bias_init(num_units):
+  """Returns an initializer that starts the forget gate bias at 1."""
+
+  def _initializer(shape, dtype=tf.float32):
+    value = numpy.zeros(shape, dtype=tf.as_dtype(dtype).as_numpy_dtype)
+    # Biases of the forget gate are initialized to 1 in order to reduce the
+    # scale of forgetting in the beginning of the training.  The unfused cell
+    # adds this as a constant on every step.
+    value[num_units:2 * num_units] = 1.
+    return tf.constant(value, dtype=dtype)
+
+  return _initializer
+
+
+def _weight_init(init, stddev, n_inputs, n_outputs):
+  """Resolves init and stddev into an initializer like fully_connected."""
+  if init is None:
+    if stddev is None:
+      return layers.xavier_init(n_inputs, n_outputs)
+    elif stddev:
+      return tf.truncated_normal_initializer(stddev=stddev)
+    else:
+      return tf.zeros_initializer
+  elif stddev is not None:
+    raise ValueError('Do not set both init and stddev.')
+  return init
+
+
+def _fused_lstm_variables(var_store, input_size, num_units, bias, peephole,
+                          stddev, init, dtype):
+  """Creates the variables for a fused LSTM.
+
+  Args:
+    var_store: The VarStoreMethod that owns the variables.
+    input_size: The size of the input.
+    num_units: The size of the hidden state.
+    bias: Whether or not to use a bias.
+    peephole: Whether to create peephole weights.
+    stddev: Standard deviation for Gaussian initialization of parameters.
+    init: A tf.*Initializer that is used to initialize the variables.
+    dtype: The dtype of the variables.
+  Returns:
+    A tuple of weights with shape `[input_size + num_units, 4 * num_units]`,
+    the bias or None and the peepholes (in (i, f, o) order) or None.
+  Raises:
+    ValueError: If both init and stddev are set.
+  """
+  init = _weight_init(init, stddev, input_size + num_units, 4 * num_units)
+  weights = var_store.variable(
+      'weights', [input_size + num_units, 4 * num_units], init, dt=dtype)
+  if bias:
+    bias_var = var_store.variable(
+        'bias', [4 * num_units], _fused_lstm_bias_init(num_units), dt=dtype)
+  else:
+    bias_var = None
+  if peephole:
+    peepholes = var_store.variable('peepholes', [3 * num_units], init,
+                                   dt=dtype)
+  else:
+    peepholes = None
+  return weights, bias_var, peepholes
+
+
+def _slice_last_dim(tensor, begin, size):
+  """Slices the last dimension of a Tensor with a known rank."""
+  rank = tensor.get_shape().ndims
+  return tf.slice(tensor, [0] * (rank - 1) + [begin],
+                  [-1] * (rank - 1) + [size])
+
+
+def _fused_lstm_gates(activation, c, num_units, peepholes=None):
+  """Applies the LSTM nonlinearities to a fused activation.
+
+  The gates are in the last dimension, so any leading dimensions are treated
+  as batch dimensions.
+
+  Args:
+    activation: A `[batch, 4 * num_units]` Tensor with the gates in
+      (i, f, o, j) order.
+    c: The previous cell state.
+    num_units: The size of the hidden state.
+    peepholes: An optional `[3 * num_units]` Tensor with the diagonal peephole
+      weights in (i, f, o) order. It may have leading dimensions that
+      broadcast against the batch dimensions.
+  Returns:
+    A tuple of the new cell state and the new output.
+  """
+  rank = activation.get_shape().ndims
+  j = tf.tanh(_slice_last_dim(activation, 3 * num_units, num_units))
+  if peepholes is None:
+    i, f, o = tf.split(
+        rank - 1, 3,
+        tf.sigmoid(_slice_last_dim(activation, 0, 3 * num_units)))
+    new_c = c * f + i * j
+  else:
+    if_gates = (_slice_last_dim(activation, 0, 2 * num_units) +
+                tf.tile(c, [1] * (rank - 1) + [2]) *
+                _slice_last_dim(peepholes, 0, 2 * num_units))
+    i, f = tf.split(rank - 1, 2, tf.sigmoid(if_gates))
+    new_c = c * f + i * j
+    o = tf.sigmoid(
+        _slice_last_dim(activation, 2 * num_units, num_units) +
+        new_c * _slice_last_dim(peepholes, 2 * num_units, num_units))
+  return new_c, tf.tanh(new_c) * o
+
+
+# pylint: disable=invalid-name
+@prettytensor.Register(assign_defaults='stddev')
+class _fused_lstm_cell(prettytensor.VarStoreMethod):
+
+  def __call__(self,
+               input_layer,
+               states,
+               num_units,
+               bias=True,
+               peephole=True,
+               stddev=None,
+               init=None,
+               name=PROVIDED):
+    """Computes an LSTM step with a single matmul; use lstm_cell(fused=True).
+
+    Args:
+      input_layer: PrettyTensor (provided).
+      states: The current state of the network, as (c, h).
+      num_units: How big is the hidden state.
+      bias: Whether or not to use a bias.
+      peephole: Whether to use peephole connections.
+      stddev: Standard deviation for Gaussian initialization of parameters.
+      init: A tf.*Initializer that is used to initialize the variables.
+      name: The name of this layer.
+    Returns:
+      A sequence of the new (c, h).
+    Raises:
+      ValueError: If the input is not rank 2 or the second dim is not known.
+    """
+    _ = name  # Used for scoping by PT.
+    if input_layer.get_shape().ndims != 2 or input_layer.shape[1] is None:
+      raise ValueError('lstm_cell requires a rank 2 Tensor with known second '
+                       'dimension: %s' % input_layer.get_shape())
+    c, h = states
+    weights, bias_var, peepholes = _fused_lstm_variables(
+        self, input_layer.shape[1], num_units, bias, peephole, stddev, init,
+        input_layer.dtype)
+    activation = tf.matmul(tf.concat(1, [input_layer, h]), weights)
+    if bias_var is not None:
+      activation = tf.nn.bias_add(activation, bias_var)
+    new_c, new_h = _fused_lstm_gates(activation, c, num_units, peepholes)
+    return input_layer.with_sequence([new_c, new_h], parameters=self.vars)
+# pylint: enable=invalid-name
+
+
+def convert_lstm_variables_to_fused(values, scope, fused_scope=None):
+  """Converts the variables of an `lstm_cell` to the fused layout.
+
+  This makes it possible to load a checkpoint that was trained with the default
+  cell into a model that uses `lstm_cell(fused=True)` or
+  `sequence_lstm(fused=True)`: restore the old model, fetch the variable values,
+  convert them and assign them to the fused variables before saving a new
+  checkpoint.
+
+  Args:
+    values: A dict of variable name (without the `:0` suffix, as in a
+      checkpoint) to numpy array.  Entries outside of `scope` are ignored.
+    scope: The variable scope of the unfused cell, e.g. 'sequence_lstm'.
+    fused_scope: The variable scope of the fused cell, defaults to `scope`.
+  Returns:
+    A dict of fused variable name to numpy array.
+  Raises:
+    ValueError: If the variables of the cell cannot be found in values.
+  """
+  if fused_scope is None:
+    fused_scope = scope
+  input_name = '%s/fully_connected/weights' % scope
+  hidden_name = '%s/fully_connected_1/weights' % scope
+  if input_name not in values or hidden_name not in values:
+    raise ValueError('No lstm_cell found in %s: %s' %
+                     (scope, sorted(six.iterkeys(values))))
+
+  def _reorder(x):
+    splits = numpy.split(x, 4, axis=-1)
+    return numpy.concatenate([splits[i] for i in _FUSED_GATE_ORDER], axis=-1)
+
+  result = {}
+  prefix = '%s/fused_lstm_cell/' % fused_scope
+  result[prefix + 'weights'] = _reorder(
+      numpy.concatenate([values[input_name], values[hidden_name]], axis=0))
+  bias_name = '%s/fully_connected/bias' % scope
+  if bias_name in values:
+    bias = _reorder(values[bias_name])
+    num_units = bias.shape[0] // 4
+    # The unfused cell adds the forget bias on every step.
+    bias[num_units:2 * num_units] += 1.
+    result[prefix + 'bias'] = bias
+  peephole_names = ['%s/diagonal_matrix_mul%s/weights' % (scope, suffix)
+                    for suffix in ('', '_1', '_2')]
+  if all(n in values for n in peephole_names):
+    result[prefix + 'peepholes'] = numpy.concatenate(
+        [values[n] for n in peephole_names])
+  return result
+
+
 @prettytensor.RegisterCompoundOp(assign_defaults='stddev')
 def gru_cell(input_layer, state, num_units, bias=True, stddev=None, init=None):
   """Gated recurrent unit memory cell (GRU).
@@ -181,13 +412,174 @@ def gru_cell(input_layer, state, num_units, bias=True, stddev=None, init=None):
   return RecurrentResult(new_h, [new_h])
 
 
+def _shape_with_leading_dims(tensor, leading, start):
+  """Returns leading followed by the dims of tensor from start on.
+
+  The result is a list if these dims are statically known and a Tensor
+  otherwise, so that it can be used in tf.reshape.
+  """
+  rest = tensor.get_shape().as_list()[start:]
+  if None not in rest:
+    return leading + rest
+  return tf.concat(0, [leading, tf.slice(tf.shape(tensor), [start], [-1])])
+
+
+def _project_sequence(sequence, weights, bias=None):
+  """Multiplies every step of sequence by weights with a single matmul.
+
+  The projection of the inputs does not depend on the recurrence, so it is
+  computed on the squashed sequence and cleaved again.  This replaces one small
+  matmul per timestep with a single large one.
+
+  Args:
+    sequence: A list of `[batch, input_size]` Tensors or a TimeMajorSequence.
+    weights: The `[input_size, output_size]` weights.
+    bias: An optional `[output_size]` bias.
+  Returns:
+    A sequence of `[batch, output_size]` Tensors, one for each timestep. This
+    is a TimeMajorSequence if sequence is one.
+  """
+  time_major = isinstance(sequence, prettytensor.TimeMajorSequence)
+  if time_major:
+    inputs = tf.reshape(sequence.tensor,
+                        _shape_with_leading_dims(sequence.tensor, [-1], 2))
+  else:
+    inputs = tf.concat(0, list(sequence))
+  projected = tf.matmul(inputs, weights)
+  if bias is not None:
+    projected = tf.nn.bias_add(projected, bias)
+  if time_major:
+    shape = sequence.tensor.get_shape().as_list()
+    output_size = weights.get_shape()[1].value
+    projected = tf.reshape(projected, [len(sequence), -1, output_size])
+    projected.set_shape([shape[0], shape[1], output_size])
+    return prettytensor.TimeMajorSequence(projected)
+  return tf.split(0, len(sequence), projected)
+
+
 def unwrap_all(*args):
   """Unwraps all of the tensors and returns a list."""
   result = [prettytensor.unwrap(x) for x in args]
   return result
 
 
-def unroll_state_saver(input_layer, name, state_shapes, template, lengths=None):
+def _mask_step(i, lengths, out, states, last_out, last_states):
+  """Keeps the previous values for the examples that are past their length.
+
+  Args:
+    i: The current timestep.
+    lengths: An int32 Tensor with the length of each example.
+    out: The output of this step.
+    states: The states after this step.
+    last_out: The output of the previous step or None for the first step.
+    last_states: The states before this step.
+  Returns:
+    A tuple of the masked output and the list of masked states.
+  """
+  mask = tf.less(i, lengths)
+  if last_out is not None:
+    out = tf.select(mask, prettytensor.unwrap(out), last_out)
+  states = [tf.select(mask, prettytensor.unwrap(new), prettytensor.unwrap(old))
+            for new, old in zip(states, last_states)]
+  return out, states
+
+
+def _dynamic_unroll(input_layer, template, prev_states, max_length,
+                    mask_lengths=None):
+  """Unrolls template over the input sequence with a while loop.
+
+  The first step is built outside of the loop so that any variables are created
+  in the enclosing scope.  The rest of the sequence is packed into a time major
+  Tensor (unless it already is one) and consumed by a `tf.while_loop`, so the
+  size of the graph does not depend on the number of timesteps.
+
+  Args:
+    input_layer: The input sequence.
+    template: A template with unbound variables for input and states that
+      returns a RecurrentResult.
+    prev_states: The initial states.
+    max_length: The maximum length or None; computation stops after this.
+    mask_lengths: An optional int32 Tensor with the length of each example;
+      if provided, the state and output of an example are frozen once its
+      length is reached.
+  Returns:
+    A tuple of the outputs as a TimeMajorSequence, the list of final states and
+    the parameters of the layer.
+  """
+  sequence = input_layer.sequence
+  timesteps = len(sequence)
+  if isinstance(sequence, prettytensor.TimeMajorSequence):
+    # Avoid materializing the individual timesteps.
+    step_shape = sequence.get_shape()
+    first = tf.gather(sequence.tensor, 0)
+    first.set_shape(step_shape)
+    rank = step_shape.ndims + 1
+    rest = tf.slice(sequence.tensor, [1] + [0] * (rank - 1), [-1] * rank)
+  else:
+    step_shape = sequence[0].get_shape()
+    first = sequence[0]
+    rest = tf.pack(list(sequence[1:])) if timesteps > 1 else None
+  with input_layer.g.name_scope('unroll_0'):
+    initial_states = prev_states
+    out, prev_states = template(first, *prev_states)
+    if mask_lengths is not None:
+      _, prev_states = _mask_step(0, mask_lengths, out, prev_states, None,
+                                  initial_states)
+  parameters = out.layer_parameters
+  out = prettytensor.unwrap(out)
+  prev_states = unwrap_all(*prev_states)
+  if timesteps == 1:
+    return [out], prev_states, parameters
+
+  inputs = tensor_array_ops.TensorArray(
+      dtype=first.dtype, size=timesteps - 1).unpack(rest)
+  outputs = tensor_array_ops.TensorArray(dtype=out.dtype, size=timesteps - 1)
+
+  def _step(layer, states):
+    return unwrap_all(*template(layer, *states).flatten())
+
+  def _body(i, outputs, last_out, *states):
+    layer = inputs.read(i - 1)
+    layer.set_shape(step_shape)
+    if max_length is None:
+      result = _step(layer, states)
+    else:
+      result = control_flow_ops.cond(
+          i < max_length,
+          lambda: _step(layer, states),
+          lambda: unwrap_all(last_out, *states))
+    if mask_lengths is not None:
+      masked_out, masked_states = _mask_step(
+          i, mask_lengths, result[0], result[1:], last_out, states)
+      result = [masked_out] + masked_states
+    return [i + 1, outputs.write(i - 1, result[0])] + result
+
+  books = input_layer.bookkeeper
+  summary_collections = books.summary_collections
+  # Summaries can't be fetched from inside of the loop and the first step has
+  # already added them.
+  books.summary_collections = None
+  try:
+    loop_vars = tf.while_loop(lambda i, *unused_args: i < timesteps,
+                              _body,
+                              [tf.constant(1), outputs, out] + prev_states,
+                              name='unroll')
+  finally:
+    books.summary_collections = summary_collections
+  outputs = loop_vars[1].pack()
+  outputs.set_shape([timesteps - 1] + out.get_shape().as_list())
+  results = prettytensor.TimeMajorSequence(
+      tf.concat(0, [tf.expand_dims(out, 0), outputs]))
+  return results, loop_vars[3:], parameters
+
+
+def unroll_state_saver(input_layer,
+                       name,
+                       state_shapes,
+                       template,
+                       lengths=None,
+                       dynamic=False,
+                       mask_lengths=False):
   """Unrolls the given function with state taken from the state saver.
 
   Args:
@@ -198,32 +590,44 @@ def unroll_state_saver(input_layer, name, state_shapes, template, lengths=None):
       returns a RecurrentResult.
     lengths: The length of each item in the batch.  If provided, use this to
       truncate computation.
+    dynamic: If True, run all but the first step in a while loop instead of
+      building a copy of template for each timestep. The variables and the
+      outputs are the same, but the graph does not grow with the number of
+      timesteps.
+    mask_lengths: If True, freeze the state and output of each example once
+      its length is reached instead of only stopping after the longest one.
+      The outputs past the length of an example repeat its last valid output
+      and the saved state is the state at its length.
   Returns:
     A sequence from applying the given template to each item in the input
     sequence.
+  Raises:
+    ValueError: If mask_lengths is set without lengths.
   """
-  state_saver = input_layer.bookkeeper.recurrent_state
-  state_names = [STATE_NAME % name + '_%d' % i
-                 for i in xrange(len(state_shapes))]
-  if isinstance(state_saver, bookkeeper.SimpleStateSaver):
-    for state_name, state_shape in zip(state_names, state_shapes):
-      state_saver.AddState(state_name, input_layer.dtype, state_shape)
+  state_saver, state_names, prev_states = _initial_states(
+      input_layer, name, state_shapes)
   if lengths is not None:
     max_length = tf.reduce_max(lengths)
   else:
     max_length = None
+  if mask_lengths:
+    if lengths is None:
+      raise ValueError('mask_lengths requires lengths.')
+    step_lengths = tf.to_int32(lengths)
+  else:
+    step_lengths = None
 
   results = []
-  prev_states = []
-  for state_name, state_shape in zip(state_names, state_shapes):
-    my_shape = list(state_shape)
-    my_shape[0] = -1
-    prev_states.append(
-        tf.reshape(state_saver.state(state_name), my_shape))
+  if dynamic:
+    results, prev_states, parameters = _dynamic_unroll(
+        input_layer, template, prev_states, max_length, step_lengths)
+    return _save_states(input_layer, state_saver, state_names, prev_states,
+                        results, parameters)
 
   parameters = None
   for i, layer in enumerate(input_layer.sequence):
     with input_layer.g.name_scope('unroll_%00d' % i):
+      last_states = prev_states
       if i > 0 and max_length is not None:
         # TODO(eiderman): Right now the everything after length is undefined.
         # If we can efficiently propagate the last result to the end, then
@@ -238,17 +642,182 @@ def unroll_state_saver(input_layer, name, state_shapes, template, lengths=None):
         prev_states = result[1:]
       else:
         out, prev_states = template(layer, *prev_states)
+      if step_lengths is not None:
+        out, prev_states = _mask_step(i, step_lengths, out, prev_states,
+                                      results[-1] if results else None,
+                                      last_states)
     if parameters is None:
       parameters = out.layer_parameters
     results.append(prettytensor.unwrap(out))
+  return _save_states(input_layer, state_saver, state_names, prev_states,
+                      results, parameters)
+
+
+def _initial_states(input_layer, name, state_shapes):
+  """Registers the states of a layer and returns their initial values.
+
+  Args:
+    input_layer: The input sequence.
+    name: The name of the layer.
+    state_shapes: A list of shapes, one for each state variable.
+  Returns:
+    A tuple of the state saver, the names of the states and their initial
+    values.
+  """
+  state_saver = input_layer.bookkeeper.recurrent_state
+  state_names = [STATE_NAME % name + '_%d' % i
+                 for i in xrange(len(state_shapes))]
+  if isinstance(state_saver, bookkeeper.SimpleStateSaver):
+    for state_name, state_shape in zip(state_names, state_shapes):
+      state_saver.AddState(state_name, input_layer.dtype, state_shape)
+  prev_states = []
+  for state_name, state_shape in zip(state_names, state_shapes):
+    my_shape = list(state_shape)
+    my_shape[0] = -1
+    prev_states.append(
+        tf.reshape(state_saver.state(state_name), my_shape))
+  return state_saver, state_names, prev_states
+
+
+def _time_slice(sequence, start, size):
+  """Returns timesteps [start, start + size) of sequence as one Tensor."""
+  if isinstance(sequence, prettytensor.TimeMajorSequence):
+    rank = sequence.tensor.get_shape().ndims
+    return tf.slice(sequence.tensor, [start] + [0] * (rank - 1),
+                    [size] + [-1] * (rank - 1))
+  return tf.pack(list(sequence[start:start + size]))
+
+
+def _segment_function(cell, size, num_states, shapes, dtype):
+  """Defines a function that applies cell for size timesteps.
+
+  The gradient of a function call recomputes the body, so none of the
+  activations inside of a segment are kept for the backward pass.
+
+  Args:
+    cell: A function from the input, the list of states and the list of
+      parameters of a timestep to its output and the list of new states.
+    size: The number of timesteps.
+    num_states: The number of states.
+    shapes: The shapes of the inputs, the states and the parameters.
+    dtype: The dtype of the inputs, states and parameters.
+  Returns:
+    A function from the `[size, batch, ...]` inputs, the states and the
+    parameters to the `[size, batch, ...]` outputs followed by the new states.
+  """
+
+  def _segment(*args):
+    # The arguments of a function do not have a shape.
+    for arg, shape in zip(args, shapes):
+      arg.set_shape(shape)
+    states = list(args[1:1 + num_states])
+    params = list(args[1 + num_states:])
+    outputs = []
+    for x in tf.unpack(args[0], num=size):
+      out, states = cell(x, states, params)
+      outputs.append(out)
+    return [tf.pack(outputs)] + list(states)
+
+  return function.Defun(*[dtype] * len(shapes))(_segment)
+
+
+def _checkpointed_unroll(input_layer, name, state_shapes, cell, params,
+                         checkpoint_every, parameters):
+  """Unrolls cell and only keeps the states every checkpoint_every steps.
+
+  The sequence is split into segments of checkpoint_every timesteps and each
+  segment is a function call. Backprop only keeps the inputs of each segment
+  and recomputes the activations within it, so the memory for activations
+  scales with `T / checkpoint_every + checkpoint_every` instead of `T` at the
+  cost of running the forward pass twice.
+
+  A function is only defined once for each segment length and then called for
+  every segment, so the cost of building the graph depends on checkpoint_every
+  and not on the length of the sequence.
+
+  Args:
+    input_layer: The input sequence.
+    name: The name of this layer.
+    state_shapes: A list of shapes, one for each state variable. The output of
+      cell must have the shape of the last state.
+    cell: A function from the input, the list of states and the list of
+      parameters of a timestep to its output and the list of new states. It
+      must only use Tensors that are passed in.
+    params: A list of the Tensors that cell uses.
+    checkpoint_every: The number of timesteps in a segment.
+    parameters: The parameters of the layer.
+  Returns:
+    A TimeMajorSequence with the output of each timestep.
+  Raises:
+    ValueError: If checkpoint_every is not positive.
+  """
+  if checkpoint_every <= 0:
+    raise ValueError('checkpoint_every must be > 0: %s' % checkpoint_every)
+  state_saver, state_names, prev_states = _initial_states(
+      input_layer, name, state_shapes)
+  sequence = input_layer.sequence
+  timesteps = len(sequence)
+  functions = {}
+  outputs = []
+  for start in xrange(0, timesteps, checkpoint_every):
+    size = min(checkpoint_every, timesteps - start)
+    with input_layer.g.name_scope('unroll_%d' % start):
+      inputs = _time_slice(sequence, start, size)
+      args = [inputs] + prev_states + params
+      if size not in functions:
+        functions[size] = _segment_function(
+            cell, size, len(prev_states), [x.get_shape() for x in args],
+            input_layer.dtype)
+      result = functions[size](*args)
+    # Function calls do not infer shapes.
+    result[0].set_shape([size] + list(state_shapes[-1]))
+    for state, state_shape in zip(result[1:], state_shapes):
+      state.set_shape(state_shape)
+    outputs.append(result[0])
+    prev_states = list(result[1:])
+  results = prettytensor.TimeMajorSequence(tf.concat(0, outputs))
+  return _save_states(input_layer, state_saver, state_names, prev_states,
+                      results, parameters)
+
+
+def _segment_length(fused, checkpoint_every, cell_function):
+  """Returns the timesteps per function call or None to unroll every step.
+
+  Every function call recomputes its body for the gradient, so cell_function
+  has the training cost of checkpointing with a single timestep per segment.
+  """
+  if cell_function and checkpoint_every is None:
+    checkpoint_every = 1
+  if checkpoint_every is not None and not fused:
+    raise ValueError('checkpoint_every and cell_function require fused.')
+  return checkpoint_every
+
+
+def _check_checkpointing(dynamic, mask_lengths, lengths):
+  if dynamic:
+    raise ValueError('checkpoint_every and cell_function are not supported '
+                     'with dynamic.')
+  if mask_lengths:
+    raise ValueError('checkpoint_every and cell_function are not supported '
+                     'with mask_lengths.')
+  if lengths is not None:
+    raise ValueError('checkpoint_every and cell_function are not supported '
+                     'with lengths.')
+
 
+def _save_states(input_layer, state_saver, state_names, prev_states, results,
+                 parameters):
+  """Saves the final states and returns the results as a sequence."""
   updates = [state_saver.save_state(state_name, prettytensor.unwrap(prev_state))
              for state_name, prev_state in zip(state_names, prev_states)]
 
   # Set it up so that update is evaluated when the result of this method is
   # evaluated by injecting a dependency on an arbitrary result.
   with tf.control_dependencies(updates):
-    results[0] = tf.identity(results[0])
+    if isinstance(results, prettytensor.TimeMajorSequence):
+      results = prettytensor.TimeMajorSequence(tf.identity(results.tensor))
+    else:
+      results[0] = tf.identity(results[0])
   return input_layer.with_sequence(results, parameters=parameters)
 
 
@@ -273,7 +842,12 @@ class sequence_lstm(prettytensor.VarStoreMethod):
                name=PROVIDED,
                stddev=None,
                init=None,
-               lengths=None):
+               lengths=None,
+               fused=False,
+               dynamic=False,
+               mask_lengths=False,
+               checkpoint_every=None,
+               cell_function=False):
     """Creates an unrolled LSTM to process sequence data.
 
     The initial state is drawn from the bookkeeper's recurrent state and if it
@@ -289,12 +863,35 @@ class sequence_lstm(prettytensor.VarStoreMethod):
       init: A tf.*Initializer that is used to initialize the variables.
       lengths: An optional Tensor that encodes a length for each item in the
         minibatch. This is used to truncate computation.
+      fused: Whether to use the fused cell, see `lstm_cell`. The projection of
+        the inputs is computed for all timesteps with a single matmul.
+      dynamic: Whether to unroll with a while loop, see `unroll_state_saver`.
+      mask_lengths: Whether to freeze the state of each example after its
+        length, see `unroll_state_saver`.
+      checkpoint_every: If set, only keep the states every checkpoint_every
+        timesteps for backprop and recompute the activations in between.
+        This trades a second forward pass for memory on long sequences. It
+        requires fused and does not support lengths, dynamic or mask_lengths.
+      cell_function: If True, define the cell once as a graph function and call
+        it for each timestep instead of building the ops of every timestep,
+        so the construction time does not depend on the number of timesteps.
+        The gradient of a graph function runs its body again, so training
+        runs the forward pass of every timestep twice, the same as
+        `checkpoint_every=1`. Set checkpoint_every instead to choose how many
+        timesteps each call covers.
     Returns:
       A sequence with the result at each timestep.
     Raises:
       ValueError: if head is not a sequence, the shape is not rank 2 or the
-        number of nodes (second dim) is not known.
+        number of nodes (second dim) is not known or checkpoint_every or
+        cell_function is used without fused or with lengths, dynamic or
+        mask_lengths.
     """
+    checkpoint_every = _segment_length(fused, checkpoint_every, cell_function)
+    if fused:
+      return self._fused(input_layer, num_units, bias, peephole, name, stddev,
+                         init, lengths, dynamic, mask_lengths,
+                         checkpoint_every)
     if not self.template:
       lstm_template = prettytensor.template('input', input_layer.bookkeeper)
       names = ['c', 'h']
@@ -305,13 +902,61 @@ class sequence_lstm(prettytensor.VarStoreMethod):
                                               bias=bias,
                                               peephole=peephole,
                                               stddev=stddev,
-                                              init=init).as_fn('input', *names)
+                                              init=init,
+                                              fused=fused).as_fn('input',
+                                                                 *names)
 
     batch_size = input_layer.shape[0]
     state_shapes = [[batch_size, num_units],
                     [batch_size, num_units]]
     return unroll_state_saver(input_layer, name, state_shapes, self.template,
-                              lengths)
+                              lengths, dynamic, mask_lengths)
+
+  def _fused(self, input_layer, num_units, bias, peephole, name, stddev, init,
+             lengths, dynamic, mask_lengths, checkpoint_every):
+    """Unrolls a fused LSTM with the input projection hoisted out of the loop.
+
+    The variables are the same as `lstm_cell(fused=True)` creates, only the
+    hidden to hidden matmul is computed in each timestep.
+    """
+    input_size = input_layer.shape[1]
+    if input_size is None:
+      raise ValueError('Number of input nodes must be known.')
+    with scopes.var_and_name_scope(('fused_lstm_cell', None)):
+      weights, bias_var, peepholes = _fused_lstm_variables(
+          self, input_size, num_units, bias, peephole, stddev, init,
+          input_layer.dtype)
+    projected = _project_sequence(
+        input_layer.sequence, tf.slice(weights, [0, 0], [input_size, -1]),
+        bias_var)
+    hidden_weights = tf.slice(weights, [input_size, 0], [-1, -1])
+    params = [hidden_weights]
+    if peephole:
+      params.append(peepholes)
+
+    def _cell(x, states, params):
+      c, h = states
+      activation = x + tf.matmul(h, params[0])
+      new_c, new_h = _fused_lstm_gates(activation, c, num_units,
+                                       params[1] if peephole else None)
+      return new_h, [new_c, new_h]
+
+    def _step(x, c, h):
+      new_h, states = _cell(x, [c, h], params)
+      return RecurrentResult(
+          input_layer.with_tensor(new_h, parameters=self.vars), states)
+
+    batch_size = input_layer.shape[0]
+    state_shapes = [[batch_size, num_units],
+                    [batch_size, num_units]]
+    if checkpoint_every is not None:
+      _check_checkpointing(dynamic, mask_lengths, lengths)
+      return _checkpointed_unroll(input_layer.with_sequence(projected), name,
+                                  state_shapes, _cell, params,
+                                  checkpoint_every, self.vars)
+    return unroll_state_saver(input_layer.with_sequence(projected), name,
+                              state_shapes, _step, lengths, dynamic,
+                              mask_lengths)
 
 
 # pylint: disable=invalid-name
@@ -334,7 +979,12 @@ class sequence_gru(prettytensor.VarStoreMethod):
                name=PROVIDED,
                stddev=None,
                init=None,
-               lengths=None):
+               lengths=None,
+               fused=False,
+               dynamic=False,
+               mask_lengths=False,
+               checkpoint_every=None,
+               cell_function=False):
     """Creates an unrolled GRU to process sequence data.
 
     The initial state is drawn from the bookkeeper's recurrent state and if it
@@ -349,12 +999,35 @@ class sequence_gru(prettytensor.VarStoreMethod):
       init: A tf.*Initializer that is used to initialize the variables.
       lengths: An optional Tensor that encodes a length for each item in the
         minibatch. This is used to truncate computation.
+      fused: If True, compute the input projections of all timesteps with a
+        single matmul before unrolling. The variables are the same as for the
+        default GRU.
+      dynamic: Whether to unroll with a while loop, see `unroll_state_saver`.
+      mask_lengths: Whether to freeze the state of each example after its
+        length, see `unroll_state_saver`.
+      checkpoint_every: If set, only keep the states every checkpoint_every
+        timesteps for backprop and recompute the activations in between.
+        This trades a second forward pass for memory on long sequences. It
+        requires fused and does not support lengths, dynamic or mask_lengths.
+      cell_function: If True, define the cell once as a graph function and call
+        it for each timestep instead of building the ops of every timestep,
+        so the construction time does not depend on the number of timesteps.
+        The gradient of a graph function runs its body again, so training
+        runs the forward pass of every timestep twice, the same as
+        `checkpoint_every=1`. Set checkpoint_every instead to choose how many
+        timesteps each call covers.
     Returns:
       A sequence with the result at each timestep.
     Raises:
       ValueError: if head is not a sequence, the shape is not rank 2 or the
-        number of nodes (second dim) is not known.
+        number of nodes (second dim) is not known or checkpoint_every or
+        cell_function is used without fused or with lengths, dynamic or
+        mask_lengths.
     """
+    checkpoint_every = _segment_length(fused, checkpoint_every, cell_function)
+    if fused:
+      return self._fused(input_layer, num_units, bias, name, stddev, init,
+                         lengths, dynamic, mask_lengths, checkpoint_every)
     if not self.template:
       gru_template = prettytensor.template('input', input_layer.bookkeeper)
       self.template = gru_template.gru_cell(
@@ -366,11 +1039,187 @@ class sequence_gru(prettytensor.VarStoreMethod):
 
     batch_size = input_layer.shape[0]
     return unroll_state_saver(input_layer, name, [(batch_size, num_units)],
-                              self.template, lengths)
+                              self.template, lengths, dynamic, mask_lengths)
+
+  def _fused(self, input_layer, num_units, bias, name, stddev, init, lengths,
+             dynamic, mask_lengths, checkpoint_every):
+    """Unrolls a GRU with the input projection hoisted out of the loop."""
+    input_size = input_layer.shape[1]
+    if input_size is None:
+      raise ValueError('Number of input nodes must be known.')
+    dtype = input_layer.dtype
+    parameters = {}
+    weights = []
+    biases = []
+    # Mirror the variables of the two fully_connected layers in gru_cell. We
+    # start with bias of 1.0 to not reset and not update.
+    for scope_name, size, bias_init in (('fully_connected', 2 * num_units, 1.),
+                                        ('fully_connected_1', num_units, 0.)):
+      var_store = prettytensor.VarStoreMethod()
+      with scopes.var_and_name_scope((scope_name, None)):
+        weights.append(var_store.variable(
+            'weights', [input_size + num_units, size],
+            _weight_init(init, stddev, input_size + num_units, size),
+            dt=dtype))
+        if bias:
+          biases.append(var_store.variable(
+              'bias', [size], tf.constant_initializer(bias_init), dt=dtype))
+      for var_name, var in six.iteritems(var_store.vars):
+        parameters['%s/%s' % (scope_name, var_name)] = var
+
+    # Both layers see the input, so project it for both with one matmul.
+    projected = _project_sequence(
+        input_layer.sequence,
+        tf.concat(1, [tf.slice(w, [0, 0], [input_size, -1]) for w in weights]),
+        tf.concat(0, biases) if bias else None)
+    params = [tf.slice(w, [input_size, 0], [-1, -1]) for w in weights]
+
+    def _cell(x, states, params):
+      h, = states
+      gate_weights, candidate_weights = params
+      gates = tf.slice(x, [0, 0], [-1, 2 * num_units])
+      r, u = tf.split(1, 2, tf.sigmoid(gates + tf.matmul(h, gate_weights)))
+      c = tf.tanh(tf.slice(x, [0, 2 * num_units], [-1, num_units]) +
+                  tf.matmul(r * h, candidate_weights))
+      new_h = u * h + (1 - u) * c
+      return new_h, [new_h]
+
+    def _step(x, h):
+      new_h, states = _cell(x, [h], params)
+      return RecurrentResult(
+          input_layer.with_tensor(new_h, parameters=parameters), states)
+
+    batch_size = input_layer.shape[0]
+    state_shapes = [(batch_size, num_units)]
+    if checkpoint_every is not None:
+      _check_checkpointing(dynamic, mask_lengths, lengths)
+      return _checkpointed_unroll(input_layer.with_sequence(projected), name,
+                                  state_shapes, _cell, params,
+                                  checkpoint_every, parameters)
+    return unroll_state_saver(input_layer.with_sequence(projected), name,
+                              state_shapes, _step, lengths, dynamic,
+                              mask_lengths)
+
+
+def _reverse_time(tensor, lengths=None):
+  """Reverses a time major Tensor, only within lengths if provided."""
+  if lengths is None:
+    rank = tensor.get_shape().ndims
+    return tf.reverse(tensor, [True] + [False] * (rank - 1))
+  return tf.reverse_sequence(tensor, tf.to_int64(lengths), seq_dim=0,
+                             batch_dim=1)
+
+
+@prettytensor.Register
+def bidirectional_sequence_lstm(input_layer,
+                                num_units,
+                                bias=True,
+                                peephole=True,
+                                name=PROVIDED,
+                                stddev=None,
+                                init=None,
+                                lengths=None,
+                                merge_mode='concat'):
+  """Runs a forward and a backward LSTM over the sequence in one pass.
+
+  The two directions have their own fused LSTM variables in the `forward` and
+  `backward` scopes (the same as `sequence_lstm(fused=True, name='forward')`
+  would create), but they are stacked so that the input projection of both
+  directions is a single matmul over the time major sequence and each
+  timestep runs a single batched matmul for both directions.
+
+  Both directions start from a zero state and their state is not saved.
+
+  Args:
+    input_layer: PrettyTensor (provided).
+    num_units: Number of nodes in the hidden states of each direction.
+    bias: Whether or not to use a bias.
+    peephole: Whether to use peephole connections.
+    name: The name of this layer.
+    stddev: Standard deviation for Gaussian initialization of parameters.
+    init: A tf.*Initializer that is used to initialize the variables.
+    lengths: An optional Tensor with the length of each item in the minibatch.
+      If provided, the backward direction starts at the last valid timestep
+      of each example instead of at the padding.
+    merge_mode: How to combine the directions at each timestep, either
+      'concat' or 'sum'.
+  Returns:
+    A time major sequence with the merged output at each timestep.
+  Raises:
+    ValueError: if head is not a sequence, the number of input nodes is not
+      known or merge_mode is not supported.
+  """
+  _ = name  # Used for scoping by PT.
+  if merge_mode not in ('concat', 'sum'):
+    raise ValueError('merge_mode must be concat or sum: %s' % merge_mode)
+  input_size = input_layer.shape[1]
+  if input_size is None:
+    raise ValueError('Number of input nodes must be known.')
+  sequence = input_layer.sequence
+  timesteps = len(sequence)
+  dtype = input_layer.dtype
+
+  parameters = {}
+  input_weights = []
+  hidden_weights = []
+  biases = []
+  peepholes = []
+  for direction in ('forward', 'backward'):
+    var_store = prettytensor.VarStoreMethod()
+    with scopes.var_and_name_scope((direction, None)):
+      with scopes.var_and_name_scope(('fused_lstm_cell', None)):
+        weights, bias_var, peephole_var = _fused_lstm_variables(
+            var_store, input_size, num_units, bias, peephole, stddev, init,
+            dtype)
+    for var_name, var in six.iteritems(var_store.vars):
+      parameters['%s/%s' % (direction, var_name)] = var
+    input_weights.append(tf.slice(weights, [0, 0], [input_size, -1]))
+    hidden_weights.append(tf.slice(weights, [input_size, 0], [-1, -1]))
+    biases.append(bias_var)
+    peepholes.append(peephole_var)
+
+  # Project both directions at once and then reverse the backward half, the
+  # result is [time, direction, batch, 4 * num_units].
+  projected = _project_sequence(
+      prettytensor.TimeMajorSequence(_time_slice(sequence, 0, timesteps)),
+      tf.concat(1, input_weights), tf.concat(0, biases) if bias else None)
+  forward, backward = tf.split(2, 2, projected.tensor)
+  projected = tf.concat(1, [tf.expand_dims(forward, 1),
+                            tf.expand_dims(_reverse_time(backward, lengths),
+                                           1)])
+
+  hidden_weights = tf.pack(hidden_weights)
+  if peephole:
+    peepholes = tf.reshape(tf.pack(peepholes), [2, 1, 3 * num_units])
+  else:
+    peepholes = None
+  steps = tf.unpack(projected, num=timesteps)
+  c = h = tf.zeros(
+      tf.concat(0, [[2], tf.slice(tf.shape(steps[0]), [1], [1]), [num_units]]),
+      dtype=dtype)
+  c.set_shape([2, input_layer.shape[0], num_units])
+  outputs = []
+  for i, x in enumerate(steps):
+    with input_layer.g.name_scope('unroll_%d' % i):
+      activation = x + tf.batch_matmul(h, hidden_weights)
+      c, h = _fused_lstm_gates(activation, c, num_units, peepholes)
+    outputs.append(h)
+
+  forward, backward = tf.split(1, 2, tf.pack(outputs))
+  forward = tf.squeeze(forward, [1])
+  backward = _reverse_time(tf.squeeze(backward, [1]), lengths)
+  if merge_mode == 'concat':
+    result = tf.concat(2, [forward, backward])
+  else:
+    result = forward + backward
+  result.set_shape([timesteps, input_layer.shape[0],
+                    2 * num_units if merge_mode == 'concat' else num_units])
+  return input_layer.with_sequence(prettytensor.TimeMajorSequence(result),
+                                   parameters=parameters)
 
 
 @prettytensor.Register
-def squash_sequence(input_layer):
+def squash_sequence(input_layer, lengths=None):
   """"Squashes a sequence into a single Tensor with dim 1 being time*batch.
 
   A sequence is an array of Tensors, which is not appropriate for most
@@ -378,35 +1227,59 @@ def squash_sequence(input_layer):
 
   Defaults are assigned such that cleave_sequence requires no args.
 
+  If lengths are provided, then only the valid timesteps of each example are
+  kept, so that a classifier and its loss only run on real data.  The same
+  lengths should be used to squash the labels.  The result is ordered by
+  timestep and then by example and cannot be cleaved.
+
   Args:
     input_layer: The input layer.
+    lengths: An optional Tensor that encodes a length for each item in the
+      minibatch.
   Returns:
     A PrettyTensor containing a single tensor with the first dim containing
     both time and batch.
   Raises:
     ValueError: If the sequence is empty.
   """
-  timesteps = len(input_layer.sequence)
+  sequence = input_layer.sequence
+  timesteps = len(sequence)
   if not timesteps:
     raise ValueError('Empty tensor sequence.')
+  elif isinstance(sequence, prettytensor.TimeMajorSequence):
+    # Merging time and batch is free for a time major Tensor.
+    result = tf.reshape(sequence.tensor,
+                        _shape_with_leading_dims(sequence.tensor, [-1], 2))
   elif timesteps == 1:
-    result = input_layer.sequence[0]
+    result = sequence[0]
   else:
-    result = tf.concat(0, input_layer.sequence)
-  return input_layer.with_tensor(result).with_defaults(unroll=timesteps)
-
-
-@prettytensor.Register(assign_defaults='unroll')
-def cleave_sequence(input_layer, unroll=None):
+    result = tf.concat(0, sequence)
+  if lengths is None:
+    return input_layer.with_tensor(result).with_defaults(unroll=timesteps)
+  # Row t * batch + b of the squashed tensor is timestep t of example b.
+  mask = tf.less(tf.expand_dims(tf.range(0, timesteps), 1),
+                 tf.expand_dims(tf.to_int32(lengths), 0))
+  return input_layer.with_tensor(
+      tf.boolean_mask(result, tf.reshape(mask, [-1])))
+
+
+@prettytensor.Register(assign_defaults=('unroll', 'time_major'))
+def cleave_sequence(input_layer, unroll=None, time_major=False):
   """Cleaves a tensor into a sequence, this is the inverse of squash.
 
   Recurrent methods unroll across an array of Tensors with each one being a
   timestep.  This cleaves the first dim so that each it is an array of Tensors.
   It is the inverse of squash_sequence.
 
+  With `time_major`, the result is a TimeMajorSequence that is backed by a
+  single `[unroll, batch, ...]` Tensor.  This is a reshape and the individual
+  timesteps are only split out if they are accessed, so for example squashing
+  it again is free.
+
   Args:
     input_layer: The input layer.
     unroll: The number of time steps.
+    time_major: Whether to create a TimeMajorSequence.
   Returns:
     A PrettyTensor containing an array of tensors.
   Raises:
@@ -422,6 +1295,14 @@ def cleave_sequence(input_layer, unroll=None):
 
   if unroll <= 0:
     raise ValueError('Unroll must be > 0: %s' % unroll)
+  elif time_major:
+    tensor = input_layer.tensor
+    splits = tf.reshape(tensor,
+                        _shape_with_leading_dims(tensor, [unroll, -1], 1))
+    splits.set_shape(
+        [unroll, shape[0] // unroll if shape[0] is not None else None] +
+        shape[1:])
+    splits = prettytensor.TimeMajorSequence(splits)
   elif unroll == 1:
     splits = [input_layer.tensor]
   else:
@@ -437,7 +1318,8 @@ def cleave_sequence(input_layer, unroll=None):
 
 
 # pylint: disable=invalid-name
-@prettytensor.Register
+@prettytensor.Register(
+    assign_defaults=('partitions', 'partition_strategy', 'dedupe'))
 class embedding_lookup(prettytensor.VarStoreMethod):
 
   def __call__(self,
@@ -445,7 +1327,10 @@ class embedding_lookup(prettytensor.VarStoreMethod):
                embedding_count,
                embedding_shape,
                name=PROVIDED,
-               init=None):
+               init=None,
+               partitions=1,
+               partition_strategy='mod',
+               dedupe=False):
     """Looks up values in a learned embedding lookup.
 
     `embedding_count` embedding tensors are created each with shape
@@ -460,6 +1345,12 @@ class embedding_lookup(prettytensor.VarStoreMethod):
     N.B. This uses  tf.nn.embedding_lookup under the hood, so by default the
     lookup is id % embedding_count
 
+    Large tables can be split into `partitions` variables named `params_0`,
+    `params_1`, ... that can be placed on different devices.  Ids are assigned
+    to the shards as described in tf.nn.embedding_lookup.  With `dedupe`, each
+    distinct id in the input is only gathered once, which also makes the rows
+    of the sparse gradient unique.
+
     Args:
       input_layer: PrettyTensor (provided).
       embedding_count: Number of items in the embedding.
@@ -467,10 +1358,14 @@ class embedding_lookup(prettytensor.VarStoreMethod):
       name: The name of this layer.
       init: tf.*Initializer to use for initializing the input or a Tensor.
         Defaults to a truncated normal.
+      partitions: The number of variables to split the embedding into.
+      partition_strategy: Either 'mod' or 'div', see tf.nn.embedding_lookup.
+      dedupe: If True, look up the unique ids and then gather the result.
     Returns:
       input_layer
     Raises:
-      ValueError: If head is not a rank 2 Tensor with second dim of 1.
+      ValueError: If head is not a rank 2 Tensor with second dim of 1 or the
+        partitioning is invalid.
     """
     head = input_layer.tensor
     if len(input_layer.shape) == 2:
@@ -488,12 +1383,36 @@ class embedding_lookup(prettytensor.VarStoreMethod):
         size *= dim
       init = tf.truncated_normal_initializer(stddev=1. / math.sqrt(size))
 
-    embeddings = self.variable('params', full_shape, init=init)
+    if partition_strategy not in ('mod', 'div'):
+      raise ValueError('Unknown partition_strategy: %s' % partition_strategy)
+    if partitions > 1:
+      if partitions > embedding_count:
+        raise ValueError('More partitions than embeddings: %d > %d' %
+                         (partitions, embedding_count))
+      if not callable(init):
+        raise ValueError('Partitioned embeddings require an initializer.')
+      embeddings = []
+      for i in xrange(partitions):
+        # Both strategies put one extra id in the first
+        # embedding_count % partitions shards.
+        rows = embedding_count // partitions
+        if i < embedding_count % partitions:
+          rows += 1
+        embeddings.append(self.variable(
+            'params_%d' % i, [rows] + full_shape[1:], init=init))
+    else:
+      embeddings = self.variable('params', full_shape, init=init)
 
     name = 'params_1' if name == 'params' else name
-    return input_layer.with_tensor(
-        tf.nn.embedding_lookup(embeddings, head, name=name),
-        parameters=self.vars)
+    if dedupe:
+      unique_ids, positions = tf.unique(head)
+      unique_embeddings = tf.nn.embedding_lookup(
+          embeddings, unique_ids, partition_strategy=partition_strategy)
+      result = tf.gather(unique_embeddings, positions, name=name)
+    else:
+      result = tf.nn.embedding_lookup(
+          embeddings, head, partition_strategy=partition_strategy, name=name)
+    return input_layer.with_tensor(result, parameters=self.vars)
 
 
 # TODO(eiderman): It would be nice to have a mechanism where a network could
@@ -537,7 +1456,12 @@ def create_sequence_pretty_tensor(sequence_input, shape=None, save_state=True):
 
 
 class RecurrentRunner(object):
-  """A helper class for managing states for recurrent neural net inference."""
+  """A helper class for managing states for recurrent neural net inference.
+
+  The states are kept in buffers that are updated in place, so `run` and the
+  steps created by `prepare` share them.  A buffer is only reallocated when the
+  batch size changes.
+  """
 
   def __init__(self, batch_size=1):
     self._state_feeds = {}
@@ -553,13 +1477,14 @@ class RecurrentRunner(object):
       if shape[0] == 0:
         shape[0] = batch_size
       feed_name = state['feed_op'].name
-      self._state_feeds[feed_name] = numpy.zeros(tuple(shape))
+      self._state_feeds[feed_name] = numpy.zeros(
+          tuple(shape), dtype=state['feed_type'].as_numpy_dtype)
       self._state_feed_names.append(feed_name)
       self._state_fetches.append(state['fetch_name'])
 
   def reset(self):
-    self._state_feeds = {k: numpy.zeros_like(v)
-                         for k, v in six.iteritems(self._state_feeds)}
+    for state in six.itervalues(self._state_feeds):
+      state.fill(0)
 
   def run(self, fetch_list, feed_dict=None, sess=None):
     """Runs the graph with the provided feeds and fetches.
@@ -593,8 +1518,531 @@ class RecurrentRunner(object):
     fetches = sess.run(all_fetches_list, all_feeds_dict)
 
     # Update the feeds for the next time step.
-    states = fetches[len(fetch_list):]
-    for i, s in enumerate(states):
-      self._state_feeds[self._state_feed_names[i]] = s
-
+    self._store_states(fetches[len(fetch_list):])
     return fetches[:len(fetch_list)]
+
+  def _store_states(self, states):
+    """Copies the new states into the buffers.
+
+    A buffer is replaced if the batch size changed, e.g. for a short final
+    batch, otherwise it is updated in place.
+
+    Args:
+      states: The new value of each state in the order of _state_feed_names.
+    """
+    for name, state in zip(self._state_feed_names, states):
+      buf = self._state_feeds[name]
+      if buf.shape == state.shape:
+        buf[...] = state
+      else:
+        self._state_feeds[name] = state
+
+  def prepare(self, fetch_list, feed_list=(), sess=None):
+    """Resolves the feeds and fetches of a step once for repeated calls.
+
+    `run` has to look up the graph, merge the feeds and build the fetches on
+    every call.  The returned function does all of that once and only feeds
+    the new values and copies the new states into the state buffers, e.g.:
+
+        step = runner.prepare([output], [placeholder], sess=sess)
+        for x in inputs:
+          result, = step(x)
+
+    Args:
+      fetch_list: A list of requested output tensors.
+      feed_list: A list of the tensors that are fed on each step. Optional.
+      sess: The Tensorflow session to run. Can be None.
+    Returns:
+      A function that takes a value for each tensor in feed_list, runs a step
+      and returns the requested tensors as numpy arrays.
+    Raises:
+      ValueError: If the default graph during object construction was
+      different from the current default graph.
+    """
+    if tf.get_default_graph() != self._graph:
+      raise ValueError('The current default graph is different from the graph'
+                       ' used at construction time of RecurrentRunner.')
+    graph = self._graph
+    num_fetches = len(fetch_list)
+    fetches = [graph.as_graph_element(x)
+               for x in list(fetch_list) + self._state_fetches]
+    feeds = [graph.as_graph_element(x) for x in feed_list]
+    state_feeds = [(graph.as_graph_element(name), name)
+                   for name in self._state_feed_names]
+    feed_dict = {}
+    run = (sess or tf.get_default_session()).run
+
+    def _step(*feed_values):
+      feed_dict.update(zip(feeds, feed_values))
+      for feed, name in state_feeds:
+        feed_dict[feed] = self._state_feeds[name]
+      results = run(fetches, feed_dict)
+      self._store_states(results[num_fetches:])
+      return results[:num_fetches]
+
+    return _step
+
+
+class BatchedRecurrentRunner(object):
+  """Runs many independent sequences through a recurrent network in a batch.
+
+  Each sequence (a stream) is assigned a slot in a batched state matrix.
+  Inputs for a stream are queued with `submit` and every call to `tick` runs
+  a single step for each stream with a pending input, all in one `sess.run`.
+  The graph must have been built with an unspecified batch size, e.g.:
+
+      runner = BatchedRecurrentRunner(max_streams=64)
+      stream = runner.add_stream()
+      runner.submit(stream, {placeholder.name: x})
+      outputs = runner.tick([output.name], sess=sess)[stream]
+
+  Streams can be added, removed and reset independently of each other.
+  """
+
+  def __init__(self, max_streams, max_batch_size=None):
+    """Creates a runner for the recurrent states in the default graph.
+
+    Args:
+      max_streams: The maximum number of concurrent streams.
+      max_batch_size: The maximum number of streams that are run in a single
+        tick, defaults to max_streams.  Streams that are not run wait for the
+        next tick.
+    """
+    self._max_streams = max_streams
+    self._max_batch_size = max_batch_size or max_streams
+    self._graph = tf.get_default_graph()
+    self._state_feed_names = []
+    self._state_fetches = []
+    self._states = []
+    statesaver = bookkeeper.recurrent_state()
+    for state in six.itervalues(statesaver.GetStateDescriptors()):
+      shape = [d.size for d in state['feed_shape'].dim]
+      self._state_feed_names.append(state['feed_op'].name)
+      self._state_fetches.append(state['fetch_name'])
+      self._states.append(numpy.zeros(
+          [max_streams] + shape[1:], dtype=state['feed_type'].as_numpy_dtype))
+    self._free_slots = list(reversed(xrange(max_streams)))
+    self._pending = collections.OrderedDict()
+
+  @property
+  def active_streams(self):
+    """The slots of all active streams."""
+    return list(six.iterkeys(self._pending))
+
+  def add_stream(self):
+    """Adds a new stream with a zero state and returns its slot.
+
+    Returns:
+      The slot of the stream, used for all other calls.
+    Raises:
+      ValueError: If all slots are in use.
+    """
+    if not self._free_slots:
+      raise ValueError('All %d streams are in use.' % self._max_streams)
+    slot = self._free_slots.pop()
+    self.reset_stream(slot)
+    self._pending[slot] = collections.deque()
+    return slot
+
+  def remove_stream(self, slot):
+    """Removes the stream and drops any pending inputs."""
+    self._check_slot(slot)
+    del self._pending[slot]
+    self._free_slots.append(slot)
+
+  def reset_stream(self, slot):
+    """Resets the state of a stream to zero."""
+    for state in self._states:
+      state[slot] = 0
+
+  def submit(self, slot, feed_dict):
+    """Queues the inputs of a single step for a stream.
+
+    Args:
+      slot: The stream.
+      feed_dict: A dictionary of feeds for a single example, without the batch
+        dimension.
+    """
+    self._check_slot(slot)
+    self._pending[slot].append(feed_dict)
+
+  def tick(self, fetch_list, sess=None):
+    """Runs one step for every stream with a pending input.
+
+    Args:
+      fetch_list: A list of requested output tensors, each must have the batch
+        as its first dimension.
+      sess: The Tensorflow session to run. Can be None.
+    Returns:
+      A dict of slot to the list of fetched values for that stream.
+    Raises:
+      ValueError: If the default graph during object construction was
+      different from the current default graph or if the next inputs of the
+      streams do not have the same keys; they stay queued in that case.
+    """
+    if tf.get_default_graph() != self._graph:
+      raise ValueError('The current default graph is different from the graph'
+                       ' used at construction time of BatchedRecurrentRunner.')
+    slots = [slot for slot, pending in six.iteritems(self._pending)
+             if pending][:self._max_batch_size]
+    if not slots:
+      return {}
+    keys = set(self._pending[slots[0]][0])
+    for slot in slots[1:]:
+      if set(self._pending[slot][0]) != keys:
+        raise ValueError(
+            'Streams %s and %s fed different keys: %s vs %s' %
+            (slots[0], slot, sorted(keys), sorted(self._pending[slot][0])))
+    feeds = [self._pending[slot].popleft() for slot in slots]
+    all_feeds_dict = {}
+    for key in feeds[0]:
+      all_feeds_dict[key] = numpy.stack([feed[key] for feed in feeds])
+    for feed_name, state in zip(self._state_feed_names, self._states):
+      all_feeds_dict[feed_name] = state[slots]
+
+    sess = sess or tf.get_default_session()
+    fetches = sess.run(list(fetch_list) + self._state_fetches, all_feeds_dict)
+
+    for state, new_state in zip(self._states, fetches[len(fetch_list):]):
+      state[slots] = new_state
+    outputs = fetches[:len(fetch_list)]
+    return {slot: [output[i] for output in outputs]
+            for i, slot in enumerate(slots)}
+
+  def _check_slot(self, slot):
+    if slot not in self._pending:
+      raise ValueError('Stream %s is not active.' % slot)
+
+
+SampledSequence = collections.namedtuple('SampledSequence',
+                                         ['tokens', 'lengths'])
+
+
+class _LoopStateSaver(bookkeeper.SimpleStateSaver):
+  """A state saver that threads the recurrent states through a while loop.
+
+  Outside of the loop this behaves like SimpleStateSaver.  Inside of the loop,
+  `state` returns the loop variables in `loop_states` and `save_state` records
+  the new value so that it can be passed to the next iteration.
+  """
+  # pylint: disable=invalid-name
+
+  def __init__(self):
+    super(_LoopStateSaver, self).__init__()
+    self.loop_states = None
+    self.saved_states = {}
+
+  def AddState(self, state_name, dtype, shape):
+    if state_name not in self._states:
+      super(_LoopStateSaver, self).AddState(state_name, dtype, shape)
+
+  def state(self, state_name):
+    if self.loop_states is not None:
+      return self.loop_states[state_name]
+    return super(_LoopStateSaver, self).state(state_name)
+
+  def save_state(self, state_name, tensor):
+    self.saved_states[state_name] = tensor
+    return tf.no_op(name='%s_fetch' % state_name)
+
+
+@contextlib.contextmanager
+def _loop_state_saver(books):
+  """Replaces the recurrent state saver of books with a _LoopStateSaver."""
+  old_state_saver = books.recurrent_state
+  state_saver = _LoopStateSaver()
+  books.recurrent_state = state_saver
+  try:
+    yield state_saver
+  finally:
+    books.recurrent_state = old_state_saver
+
+
+def _loop_step(books, state_saver, step, inputs, states):
+  """Builds step inside of a loop with the given states.
+
+  Args:
+    books: The bookkeeper.
+    state_saver: The _LoopStateSaver.
+    step: The step function.
+    inputs: The inputs for step.
+    states: A dict of state name to the state before this step.
+  Returns:
+    A tuple of the output of step and a dict of the new states.
+  """
+  summary_collections = books.summary_collections
+  # Summaries can't be fetched from inside of the loop.
+  books.summary_collections = None
+  state_saver.loop_states = states
+  try:
+    result = prettytensor.unwrap(step(inputs))
+  finally:
+    state_saver.loop_states = None
+    books.summary_collections = summary_collections
+  return result, dict(state_saver.saved_states)
+
+
+def _select_tokens(logits, temperature, greedy, dtype):
+  """Chooses the next token from logits."""
+  if greedy:
+    tokens = tf.argmax(logits, 1)
+  else:
+    tokens = tf.squeeze(tf.multinomial(logits / temperature, 1), [1])
+  return tf.cast(tokens, dtype)
+
+
+def _write_column(buf, position, values, width):
+  """Returns buf with column position set to values; buf must be zero there."""
+  column = tf.cast(tf.equal(tf.range(0, width), position), buf.dtype)
+  return buf + tf.expand_dims(values, 1) * tf.expand_dims(column, 0)
+
+
+def _fill_columns(buf, start, value, width):
+  """Returns buf with the columns from start on set to value.
+
+  buf must be zero in those columns.
+  """
+  columns = tf.cast(tf.greater_equal(tf.range(0, width), start), buf.dtype)
+  return buf + tf.cast(value, buf.dtype) * tf.expand_dims(columns, 0)
+
+
+def sample_sequence(step,
+                    prime,
+                    max_length,
+                    temperature=1.0,
+                    greedy=False,
+                    eos=None,
+                    name='sample_sequence'):
+  """Samples a sequence from a recurrent model entirely inside of the graph.
+
+  `step` builds a single timestep of the model: it takes a `[batch]` Tensor of
+  tokens and returns the `[batch, vocab]` logits for the next token.  It must
+  draw its recurrent state from the bookkeeper's state saver, e.g. by using
+  `sequence_lstm` on a sequence of length 1, and it must reuse the variables
+  of the trained model:
+
+      def step(tokens):
+        with tf.variable_scope('model', reuse=True):
+          return create_model(pt.wrap(tokens).reshape([-1, 1]), 1)
+
+      result = recurrent_networks.sample_sequence(step, prime, 128)
+
+  The priming tokens are fed through the model first and then each sampled
+  token is fed back in until `max_length` tokens are drawn or every sequence
+  has produced `eos`.  All of this happens in a single `sess.run` call.
+
+  Args:
+    step: A function that builds one step of the model.
+    prime: An int Tensor with shape `[batch, prime_length]` of priming tokens,
+      prime_length must be known and at least 1.
+    max_length: The maximum number of tokens to sample.
+    temperature: The logits are divided by this before sampling; a higher
+      value selects less likely choices.
+    greedy: If True, always take the most likely token instead of sampling.
+    eos: An optional end of sequence token; a sequence stops after it and the
+      remaining tokens are also set to eos.
+    name: The name of this operation.
+  Returns:
+    A SampledSequence with the `[batch, max_length]` tokens and the `[batch]`
+    lengths, including eos.
+  Raises:
+    ValueError: If the shape of prime is not known.
+  """
+  prime = tf.convert_to_tensor(prime)
+  prime_length = prime.get_shape()[1].value
+  if prime.get_shape().ndims != 2 or not prime_length:
+    raise ValueError('prime must be rank 2 with a known second dimension: %s' %
+                     prime.get_shape())
+  books = bookkeeper.for_default_graph()
+  # The first token is sampled after the last priming token.
+  first = prime_length - 1
+  steps = first + max_length
+  time_major_prime = tf.transpose(prime)
+
+  with tf.name_scope(name), _loop_state_saver(books) as state_saver:
+    # The first step is built outside of the loop so that all of the states are
+    # registered and any variables are created in the enclosing scope.
+    logits = prettytensor.unwrap(step(time_major_prime[0]))
+    state_names = sorted(state_saver.saved_states)
+    states = [state_saver.saved_states[n] for n in state_names]
+
+    def _next(i, logits, finished, lengths, tokens):
+      """Selects the next token and updates the bookkeeping."""
+      token = _select_tokens(logits, temperature, greedy, prime.dtype)
+      position = i - first
+      generated = tf.greater_equal(position, 0)
+      active = tf.logical_and(generated, tf.logical_not(finished))
+      if eos is not None:
+        token = tf.select(finished, tf.fill(tf.shape(token),
+                                            tf.cast(eos, prime.dtype)), token)
+        finished = tf.logical_or(
+            finished,
+            tf.logical_and(generated, tf.equal(token, tf.cast(eos,
+                                                              prime.dtype))))
+      lengths += tf.to_int32(active)
+      tokens = _write_column(tokens, position, token, max_length)
+      return token, finished, lengths, tokens
+
+    batch = tf.shape(prime)[0:1]
+    token, finished, lengths, tokens = _next(
+        tf.constant(0),
+        logits,
+        tf.fill(batch, False),
+        tf.zeros(batch, tf.int32),
+        tf.zeros(tf.concat(0, [batch, [max_length]]), prime.dtype))
+
+    def _cond(i, unused_token, finished, *unused_args):
+      return tf.logical_and(i < steps,
+                            tf.logical_not(tf.reduce_all(finished)))
+
+    def _body(i, token, finished, lengths, tokens, *states):
+      inputs = control_flow_ops.cond(
+          i < prime_length,
+          lambda: tf.gather(time_major_prime, tf.minimum(i, first)),
+          lambda: token)
+      inputs.set_shape(token.get_shape())
+      logits, new_states = _loop_step(books, state_saver, step, inputs,
+                                      dict(zip(state_names, states)))
+      next_values = _next(i, logits, finished, lengths, tokens)
+      return ([i + 1] + list(next_values) +
+              [new_states[n] for n in state_names])
+
+    loop_vars = tf.while_loop(
+        _cond, _body, [tf.constant(1), token, finished, lengths, tokens] +
+        states)
+    tokens = loop_vars[4]
+    if eos is not None:
+      # The loop stops early once every sequence has finished.
+      tokens = _fill_columns(tokens, loop_vars[0] - first, eos, max_length)
+  return SampledSequence(tokens, loop_vars[3])
+
+
+BeamSearchResult = collections.namedtuple('BeamSearchResult',
+                                          ['tokens', 'scores', 'lengths'])
+
+# Used instead of -inf so that masked scores stay finite.
+_NEG_INF = -1e30
+
+
+def _log_softmax(logits):
+  max_logits = tf.reduce_max(logits, 1, keep_dims=True)
+  shifted = logits - max_logits
+  return shifted - tf.log(tf.reduce_sum(tf.exp(shifted), 1, keep_dims=True))
+
+
+def _length_penalty(lengths, alpha):
+  """The length normalization from https://arxiv.org/abs/1609.08144."""
+  return tf.pow((5. + tf.to_float(lengths)) / 6., alpha)
+
+
+def beam_search(step,
+                start_tokens,
+                beam_width,
+                max_length,
+                eos,
+                length_penalty=0.0,
+                name='beam_search'):
+  """Decodes the most likely sequences of a recurrent model with a beam search.
+
+  `step` builds a single timestep of the model exactly as for
+  `sample_sequence`; it is called with a `[batch * beam_width]` Tensor of tokens
+  and must return the `[batch * beam_width, vocab]` logits.  All beams of all
+  examples are expanded in one batched step and the recurrent states (e.g. the
+  states described by `lstm_state_tuples`) are reordered with a gather, so the
+  whole search runs in a single `sess.run` call.
+
+  Finished beams are only extended by `eos` at no cost and the search stops as
+  soon as every beam has finished or `max_length` tokens have been decoded.
+
+  Args:
+    step: A function that builds one step of the model.
+    start_tokens: A `[batch]` int Tensor with the first input of each example.
+    beam_width: The number of beams to keep for each example.
+    max_length: The maximum number of tokens to decode.
+    eos: The end of sequence token.
+    length_penalty: The exponent of the length normalization, 0 ranks by the
+      total log probability.
+    name: The name of this operation.
+  Returns:
+    A BeamSearchResult with the `[batch, beam_width, max_length]` tokens, the
+    `[batch, beam_width]` normalized scores and the `[batch, beam_width]`
+    lengths, including eos.  The beams of each example are sorted by score.
+  Raises:
+    ValueError: If the vocabulary size is not known.
+  """
+  start_tokens = tf.convert_to_tensor(start_tokens)
+  dtype = start_tokens.dtype
+  books = bookkeeper.for_default_graph()
+  with tf.name_scope(name), _loop_state_saver(books) as state_saver:
+    batch = tf.shape(start_tokens)[0]
+    flat_size = tf.expand_dims(batch * beam_width, 0)
+    expanded = tf.reshape(
+        tf.tile(tf.expand_dims(start_tokens, 1), [1, beam_width]), [-1])
+
+    # The first step is built outside of the loop so that all of the states are
+    # registered and any variables are created in the enclosing scope.
+    logits = prettytensor.unwrap(step(expanded))
+    vocab = logits.get_shape()[1].value
+    if vocab is None:
+      raise ValueError('The vocabulary size must be known: %s' %
+                       logits.get_shape())
+    state_names = sorted(state_saver.saved_states)
+    states = [state_saver.saved_states[n] for n in state_names]
+
+    eos_row = numpy.full([1, vocab], _NEG_INF, dtype=numpy.float32)
+    eos_row[0, eos] = 0.
+    eos_row = tf.constant(eos_row)
+    offsets = tf.expand_dims(tf.range(0, batch) * beam_width, 1)
+
+    def _advance(i, logits, log_probs, finished, lengths, history, states):
+      """Keeps the best beam_width extensions of all beams of each example."""
+      done = tf.expand_dims(tf.to_float(finished), 1)
+      scores = tf.expand_dims(log_probs, 1) + (
+          (1. - done) * _log_softmax(logits) + done * eos_row)
+      new_lengths = lengths + tf.to_int32(tf.logical_not(finished))
+      ranking = scores / tf.expand_dims(
+          _length_penalty(new_lengths, length_penalty), 1)
+      _, indices = tf.nn.top_k(
+          tf.reshape(ranking, [-1, beam_width * vocab]), beam_width)
+      source = tf.reshape(tf.div(indices, vocab) + offsets, [-1])
+      token_ids = tf.reshape(tf.mod(indices, vocab), [-1])
+      tokens = tf.cast(token_ids, dtype)
+      log_probs = tf.gather(tf.reshape(scores, [-1]),
+                            source * vocab + token_ids)
+      finished = tf.logical_or(tf.gather(finished, source),
+                               tf.equal(token_ids, eos))
+      lengths = tf.gather(new_lengths, source)
+      history = _write_column(tf.gather(history, source), i, tokens,
+                              max_length)
+      states = [tf.gather(state, source) for state in states]
+      return [tokens, log_probs, finished, lengths, history] + states
+
+    # Only the first beam of each example is live, otherwise the same
+    # extension would be chosen for every beam.
+    initial_log_probs = tf.tile(
+        tf.constant([0.] + [_NEG_INF] * (beam_width - 1)), tf.expand_dims(
+            batch, 0))
+    loop_vars = [tf.constant(1)] + _advance(
+        0, logits, initial_log_probs, tf.fill(flat_size, False),
+        tf.zeros(flat_size, tf.int32),
+        tf.zeros(tf.concat(0, [flat_size, [max_length]]), dtype), states)
+
+    def _cond(i, unused_tokens, unused_log_probs, finished, *unused_args):
+      return tf.logical_and(i < max_length,
+                            tf.logical_not(tf.reduce_all(finished)))
+
+    def _body(i, tokens, log_probs, finished, lengths, history, *states):
+      logits, new_states = _loop_step(books, state_saver, step, tokens,
+                                      dict(zip(state_names, states)))
+      return [i + 1] + _advance(i, logits, log_probs, finished, lengths,
+                                history, [new_states[n] for n in state_names])
+
+    loop_vars = tf.while_loop(_cond, _body, loop_vars)
+    i, _, log_probs, _, lengths, history = loop_vars[:6]
+    # The loop stops early once every beam has finished.
+    history = _fill_columns(history, i, eos, max_length)
+    scores = log_probs / _length_penalty(lengths, length_penalty)
+    return BeamSearchResult(
+        tf.reshape(history, tf.pack([batch, beam_width, max_length])),
+        tf.reshape(scores, tf.pack([batch, beam_width])),
+        tf.reshape(lengths, tf.pack([batch, beam_width])))
@@ -0,0 +1,183 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Microbenchmarks for the recurrent networks.
+
+Compares the default LSTM and GRU to the fused, dynamically unrolled and cell
+function versions by graph construction time, the number of ops in the graph
+and the time for a forward and backward step:
+
+  python -m prettytensor.recurrent_networks_benchmark --timesteps=50
+
+It also compares the activation memory and the step time of the checkpointed
+fused cells for each value in --checkpoint_every and the per step latency of
+RecurrentRunner.run to a prepared step.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import numpy
+from six.moves import xrange  # pylint: disable=redefined-builtin
+import tensorflow as tf
+
+import prettytensor as pt
+
+tf.app.flags.DEFINE_integer('batch_size', 32, 'The batch size.')
+tf.app.flags.DEFINE_integer('timesteps', 50, 'The number of timesteps.')
+tf.app.flags.DEFINE_integer('input_size', 128, 'The size of each input.')
+tf.app.flags.DEFINE_integer('num_units', 256, 'The size of the hidden state.')
+tf.app.flags.DEFINE_integer('iterations', 20, 'The number of timed steps.')
+tf.app.flags.DEFINE_string('checkpoint_every', '5,10,25',
+                           'Comma separated segment lengths to benchmark.')
+tf.app.flags.DEFINE_integer('runner_steps', 1000,
+                            'The number of timed RecurrentRunner steps.')
+FLAGS = tf.app.flags.FLAGS
+
+
+def build_recurrent(cell, inputs, fused, **kwargs):
+  """Builds an RNN over inputs and returns the final output and train op."""
+  seq = pt.wrap_sequence(inputs)
+  if cell == 'lstm':
+    result = seq.sequence_lstm(FLAGS.num_units, fused=fused, **kwargs)
+  else:
+    result = seq.sequence_gru(FLAGS.num_units, fused=fused, **kwargs)
+  loss = tf.reduce_sum(result[-1])
+  train_op = tf.train.GradientDescentOptimizer(0.01).minimize(loss)
+  return result[-1], train_op
+
+
+def time_steps(sess, fetches, feed_dict, iterations):
+  """Returns the mean wall time in seconds of running fetches."""
+  # Warm up.
+  sess.run(fetches, feed_dict)
+  start = time.time()
+  for _ in xrange(iterations):
+    sess.run(fetches, feed_dict)
+  return (time.time() - start) / iterations
+
+
+def activation_bytes(graph, gradient_scope='gradients'):
+  """Returns the bytes of forward activations that backprop keeps alive.
+
+  This counts every Tensor that is produced outside of gradient_scope and used
+  by the gradient computation, so it is an estimate of the memory that has to
+  be held between the forward and the backward pass.
+
+  Args:
+    graph: The graph.
+    gradient_scope: The name scope of the gradient ops.
+  Returns:
+    The number of bytes; Tensors with unknown shapes are not counted.
+  """
+  kept = set()
+  for op in graph.get_operations():
+    if not op.name.startswith(gradient_scope + '/'):
+      continue
+    for tensor in op.inputs:
+      if (not tensor.op.name.startswith(gradient_scope + '/') and
+          tensor.get_shape().is_fully_defined()):
+        kept.add(tensor)
+  return sum(x.get_shape().num_elements() * x.dtype.size for x in kept)
+
+
+def benchmark_recurrent(cell, fused, **kwargs):
+  """Benchmarks a single RNN configuration.
+
+  Args:
+    cell: Either 'lstm' or 'gru'.
+    fused: Whether to use the fused cell.
+    **kwargs: Additional arguments for the sequence layer.
+  Returns:
+    A dict with the construction time, op count, activation memory and step
+    times.
+  """
+  with tf.Graph().as_default():
+    inputs = [tf.placeholder(tf.float32, [FLAGS.batch_size, FLAGS.input_size])
+              for _ in xrange(FLAGS.timesteps)]
+    start = time.time()
+    output, train_op = build_recurrent(cell, inputs, fused, **kwargs)
+    build_time = time.time() - start
+    ops = len(tf.get_default_graph().get_operations())
+    memory = activation_bytes(tf.get_default_graph())
+
+    feed_dict = {
+        x: numpy.random.uniform(size=x.get_shape().as_list())
+        for x in inputs}
+    with tf.Session() as sess:
+      sess.run(tf.initialize_all_variables())
+      forward = time_steps(sess, output, feed_dict, FLAGS.iterations)
+      train = time_steps(sess, train_op, feed_dict, FLAGS.iterations)
+  return dict(build=build_time, ops=ops, memory=memory, forward=forward,
+              train=train)
+
+
+def benchmark_runner():
+  """Returns the mean latency in seconds of RecurrentRunner.run and prepare."""
+  with tf.Graph().as_default():
+    placeholder = tf.placeholder(tf.float32, [None, FLAGS.input_size])
+    output = pt.wrap_sequence([placeholder]).sequence_lstm(
+        FLAGS.num_units).squash_sequence().softmax_activation()
+    value = numpy.random.uniform(size=[1, FLAGS.input_size])
+    with tf.Session() as sess:
+      sess.run(tf.initialize_all_variables())
+      runner = pt.train.RecurrentRunner(batch_size=1)
+      step = runner.prepare([output], [placeholder], sess=sess)
+      timings = {}
+      for label, fn in (
+          ('run', lambda: runner.run([output], {placeholder: value}, sess)),
+          ('prepared', lambda: step(value))):
+        fn()
+        start = time.time()
+        for _ in xrange(FLAGS.runner_steps):
+          fn()
+        timings[label] = (time.time() - start) / FLAGS.runner_steps
+  return timings
+
+
+def main(_=None):
+  print('%-18s %10s %8s %12s %12s' %
+        ('cell', 'build (s)', 'ops', 'forward (ms)', 'train (ms)'))
+  for cell in ('lstm', 'gru'):
+    for fused in (False, True):
+      for dynamic in (False, True):
+        label = '%s%s%s' % ('fused_' if fused else '',
+                            'dynamic_' if dynamic else '', cell)
+        stats = benchmark_recurrent(cell, fused, dynamic=dynamic)
+        print('%-18s %10.3f %8d %12.3f %12.3f' %
+              (label, stats['build'], stats['ops'], stats['forward'] * 1000,
+               stats['train'] * 1000))
+    stats = benchmark_recurrent(cell, True, cell_function=True)
+    print('%-18s %10.3f %8d %12.3f %12.3f' %
+          ('function_' + cell, stats['build'], stats['ops'],
+           stats['forward'] * 1000, stats['train'] * 1000))
+
+  print()
+  print('%-18s %10s %12s %12s' %
+        ('cell', 'every', 'memory (MB)', 'train (ms)'))
+  segments = [None] + [int(x) for x in FLAGS.checkpoint_every.split(',') if x]
+  for cell in ('lstm', 'gru'):
+    for checkpoint_every in segments:
+      stats = benchmark_recurrent(cell, True, checkpoint_every=checkpoint_every)
+      print('%-18s %10s %12.2f %12.3f' %
+            ('fused_' + cell, checkpoint_every or '-',
+             stats['memory'] / 2.**20, stats['train'] * 1000))
+
+  print()
+  timings = benchmark_runner()
+  print('%-18s %12s' % ('runner', 'step (us)'))
+  for label in ('run', 'prepared'):
+    print('%-18s %12.1f' % (label, timings[label] * 1e6))
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -113,6 +113,40 @@ class RecurrentNetworksTest(pretty_tensor_testing.PtTestCase):
     testing.assert_allclose(input_data[0], result[0], rtol=TOLERANCE)
     self.assertEquals(1, len(result))
 
+  def testTimeMajorSquashAndCleave(self):
+    squashed = self.input.squash_sequence()
+    cleaved = squashed.cleave_sequence(time_major=True)
+
+    self.assertTrue(
+        isinstance(cleaved.sequence, prettytensor.TimeMajorSequence))
+    self.assertEquals(4, len(cleaved.sequence))
+    self.assertEquals([4, 1], cleaved.shape)
+    result = cleaved.eval(session=self.sess)
+    for i in xrange(len(self.input_data)):
+      testing.assert_allclose(
+          self.input_data[i], result[i],
+          rtol=TOLERANCE)
+
+    result = self.RunTensor(cleaved.squash_sequence())
+    testing.assert_allclose(
+        self.input_data.reshape(16, 1),
+        result,
+        rtol=TOLERANCE)
+
+  def testTimeMajorFusedLstm(self):
+    cleaved = self.input.squash_sequence().cleave_sequence(time_major=True)
+    with tf.variable_scope('test') as vs:
+      lstm = self.input.sequence_lstm(13, fused=True)
+    with tf.variable_scope(vs, reuse=True):
+      time_major_lstm = cleaved.sequence_lstm(13, fused=True)
+
+    self.assertEquals([4, 13], time_major_lstm.shape)
+    result = self.RunTensor(lstm)
+    time_major_result = time_major_lstm.eval(session=self.sess)
+    self.assertEqual(len(result), len(time_major_result))
+    for x, y in zip(result, time_major_result):
+      testing.assert_allclose(x, y, rtol=1e-5, atol=1e-5)
+
   def testSequenceLstm(self):
     lstm = self.input.sequence_lstm(13)
     result = self.RunTensor(lstm)
@@ -122,6 +156,238 @@ class RecurrentNetworksTest(pretty_tensor_testing.PtTestCase):
     for i in xrange(4):
       self.assertSequenceEqual(lstm.shape, result[i].shape)
 
+  def testSequenceFusedLstm(self):
+    lstm = self.input.sequence_lstm(13, fused=True)
+    result = self.RunTensor(lstm)
+
+    self.assertEquals([4, 13], lstm.shape)
+    self.assertEquals(4, len(result))
+    for i in xrange(4):
+      self.assertSequenceEqual(lstm.shape, result[i].shape)
+
+  def testFusedLstmCheckpointConversion(self):
+    with tf.variable_scope('unfused'):
+      unfused = self.input.sequence_lstm(13, name='lstm')
+    with tf.variable_scope('fused'):
+      fused = self.input.sequence_lstm(13, name='lstm', fused=True)
+    self.sess.run(tf.initialize_all_variables())
+
+    variables = {v.op.name: v for v in tf.all_variables()}
+    values = {name: self.sess.run(v) for name, v in six.iteritems(variables)}
+    converted = recurrent_networks.convert_lstm_variables_to_fused(
+        values, 'unfused/lstm', 'fused/lstm')
+    self.assertEqual(
+        ['fused/lstm/fused_lstm_cell/bias',
+         'fused/lstm/fused_lstm_cell/peepholes',
+         'fused/lstm/fused_lstm_cell/weights'], sorted(converted))
+    for name, value in six.iteritems(converted):
+      self.sess.run(variables[name].assign(value))
+
+    unfused_result, fused_result = self.sess.run(
+        [unfused.sequence, fused.sequence])
+    for x, y in zip(unfused_result, fused_result):
+      testing.assert_allclose(x, y, rtol=1e-5, atol=1e-5)
+
+  def testFusedGruMatchesGru(self):
+    with tf.variable_scope('test') as vs:
+      gru = self.input.sequence_gru(13)
+
+    # The fused GRU uses the same parameters.
+    with tf.variable_scope(vs, reuse=True):
+      fused_gru = self.input.sequence_gru(13, fused=True)
+
+    result = self.RunTensor(gru)
+    fused_result = self.RunTensor(fused_gru, init=False)
+    self.assertEqual(len(result), len(fused_result))
+    for x, y in zip(result, fused_result):
+      testing.assert_allclose(x, y, rtol=1e-5, atol=1e-5)
+
+  def testCheckpointedLstm(self):
+    with tf.variable_scope('test') as vs:
+      lstm = self.input.sequence_lstm(13, fused=True)
+
+    # Use the same parameters, 4 timesteps is a full and a partial segment.
+    with tf.variable_scope(vs, reuse=True):
+      checkpointed = self.input.sequence_lstm(13, fused=True,
+                                              checkpoint_every=3)
+
+    self.assertEquals([4, 13], checkpointed.shape)
+    variables = tf.trainable_variables()
+    grads = tf.gradients(tf.reduce_sum(lstm[-1]), variables)
+    checkpointed_grads = tf.gradients(tf.reduce_sum(checkpointed[-1]),
+                                      variables)
+    self.sess.run(tf.initialize_all_variables())
+    result = lstm.eval(session=self.sess)
+    checkpointed_result = checkpointed.eval(session=self.sess)
+    self.assertEqual(len(result), len(checkpointed_result))
+    for x, y in zip(result, checkpointed_result):
+      testing.assert_allclose(x, y, rtol=1e-5, atol=1e-5)
+    for x, y in zip(self.sess.run(grads), self.sess.run(checkpointed_grads)):
+      testing.assert_allclose(x, y, rtol=1e-5, atol=1e-5)
+
+  def testCheckpointedGru(self):
+    with tf.variable_scope('test') as vs:
+      gru = self.input.sequence_gru(13, fused=True)
+    with tf.variable_scope(vs, reuse=True):
+      checkpointed = self.input.sequence_gru(13, fused=True,
+                                             checkpoint_every=2)
+
+    result = self.RunTensor(gru)
+    checkpointed_result = checkpointed.eval(session=self.sess)
+    for x, y in zip(result, checkpointed_result):
+      testing.assert_allclose(x, y, rtol=1e-5, atol=1e-5)
+
+  def testCellFunctionLstm(self):
+    with tf.variable_scope('test') as vs:
+      lstm = self.input.sequence_lstm(13, fused=True)
+    graph = tf.get_default_graph()
+    ops = len(graph.get_operations())
+    with tf.variable_scope(vs, reuse=True):
+      cell_function = self.input.sequence_lstm(13, fused=True,
+                                               cell_function=True)
+
+    # Each timestep is a single call.
+    self.assertLess(len(graph.get_operations()) - ops, ops)
+    variables = tf.trainable_variables()
+    grads = tf.gradients(tf.reduce_sum(lstm[-1]), variables)
+    function_grads = tf.gradients(tf.reduce_sum(cell_function[-1]), variables)
+    self.sess.run(tf.initialize_all_variables())
+    result = lstm.eval(session=self.sess)
+    function_result = cell_function.eval(session=self.sess)
+    for x, y in zip(result, function_result):
+      testing.assert_allclose(x, y, rtol=1e-5, atol=1e-5)
+    for x, y in zip(self.sess.run(grads), self.sess.run(function_grads)):
+      testing.assert_allclose(x, y, rtol=1e-5, atol=1e-5)
+
+  def testCheckpointRequiresFused(self):
+    with self.assertRaises(ValueError):
+      self.input.sequence_lstm(13, checkpoint_every=2)
+    with self.assertRaises(ValueError):
+      self.input.sequence_gru(13, cell_function=True)
+    with self.assertRaises(ValueError):
+      self.input.sequence_gru(13, fused=True, dynamic=True,
+                              checkpoint_every=2)
+    with self.assertRaises(ValueError):
+      self.input.sequence_lstm(13, fused=True, lengths=tf.constant([4] * 4),
+                               checkpoint_every=2)
+
+  def testBidirectionalSequenceLstm(self):
+    with tf.variable_scope('test') as vs:
+      bidi = self.input.bidirectional_sequence_lstm(13, name='bidi')
+    with tf.variable_scope(vs, reuse=True):
+      summed = self.input.bidirectional_sequence_lstm(
+          13, name='bidi', merge_mode='sum')
+
+    # The same as a forward and a backward fused LSTM.
+    with tf.variable_scope(vs, reuse=True), tf.variable_scope('bidi'):
+      forward = self.input.sequence_lstm(13, fused=True, name='forward')
+      backward = self.input.with_sequence(
+          list(reversed(self.input.sequence))).sequence_lstm(
+              13, fused=True, name='backward')
+
+    self.assertEquals([4, 26], bidi.shape)
+    self.assertEquals([4, 13], summed.shape)
+    self.sess.run(tf.initialize_all_variables())
+    result = bidi.eval(session=self.sess)
+    summed_result = summed.eval(session=self.sess)
+    forward_result = forward.eval(session=self.sess)
+    backward_result = list(reversed(backward.eval(session=self.sess)))
+    for i in xrange(4):
+      testing.assert_allclose(
+          numpy.concatenate([forward_result[i], backward_result[i]], 1),
+          result[i], rtol=1e-5, atol=1e-5)
+      testing.assert_allclose(forward_result[i] + backward_result[i],
+                              summed_result[i], rtol=1e-5, atol=1e-5)
+
+  def testBidirectionalSequenceLstmLengths(self):
+    lengths = tf.placeholder(dtype=tf.int32, shape=[4])
+    with tf.variable_scope('test') as vs:
+      bidi = self.input.bidirectional_sequence_lstm(13, lengths=lengths)
+    with tf.variable_scope(vs, reuse=True):
+      truncated = self.input.with_sequence(
+          self.input.sequence[:2]).bidirectional_sequence_lstm(13)
+
+    self.sess.run(tf.initialize_all_variables())
+    result = bidi.eval({lengths: [2, 2, 2, 2]}, session=self.sess)
+    truncated_result = truncated.eval(session=self.sess)
+    # The backward direction starts at the last valid timestep.
+    for x, y in zip(result[:2], truncated_result):
+      testing.assert_allclose(x, y, rtol=1e-5, atol=1e-5)
+
+  def testBidirectionalSequenceLstmVariableLengths(self):
+    lengths = tf.placeholder(dtype=tf.int32, shape=[4])
+    with tf.variable_scope('test') as vs:
+      bidi = self.input.bidirectional_sequence_lstm(13, lengths=lengths)
+    # The reference for an example of length n is the first n timesteps.
+    truncated = {}
+    for n in xrange(1, 5):
+      with tf.variable_scope(vs, reuse=True):
+        truncated[n] = self.input.with_sequence(
+            self.input.sequence[:n]).bidirectional_sequence_lstm(13)
+
+    length_values = [1, 2, 4, 3]
+    self.sess.run(tf.initialize_all_variables())
+    result = bidi.eval({lengths: length_values}, session=self.sess)
+    truncated_results = {n: x.eval(session=self.sess)
+                         for n, x in six.iteritems(truncated)}
+    for b, n in enumerate(length_values):
+      for t in xrange(n):
+        testing.assert_allclose(truncated_results[n][t][b], result[t][b],
+                                rtol=1e-5, atol=1e-5)
+
+  def testDynamicLstm(self):
+    with tf.variable_scope('test') as vs:
+      lstm = self.input.sequence_lstm(13)
+    lengths = tf.placeholder(dtype=tf.int32, shape=[4])
+
+    # Use the same parameters.
+    with tf.variable_scope(vs, reuse=True):
+      dynamic_lstm = self.input.sequence_lstm(13, dynamic=True)
+      dynamic_truncated = self.input.sequence_lstm(
+          13, lengths=lengths, dynamic=True)
+
+    self.assertEquals([4, 13], dynamic_lstm.shape)
+    self.sess.run(tf.initialize_all_variables())
+    result, dynamic_result, truncated_result = self.sess.run(
+        [lstm.sequence, dynamic_lstm.sequence, dynamic_truncated.sequence],
+        {lengths: [2, 1, 1, 1]})
+    self.assertEqual(len(result), len(dynamic_result))
+    for x, y in zip(result, dynamic_result):
+      testing.assert_allclose(x, y, rtol=TOLERANCE)
+    for i, x in enumerate(truncated_result):
+      testing.assert_allclose(
+          result[min(i, 1)], x, rtol=TOLERANCE)
+
+  def testMaskLengths(self):
+    with tf.variable_scope('test') as vs:
+      base_lstm = self.input.sequence_lstm(13)
+    lengths = tf.placeholder(dtype=tf.int32, shape=[4])
+
+    # Use the same parameters.
+    with tf.variable_scope(vs, reuse=True):
+      masked_lstm = self.input.sequence_lstm(
+          13, lengths=lengths, mask_lengths=True)
+      dynamic_lstm = self.input.sequence_lstm(
+          13, lengths=lengths, mask_lengths=True, dynamic=True)
+    squashed = masked_lstm.squash_sequence(lengths=lengths)
+
+    length_values = [1, 2, 4, 3]
+    self.sess.run(tf.initialize_all_variables())
+    base, masked, dynamic, squashed_result = self.sess.run(
+        [base_lstm.sequence, masked_lstm.sequence, dynamic_lstm.sequence,
+         squashed], {lengths: length_values})
+
+    expected_squashed = []
+    for t in xrange(4):
+      for b, length in enumerate(length_values):
+        expected = base[min(t, length - 1)][b]
+        testing.assert_allclose(expected, masked[t][b], rtol=TOLERANCE)
+        testing.assert_allclose(expected, dynamic[t][b], rtol=TOLERANCE)
+        if t < length:
+          expected_squashed.append(expected)
+    testing.assert_allclose(
+        numpy.array(expected_squashed), squashed_result, rtol=TOLERANCE)
+
   def testArbitraryBatchSizeLstm(self):
     # Tests whether the LSTM / Bookkeeper function when batch_size is not
     # specified at graph creation time (i.e., None).
@@ -196,6 +462,230 @@ class RecurrentNetworksTest(pretty_tensor_testing.PtTestCase):
       testing.assert_allclose(out[0], out_orig[t], rtol=TOLERANCE)
       self.assertFalse((out[0] == out[1]).all())
 
+  def testPreparedRecurrentRunner(self):
+    super(self.__class__, self).SetBookkeeper(
+        prettytensor.bookkeeper_for_new_graph())
+    placeholder = tf.placeholder(tf.float32, [None, 1])
+    input_pt = prettytensor.wrap_sequence([placeholder])
+    output, _ = (input_pt
+                 .sequence_lstm(4)
+                 .squash_sequence()
+                 .softmax_classifier(2))
+    self.sess.run(tf.initialize_all_variables())
+
+    recurrent_runner = recurrent_networks.RecurrentRunner(batch_size=1)
+    expected = [recurrent_runner.run([output.name],
+                                     {placeholder.name: [[1.2]]},
+                                     sess=self.sess)[0]
+                for _ in xrange(6)]
+
+    recurrent_runner.reset()
+    step = recurrent_runner.prepare([output], [placeholder], sess=self.sess)
+    for t in xrange(3):
+      testing.assert_allclose(
+          expected[t], step(numpy.array([[1.2]]))[0], rtol=TOLERANCE)
+    # run and the prepared step share the states.
+    for t in xrange(3, 6):
+      testing.assert_allclose(
+          expected[t],
+          recurrent_runner.run([output], {placeholder: [[1.2]]},
+                               sess=self.sess)[0],
+          rtol=TOLERANCE)
+
+    # Feeding a different batch size replaces the state buffers.
+    recurrent_runner.reset()
+    batch = numpy.array([[1.2], [1.2]])
+    results = [step(batch)[0], step(batch)[0],
+               recurrent_runner.run([output], {placeholder: batch},
+                                    sess=self.sess)[0]]
+    for t, result in enumerate(results):
+      self.assertEqual((2, 2), result.shape)
+      for row in result:
+        testing.assert_allclose(expected[t][0], row, rtol=TOLERANCE)
+
+  def testBatchedRecurrentRunner(self):
+    super(self.__class__, self).SetBookkeeper(
+        prettytensor.bookkeeper_for_new_graph())
+    placeholder = tf.placeholder(tf.float32, [None, 1])
+    input_pt = prettytensor.wrap_sequence([placeholder])
+    output, _ = (input_pt
+                 .sequence_lstm(4)
+                 .squash_sequence()
+                 .softmax_classifier(2))
+    self.sess.run(tf.initialize_all_variables())
+
+    # Reference outputs for a single stream.
+    recurrent_runner = recurrent_networks.RecurrentRunner(batch_size=1)
+    out_orig = []
+    for _ in xrange(10):
+      out_orig.append(recurrent_runner.run(
+          [output.name], {placeholder.name: numpy.array([[1.2]])},
+          sess=self.sess)[0][0])
+
+    runner = recurrent_networks.BatchedRecurrentRunner(max_streams=2)
+    first = runner.add_stream()
+    second = None
+    for t in xrange(10):
+      if t == 3:
+        second = runner.add_stream()
+      if t == 5:
+        runner.reset_stream(first)
+      runner.submit(first, {placeholder.name: numpy.array([1.2])})
+      if second is not None:
+        runner.submit(second, {placeholder.name: numpy.array([1.2])})
+      outs = runner.tick([output.name], sess=self.sess)
+      expected_first = out_orig[t] if t < 5 else out_orig[t - 5]
+      testing.assert_allclose(expected_first, outs[first][0], rtol=TOLERANCE)
+      if second is not None:
+        testing.assert_allclose(
+            out_orig[t - 3], outs[second][0], rtol=TOLERANCE)
+      else:
+        self.assertEqual([first], list(outs))
+
+    with self.assertRaises(ValueError):
+      runner.add_stream()
+    runner.remove_stream(first)
+    self.assertEqual([second], runner.active_streams)
+    with self.assertRaises(ValueError):
+      runner.submit(first, {placeholder.name: numpy.array([1.2])})
+
+    # The streams of a batch must feed the same keys.
+    third = runner.add_stream()
+    runner.submit(second, {placeholder.name: numpy.array([1.2])})
+    runner.submit(third, {'other:0': numpy.array([1.2])})
+    with self.assertRaises(ValueError):
+      runner.tick([output.name], sess=self.sess)
+
+  def _TokenModel(self):
+    """Builds a small LSTM language model for the decoding tests.
+
+    Returns:
+      The token placeholder, the logits and a step function that shares the
+      variables.
+    """
+    super(self.__class__, self).SetBookkeeper(
+        prettytensor.bookkeeper_for_new_graph())
+
+    def model(tokens):
+      return (prettytensor.wrap(tokens)
+              .reshape([-1, 1])
+              .embedding_lookup(5, [3])
+              .cleave_sequence(1)
+              .sequence_lstm(4)
+              .squash_sequence()
+              .fully_connected(5, activation_fn=None))
+
+    def step(tokens):
+      with tf.variable_scope('model', reuse=True):
+        return model(tokens)
+
+    placeholder = tf.placeholder(tf.int32, [None])
+    with tf.variable_scope('model'):
+      logits = model(placeholder)
+    return placeholder, logits, step
+
+  def testSampleSequence(self):
+    placeholder, logits, step = self._TokenModel()
+    prime = numpy.array([[1, 2], [3, 0]], dtype=numpy.int32)
+    greedy = recurrent_networks.sample_sequence(step, prime, 6, greedy=True)
+    self.sess.run(tf.initialize_all_variables())
+
+    # Run the same greedy decoding one step at a time.
+    recurrent_runner = recurrent_networks.RecurrentRunner(batch_size=2)
+    recurrent_runner.run([logits], {placeholder: prime[:, 0]}, sess=self.sess)
+    tokens = prime[:, 1]
+    expected = []
+    for _ in xrange(6):
+      step_logits = recurrent_runner.run(
+          [logits], {placeholder: tokens}, sess=self.sess)[0]
+      tokens = numpy.argmax(step_logits, 1).astype(numpy.int32)
+      expected.append(tokens)
+    expected = numpy.array(expected).T
+
+    result = recurrent_networks.SampledSequence._make(
+        self.sess.run(list(greedy)))
+    testing.assert_array_equal(expected, result.tokens)
+    testing.assert_array_equal([6, 6], result.lengths)
+
+    # Stop at the third token of the first sequence.
+    eos = expected[0, 2]
+    with_eos = recurrent_networks.sample_sequence(
+        step, prime, 6, greedy=True, eos=eos)
+    result = recurrent_networks.SampledSequence._make(
+        self.sess.run(list(with_eos)))
+    for tokens, sampled, length in zip(expected, result.tokens,
+                                       result.lengths):
+      matches = numpy.nonzero(tokens == eos)[0]
+      expected_length = matches[0] + 1 if len(matches) else 6
+      self.assertEqual(expected_length, length)
+      testing.assert_array_equal(tokens[:length], sampled[:length])
+      self.assertTrue((sampled[length:] == eos).all())
+
+  def testSampleSequenceAllFinished(self):
+    def step(tokens):
+      # The next token is always the current one plus 1.
+      logits = tf.one_hot(tokens + 1, 5, on_value=10., off_value=0.)
+      logits.set_shape([None, 5])
+      return logits
+
+    prime = numpy.array([[0], [1]], dtype=numpy.int32)
+    sampled = recurrent_networks.sample_sequence(
+        step, prime, 6, greedy=True, eos=3)
+    result = recurrent_networks.SampledSequence._make(
+        self.sess.run(list(sampled)))
+    # Both sequences finish before max_length, so the loop stops early.
+    testing.assert_array_equal([[1, 2, 3, 3, 3, 3], [2, 3, 3, 3, 3, 3]],
+                               result.tokens)
+    testing.assert_array_equal([3, 2], result.lengths)
+
+  def testBeamSearch(self):
+    _, _, step = self._TokenModel()
+    start = numpy.array([1, 3], dtype=numpy.int32)
+    eos = 4
+    # A single beam is a greedy search.
+    greedy = recurrent_networks.sample_sequence(
+        step, start.reshape([2, 1]), 6, greedy=True, eos=eos)
+    single_beam = recurrent_networks.beam_search(step, start, 1, 6, eos)
+    beams = recurrent_networks.beam_search(
+        step, start, 3, 6, eos, length_penalty=0.6)
+    self.sess.run(tf.initialize_all_variables())
+
+    greedy_result = recurrent_networks.SampledSequence._make(
+        self.sess.run(list(greedy)))
+    single_result, beam_result = [
+        recurrent_networks.BeamSearchResult._make(self.sess.run(list(x)))
+        for x in (single_beam, beams)]
+    testing.assert_array_equal(greedy_result.tokens,
+                               single_result.tokens[:, 0])
+    testing.assert_array_equal(greedy_result.lengths,
+                               single_result.lengths[:, 0])
+
+    self.assertEqual((2, 3, 6), beam_result.tokens.shape)
+    self.assertEqual((2, 3), beam_result.scores.shape)
+    for scores, lengths in zip(beam_result.scores, beam_result.lengths):
+      self.assertTrue((scores[:-1] >= scores[1:]).all(), scores)
+      self.assertTrue((lengths > 0).all() and (lengths <= 6).all(), lengths)
+
+  def testBeamSearchAllFinished(self):
+    eos = 3
+
+    def step(tokens):
+      # Every beam prefers eos.
+      logits = tf.one_hot(tf.fill(tf.shape(tokens), eos), 5, on_value=10.,
+                          off_value=0.)
+      logits.set_shape([None, 5])
+      return logits
+
+    start = numpy.array([0, 1], dtype=numpy.int32)
+    beams = recurrent_networks.beam_search(step, start, 3, 6, eos)
+    result = recurrent_networks.BeamSearchResult._make(
+        self.sess.run(list(beams)))
+    # The best beam ends at once and the others after one more token, so the
+    # loop stops early.
+    testing.assert_array_equal([[1, 2, 2]] * 2, result.lengths)
+    testing.assert_array_equal(eos, result.tokens[:, 0, :])
+    testing.assert_array_equal(eos, result.tokens[:, :, 2:])
+
   def testSequence(self):
     result = self.RunTensor(self.input[-1])
     testing.assert_allclose(
@@ -215,6 +705,39 @@ class RecurrentNetworksTest(pretty_tensor_testing.PtTestCase):
     with self.assertRaises(ValueError):
       input_data.embedding_lookup(13, [1], name='params')
 
+  def testEmbeddingPartitionsAndDedupe(self):
+    ids = self.Wrap(numpy.array([[0], [4], [5], [4], [0], [12]],
+                                dtype=numpy.int32))
+    table = numpy.arange(13 * 2, dtype=numpy.float32).reshape([13, 2])
+    expected = table[[0, 4, 5, 4, 0, 12]]
+
+    for strategy in ('mod', 'div'):
+      with tf.variable_scope(strategy):
+        result = ids.embedding_lookup(13, [2], name='embedding')
+        with prettytensor.defaults_scope(partitions=3,
+                                         partition_strategy=strategy,
+                                         dedupe=True):
+          partitioned = ids.embedding_lookup(13, [2], name='partitioned')
+      self.assertEqual(
+          ['partitioned/params_0', 'partitioned/params_1',
+           'partitioned/params_2'],
+          sorted(v.op.name[len(strategy) + 1:]
+                 for v in six.itervalues(partitioned.layer_parameters)))
+
+      self.sess.run(tf.initialize_all_variables())
+      self.sess.run(result.layer_parameters['params'].assign(table))
+      if strategy == 'mod':
+        shards = [table[i::3] for i in xrange(3)]
+      else:
+        shards = [table[:5], table[5:9], table[9:]]
+      for i, shard in enumerate(shards):
+        self.sess.run(
+            partitioned.layer_parameters['params_%d' % i].assign(shard))
+
+      testing.assert_allclose(expected, self.RunTensor(result, init=False))
+      testing.assert_allclose(expected,
+                              self.RunTensor(partitioned, init=False))
+
   def testLstmStateTuples(self):
     self.states = recurrent_networks.lstm_state_tuples(13, 'blah')
     self.RunTensor(
@@ -15,6 +15,8 @@ from __future__ import print_function
 
 import contextlib
 import functools
+import linecache
+import sys
 import traceback
 
 from six.moves import zip  # pylint: disable=redefined-builtin
@@ -22,6 +24,9 @@ import tensorflow as tf
 
 from tensorflow.python.ops import variable_scope
 
+# Whether templates and unbound variables record where they were defined.
+_capture_stack_traces = True
+
 
 @contextlib.contextmanager
 def var_and_name_scope(names):
@@ -97,6 +102,60 @@ def make_template(name, func, *args, **kwargs):
   return Template(name, func)
 
 
+@contextlib.contextmanager
+def capture_stack_traces(capture):
+  """Turns capturing where templates are defined on or off in a `with` block.
+
+  Templates record the stack that defined them so that errors during
+  construction can point at the model code. The stack is stored raw and only
+  formatted on an error, but production jobs that build large templates can
+  turn it off entirely.
+
+  Args:
+    capture: Boolean for whether stack traces are captured.
+  Yields:
+    Nothing, this creates a Context Manager for use in a `with` statement.
+  """
+  global _capture_stack_traces
+  old_capture = _capture_stack_traces
+  _capture_stack_traces = capture
+  try:
+    yield
+  finally:
+    _capture_stack_traces = old_capture
+
+
+def capture_stack(skip=0):
+  """Returns the unformatted stack of the caller, outermost frame first.
+
+  This is much cheaper than `traceback.format_stack` since it does not read the
+  source lines; use `format_stack` on the result.
+
+  Args:
+    skip: The number of innermost frames to drop, 0 keeps the caller.
+  Returns:
+    A list of (filename, line number, function name) tuples or an empty list
+    if capturing is turned off.
+  """
+  if not _capture_stack_traces:
+    return []
+  result = []
+  frame = sys._getframe(skip + 1)  # pylint: disable=protected-access
+  while frame is not None:
+    result.append((frame.f_code.co_filename, frame.f_lineno,
+                   frame.f_code.co_name))
+    frame = frame.f_back
+  result.reverse()
+  return result
+
+
+def format_stack(stack):
+  """Formats a stack from capture_stack like `traceback.format_stack`."""
+  return traceback.format_list(
+      [(filename, lineno, name, linecache.getline(filename, lineno).strip())
+       for filename, lineno, name in stack])
+
+
 def skip_common_stack_elements(stacktrace, base_case):
   """Skips items that the target stacktrace shares with the base stacktrace."""
   for i, (trace, base) in enumerate(zip(stacktrace, base_case)):
@@ -123,13 +182,15 @@ class Template(object):
       self._var_scope = tf.get_variable_scope()
       self._name = None
     self._reuse = None
-    self._stacktrace = traceback.format_stack()[:-3]
+    self._stacktrace = capture_stack(skip=3)
 
   def _call_func(self, args, kwargs):
     try:
       self._reuse = True
       return self._func(*args, **kwargs)
     except Exception as exc:
+      if not self._stacktrace:
+        raise
       # Reraise the exception, but append the original definition to the
       # trace.
       args = exc.args
@@ -137,8 +198,8 @@ class Template(object):
         arg0 = ''
       else:
         arg0 = args[0]
-      trace = ''.join(skip_common_stack_elements(self._stacktrace,
-                                                 traceback.format_stack()))
+      trace = ''.join(format_stack(
+          skip_common_stack_elements(self._stacktrace, capture_stack())))
       arg0 = '%s\n\noriginally defined at:\n%s' % (arg0, trace)
       new_args = [arg0]
       new_args.extend(args[1:])
@@ -28,6 +28,10 @@ def var_scoped_function():
                          initializer=tf.zeros_initializer)
 
 
+def failing_function():
+  raise ValueError('failed')
+
+
 class ScopesTest(unittest.TestCase):
 
   def test_skip_stack_frames(self):
@@ -84,6 +88,26 @@ class ScopesTest(unittest.TestCase):
         self.assertEqual('one/two/', ns)
         self.assertEqual('one/two', vs.name)
 
+  def test_capture_stack(self):
+    stack = scopes.capture_stack()
+    self.assertEqual('test_capture_stack', stack[-1][2])
+    formatted = scopes.format_stack(stack)
+    self.assertEqual(len(stack), len(formatted))
+    self.assertIn('scopes.capture_stack()', formatted[-1])
+
+  def test_template_error_has_definition(self):
+    tmpl = scopes.Template(None, failing_function)
+    with self.assertRaisesRegexp(ValueError, 'originally defined at'):
+      tmpl()
+
+  def test_capture_stack_traces_off(self):
+    with scopes.capture_stack_traces(False):
+      self.assertEqual([], scopes.capture_stack())
+      tmpl = scopes.Template(None, failing_function)
+    self.assertTrue(scopes.capture_stack())
+    with self.assertRaisesRegexp(ValueError, '^failed$'):
+      tmpl()
+
 
 if __name__ == '__main__':
   unittest.main()
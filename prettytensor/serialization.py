@@ -0,0 +1,325 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Serializes templates so that they can be rebuilt without the model code.
+
+A template is described by the registered methods that it calls, their
+arguments and defaults, any scopes and the keys of its unbound variables. The
+description only contains JSON types:
+
+    description = serialization.serialize(model_template)
+    ...
+    template = serialization.deserialize(description)
+    result = template.construct(input=images)
+
+Functions (e.g. `activation_fn=tf.nn.relu`), classes and enums in the
+arguments are stored by their module and name and imported when loading, so
+only module level values are supported. Bound Tensors and other values that
+only exist in the original graph cannot be serialized.
+
+`construct_cached` goes one step further and stores the constructed graph
+under a hash of the description and the library versions, so that a service
+can import the graph instead of constructing the template when nothing
+changed.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import enum
+import hashlib
+import importlib
+import json
+import os
+
+import numpy
+import six
+import tensorflow as tf
+
+from prettytensor import pretty_tensor_class as prettytensor
+
+_VERSION = 1
+
+# pylint: disable=protected-access
+
+
+def _qualified_name(obj):
+  """Returns module:name for obj if it can be imported by that name."""
+  module = getattr(obj, '__module__', None)
+  name = getattr(obj, '__name__', None)
+  if module is None or name is None or _import(module, name) is not obj:
+    raise ValueError(
+        'Only module level functions and classes can be serialized: %r' % obj)
+  return '%s:%s' % (module, name)
+
+
+def _import(module, name):
+  try:
+    return getattr(importlib.import_module(module), name, None)
+  except ImportError:
+    return None
+
+
+def _from_qualified_name(qualified_name):
+  module, name = qualified_name.split(':')
+  result = _import(module, name)
+  if result is None:
+    raise ValueError('Unable to import %s' % qualified_name)
+  return result
+
+
+class _Serializer(object):
+  """Assigns an index to each layer in the order that they are described."""
+
+  def __init__(self):
+    self.layers = []
+    self._indices = {}
+
+  def layer(self, layer):
+    """Describes layer and its inputs and returns its index."""
+    if layer in self._indices:
+      return self._indices[layer]
+    description = layer._description
+    if layer._pass_through is not None:
+      source = layer._pass_through
+      entry = {'pass_through': self.layer(source)}
+      if layer._scope is not source._scope:
+        entry['scope'] = layer._scope[1].name
+      if layer._defaults is not source._defaults:
+        entry['defaults'] = self.value(dict(layer._defaults))
+      bindings = {k.key: v for k, v in six.iteritems(layer._partial_context)
+                  if k not in source._partial_context}
+      if bindings:
+        entry['bindings'] = self.value(bindings)
+    elif description is None:
+      raise ValueError('Only templates that start with pt.template and call '
+                       'registered methods can be serialized.')
+    elif description[0] == 'template':
+      data = layer._method_args[0]
+      entry = {'template': data.key}
+      if data.has_default():
+        entry['default'] = self.value(data.default)
+    else:
+      _, name, defaults = description
+      entry = {'method': name,
+               'args': self.value(list(layer._method_args)),
+               'kwargs': self.value(layer._method_kwargs),
+               'defaults': self.value(defaults)}
+    self._indices[layer] = len(self.layers)
+    self.layers.append(entry)
+    return self._indices[layer]
+
+  def value(self, value):
+    """Returns a JSON compatible description of an argument."""
+    if value is None or isinstance(
+        value, (bool, float) + six.integer_types + six.string_types):
+      return value
+    elif isinstance(value, prettytensor._DeferredLayer):
+      return {'layer': self.layer(value)}
+    elif isinstance(value, prettytensor.UnboundVariable):
+      result = {'unbound': value.key}
+      if value.has_default():
+        result['default'] = self.value(value.default)
+      return result
+    elif isinstance(value, tuple):
+      return {'tuple': [self.value(x) for x in value]}
+    elif isinstance(value, list):
+      return [self.value(x) for x in value]
+    elif isinstance(value, collections.Mapping):
+      for k in value:
+        if not isinstance(k, six.string_types):
+          raise ValueError('Only string keys can be serialized: %r' % k)
+      return {'dict': {k: self.value(v) for k, v in six.iteritems(value)}}
+    elif isinstance(value, enum.Enum):
+      return {'enum': _qualified_name(type(value)), 'name': value.name}
+    elif isinstance(value, tf.DType):
+      return {'dtype': value.name}
+    elif isinstance(value, numpy.ndarray):
+      return {'ndarray': value.tolist(), 'dtype': value.dtype.name}
+    elif callable(value):
+      return {'function': _qualified_name(value)}
+    else:
+      raise ValueError('Unable to serialize %r' % value)
+
+
+class _Loader(object):
+  """Rebuilds the layers of a description in order."""
+
+  def __init__(self, books):
+    self.layers = []
+    self._books = books
+    self._unbound_vars = {}
+
+  def layer(self, entry):
+    """Builds the layer for entry and appends it to layers."""
+    if 'pass_through' in entry:
+      result = self.layers[entry['pass_through']]
+      if 'scope' in entry:
+        result = result.with_name(entry['scope'])
+      if 'defaults' in entry:
+        result = result.with_defaults(**self.value(entry['defaults']))
+      if 'bindings' in entry:
+        result = result.bind(**self.value(entry['bindings']))
+    elif 'template' in entry:
+      result = prettytensor.template(entry['template'], self._books,
+                                     optional='default' in entry)
+      self._unbound_vars[entry['template']] = result._method_args[0]
+    else:
+      args = self.value(entry['args'])
+      kwargs = self.value(entry['kwargs'])
+      with prettytensor.defaults_scope(**self.value(entry['defaults'])):
+        result = getattr(args[0], entry['method'])(*args[1:], **kwargs)
+    self.layers.append(result)
+
+  def value(self, value):
+    """Returns the argument for a description from _Serializer.value."""
+    if isinstance(value, list):
+      return [self.value(x) for x in value]
+    elif not isinstance(value, dict):
+      return value
+    elif 'layer' in value:
+      return self.layers[value['layer']]
+    elif 'unbound' in value:
+      key = value['unbound']
+      if key not in self._unbound_vars:
+        if 'default' in value:
+          self._unbound_vars[key] = prettytensor.UnboundVariable(
+              key, default=self.value(value['default']))
+        else:
+          self._unbound_vars[key] = prettytensor.UnboundVariable(key)
+      return self._unbound_vars[key]
+    elif 'tuple' in value:
+      return tuple(self.value(x) for x in value['tuple'])
+    elif 'dict' in value:
+      return {k: self.value(v) for k, v in six.iteritems(value['dict'])}
+    elif 'enum' in value:
+      return getattr(_from_qualified_name(value['enum']), value['name'])
+    elif 'dtype' in value and len(value) == 1:
+      return tf.as_dtype(value['dtype'])
+    elif 'ndarray' in value:
+      return numpy.array(value['ndarray'], dtype=value['dtype'])
+    elif 'function' in value:
+      return _from_qualified_name(value['function'])
+    else:
+      raise ValueError('Unknown value: %r' % value)
+
+
+def serialize(templates):
+  """Returns a JSON compatible description of a template or templates.
+
+  Args:
+    templates: A template or a list of templates.
+  Returns:
+    A dict that can be passed to deserialize or written with json.
+  Raises:
+    ValueError: If a layer or an argument cannot be serialized.
+  """
+  single = isinstance(templates, prettytensor._DeferredLayer)
+  serializer = _Serializer()
+  outputs = [serializer.layer(x)
+             for x in ([templates] if single else templates)]
+  return {'version': _VERSION,
+          'layers': serializer.layers,
+          'outputs': outputs,
+          'single': single}
+
+
+def deserialize(description, books=None):
+  """Rebuilds the templates of a description from serialize.
+
+  Args:
+    description: The result of serialize.
+    books: The bookkeeper, defaults to the one for the default graph.
+  Returns:
+    A template or a list of templates, matching what was serialized.
+  Raises:
+    ValueError: If the description is not supported.
+  """
+  if description.get('version') != _VERSION:
+    raise ValueError('Unsupported version: %s' % description.get('version'))
+  loader = _Loader(books)
+  for entry in description['layers']:
+    loader.layer(entry)
+  outputs = [loader.layers[i] for i in description['outputs']]
+  return outputs[0] if description['single'] else outputs
+
+
+def description_hash(description):
+  """Returns a hex digest that only changes if the description changes."""
+  return hashlib.sha1(
+      json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _versions():
+  """Returns the versions of the code that builds a graph from a description."""
+  # pkg_resources is slow to import and only needed for the cache key, so it
+  # is not imported with prettytensor.
+  import pkg_resources  # pylint: disable=g-import-not-at-top
+  try:
+    prettytensor_version = pkg_resources.get_distribution(
+        'prettytensor').version
+  except pkg_resources.DistributionNotFound:
+    # E.g. running from a source checkout.
+    prettytensor_version = None
+  return {'prettytensor': prettytensor_version, 'tensorflow': tf.__version__}
+
+
+def construct_cached(description, input_specs, cache_dir):
+  """Constructs a description in the default graph or imports a cached graph.
+
+  The first call constructs the templates with a placeholder for each unbound
+  variable and exports the graph to cache_dir.  Later calls with the same
+  description and inputs import that graph instead, which does not run any
+  template code.  The graph should be empty so that the names do not change.
+
+  The key of a cached graph includes the installed versions of prettytensor
+  and TensorFlow, so upgrading either rebuilds it.  Clear cache_dir after
+  changing the code of a method without a new release.
+
+  Args:
+    description: The result of serialize.
+    input_specs: A dict from each unbound variable key to a tuple of the dtype
+      and shape of the placeholder that is bound to it.
+    cache_dir: The directory for the cached graphs.
+  Returns:
+    A tuple of a dict from the keys to the placeholders and a list of the
+    output Tensors, one for each serialized template.
+  """
+  specs = {k: [tf.as_dtype(dtype).name, None if shape is None else list(shape)]
+           for k, (dtype, shape) in six.iteritems(input_specs)}
+  key = description_hash({'description': description, 'inputs': specs,
+                          'versions': _versions()})
+  graph_file = os.path.join(cache_dir, key + '.meta')
+  names_file = os.path.join(cache_dir, key + '.json')
+  graph = tf.get_default_graph()
+
+  if tf.gfile.Exists(graph_file) and tf.gfile.Exists(names_file):
+    tf.train.import_meta_graph(graph_file)
+    with tf.gfile.GFile(names_file) as f:
+      names = json.load(f)
+    inputs = {k: graph.get_tensor_by_name(name)
+              for k, name in six.iteritems(names['inputs'])}
+    return inputs, [graph.get_tensor_by_name(x) for x in names['outputs']]
+
+  inputs = {k: tf.placeholder(dtype, shape, name=k)
+            for k, (dtype, shape) in six.iteritems(input_specs)}
+  templates = deserialize(description)
+  if description['single']:
+    templates = [templates]
+  outputs = [tf.convert_to_tensor(x)
+             for x in prettytensor.construct_all(templates, **inputs)]
+
+  tf.gfile.MakeDirs(cache_dir)
+  tf.train.export_meta_graph(filename=graph_file)
+  with tf.gfile.GFile(names_file, 'w') as f:
+    json.dump({'inputs': {k: v.name for k, v in six.iteritems(inputs)},
+               'outputs': [x.name for x in outputs]}, f)
+  return inputs, outputs
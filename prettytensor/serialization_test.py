@@ -0,0 +1,116 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for serializing templates."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from numpy import testing
+import tensorflow as tf
+
+import prettytensor
+from prettytensor import pretty_tensor_testing
+from prettytensor import serialization
+
+TOLERANCE = 0.000001
+
+
+def _model():
+  with prettytensor.defaults_scope(activation_fn=tf.nn.relu):
+    return (prettytensor.template('input').flatten()
+            .fully_connected(prettytensor.UnboundVariable('width', default=7))
+            .fully_connected(3, stddev=0.1)
+            .dropout(0.5, phase=prettytensor.Phase.test))
+
+
+class SerializationTest(pretty_tensor_testing.PtTestCase):
+
+  def setUp(self):
+    super(self.__class__, self).setUp()
+    self.input_data = numpy.array([[[1., 2.], [3., 4.]], [[5., 6.], [7., 8.]]])
+    self.input = tf.constant(self.input_data, dtype=tf.float32)
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(self.__class__, self).tearDown()
+
+  def testRoundTrip(self):
+    description = serialization.serialize(_model())
+    # The description only has JSON types.
+    description = json.loads(json.dumps(description))
+
+    template = serialization.deserialize(description, self.bookkeeper)
+    self.assertEqual(['input', 'width'], sorted(template.unbound_vars))
+    result = template.construct(input=self.input)
+    self.assertEqual([2, 3], result.shape)
+    self.assertEqual(serialization.description_hash(description),
+                     serialization.description_hash(
+                         serialization.serialize(template)))
+
+  def testMatchesOriginal(self):
+    with tf.variable_scope('original'):
+      original = _model().construct(input=self.input, width=5)
+    with tf.variable_scope('loaded'):
+      loaded = serialization.deserialize(
+          serialization.serialize(_model())).construct(input=self.input,
+                                                       width=5)
+    self.sess.run(tf.initialize_all_variables())
+    variables = tf.trainable_variables()
+    original_vars = [v for v in variables if v.name.startswith('original/')]
+    loaded_vars = [v for v in variables if v.name.startswith('loaded/')]
+    self.assertEqual(4, len(loaded_vars))
+    for original_var, loaded_var in zip(original_vars, loaded_vars):
+      self.sess.run(loaded_var.assign(original_var))
+    testing.assert_allclose(self.RunTensor(original, init=False),
+                            self.RunTensor(loaded, init=False),
+                            rtol=TOLERANCE)
+
+  def testScopesAndDefaults(self):
+    template = (prettytensor.template('input').with_name('head')
+                .with_defaults(activation_fn=tf.nn.tanh).flatten())
+    description = serialization.serialize(template)
+    loaded = serialization.deserialize(json.loads(json.dumps(description)))
+    self.assertEqual(description, serialization.serialize(loaded))
+
+  def testUnsupportedValues(self):
+    template = prettytensor.template('input').apply(lambda x: x)
+    with self.assertRaises(ValueError):
+      serialization.serialize(template)
+    template = prettytensor.template('input').bind(input=self.input)
+    with self.assertRaises(ValueError):
+      serialization.serialize(template)
+
+  def testConstructCached(self):
+    description = serialization.serialize(_model())
+    specs = {'input': (tf.float32, [2, 2, 2])}
+    with tf.Graph().as_default():
+      inputs, outputs = serialization.construct_cached(
+          description, specs, self.tmp_dir)
+      built = [op.name for op in tf.get_default_graph().get_operations()]
+    with tf.Graph().as_default():
+      cached_inputs, cached_outputs = serialization.construct_cached(
+          description, specs, self.tmp_dir)
+      imported = [op.name for op in tf.get_default_graph().get_operations()]
+    self.assertEqual(built, imported)
+    self.assertEqual(inputs['input'].name, cached_inputs['input'].name)
+    self.assertEqual([x.name for x in outputs],
+                     [x.name for x in cached_outputs])
+
+
+if __name__ == '__main__':
+  unittest.main()
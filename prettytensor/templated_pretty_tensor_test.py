@@ -13,6 +13,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import gc
 import unittest
 
 
@@ -89,6 +90,16 @@ class TemplatedPrettyTensorTest(pretty_tensor_testing.PtTestCase):
     out = self.RunTensor(template.construct(width=200))
     self.assertSequenceEqual([2, 200], out.shape)
 
+  def testShouldDefer(self):
+    input_pt = self.Wrap(self.input)
+    unbound_var = prettytensor.UnboundVariable('width')
+    should_defer = pretty_tensor_class._should_defer
+    self.assertFalse(should_defer(input_pt, (self.input, 1, 2.0, 'a', None),
+                                  {'x': [self.input, (3,)]}))
+    self.assertTrue(should_defer(input_pt, ([1, [unbound_var]],), {}))
+    self.assertTrue(should_defer(input_pt, (), {'x': {'y': unbound_var}}))
+    self.assertTrue(should_defer(self.Template(KEY), (), {}))
+
   def testMissingUnboundVariable(self):
     input_pt = self.Wrap(self.input)
     template = input_pt.flatten().fully_connected(prettytensor.UnboundVariable(
@@ -226,6 +237,65 @@ class TemplatedPrettyTensorTest(pretty_tensor_testing.PtTestCase):
     testing.assert_allclose(softmax1, softmax2, rtol=TOLERANCE)
     testing.assert_allclose(loss1, loss2, rtol=TOLERANCE)
 
+  def testConstructionCache(self):
+    template = (self.Template('input').flatten().fully_connected(10)
+                .enable_construction_cache())
+    graph = tf.get_default_graph()
+
+    first = template.construct(input=self.input)
+    ops = len(graph.get_operations())
+    second = template.as_fn('input')(self.input)
+    self.assertIs(first.tensor, second.tensor)
+    self.assertEqual(ops, len(graph.get_operations()))
+
+    # A different value or clearing the cache builds a new copy.
+    other = template.construct(input=tf.identity(self.input))
+    self.assertIsNot(first.tensor, other.tensor)
+    template.clear_construction_cache()
+    self.assertIsNot(first.tensor,
+                     template.construct(input=self.input).tensor)
+
+  def testConstructionCacheSharedTower(self):
+    tower = (self.Template('input').flatten().fully_connected(10)
+             .enable_construction_cache())
+    head1 = tower.fully_connected(5).construct(input=self.input)
+    head2 = tower.fully_connected(3).construct(input=self.input)
+    self.assertEqual([2, 5], head1.shape)
+    self.assertEqual([2, 3], head2.shape)
+    # The tower (and its flatten) is only built once.
+    reshapes = [op for op in tf.get_default_graph().get_operations()
+                if op.type == 'Reshape']
+    self.assertEqual(1, len(reshapes))
+
+  def testMergeIdenticalTemplates(self):
+    def _reshapes():
+      return len([op for op in tf.get_default_graph().get_operations()
+                  if op.type == 'Reshape'])
+
+    with prettytensor.merge_identical_templates() as report:
+      first = (self.Template('input').flatten().fully_connected(10)
+               .construct(input=self.input))
+      second = (self.Template('input').flatten().fully_connected(10)
+                .construct(input=self.input))
+
+    # The flatten is merged, but each fully_connected has its own variables.
+    self.assertEqual(1, report.merged_layers)
+    self.assertLess(0, report.ops_saved)
+    self.assertEqual(1, _reshapes())
+    self.assertIsNot(first.tensor, second.tensor)
+    self.assertEqual(4, len(tf.trainable_variables()))
+
+    self.Template('input').flatten().construct(input=self.input)
+    self.assertEqual(2, _reshapes())
+
+  def testMergeIdenticalTemplatesKeepsArgumentsAlive(self):
+    with prettytensor.merge_identical_templates() as report:
+      self.Template('input').apply(lambda x: x * 2).construct(input=self.input)
+      # A new function could otherwise get the id of the collected one.
+      gc.collect()
+      self.Template('input').apply(lambda x: x * 3).construct(input=self.input)
+    self.assertEqual(0, report.merged_layers)
+
   def testConstructAllWithConflictingValues(self):
     labels = numpy.array([[0., 1.], [1., 0.]], dtype=numpy.float32)
     template = self.Template('input').flatten().softmax_classifier(2, labels)